@@ -0,0 +1,330 @@
+import datetime
+import threading
+from collections import OrderedDict
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from config import Config
+from models import UserItem, Item, MarketPriceRollup
+
+DAYS_PER_YEAR = 365  # the Steam/CSFloat market trades every day
+
+
+class DailyCloseCache:
+    """
+    Daily close series per item from the 'day' rollups, up to yesterday.
+    Past days do not change once the day is over, so entries stay valid for
+    the whole day; today's price comes from the holdings themselves.
+    """
+
+    def __init__(self, max_items: int = 20000) -> None:
+        self.max_items = max(1, int(max_items))
+        self._day: datetime.date | None = None
+        self._series: OrderedDict[int, tuple[np.ndarray, np.ndarray]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, db: Session, item_ids, today: datetime.date) -> dict[int, tuple[np.ndarray, np.ndarray]]:
+        """item_id -> (day ordinals, closes), both sorted by day."""
+        with self._lock:
+            if self._day != today:
+                self._series.clear()
+                self._day = today
+            found = {}
+            for item_id in item_ids:
+                entry = self._series.get(item_id)
+                if entry is not None:
+                    self._series.move_to_end(item_id)
+                    found[item_id] = entry
+        missing = sorted(set(item_ids) - set(found))
+        if missing:
+            loaded = self._load(db, missing, today)
+            with self._lock:
+                if self._day == today:
+                    for item_id, entry in loaded.items():
+                        self._series[item_id] = entry
+                    while len(self._series) > self.max_items:
+                        self._series.popitem(last=False)
+            found.update(loaded)
+        return found
+
+    def _load(self, db: Session, item_ids: list[int], today: datetime.date, chunk_size: int = 500):
+        today_start = datetime.datetime.combine(today, datetime.time.min)
+        rows_by_item: dict[int, tuple[list, list]] = {item_id: ([], []) for item_id in item_ids}
+        for start in range(0, len(item_ids), chunk_size):
+            # Plain Core select in index order, no ORM row objects
+            rows = db.execute(
+                select(
+                    MarketPriceRollup.item_id,
+                    MarketPriceRollup.bucket_start,
+                    MarketPriceRollup.close_price,
+                )
+                .where(
+                    MarketPriceRollup.item_id.in_(item_ids[start:start + chunk_size]),
+                    MarketPriceRollup.resolution == "day",
+                    MarketPriceRollup.bucket_start < today_start,
+                )
+                .order_by(MarketPriceRollup.item_id, MarketPriceRollup.bucket_start)
+            )
+            for item_id, day, close in rows:
+                if close is None:
+                    continue
+                ordinals, closes = rows_by_item[item_id]
+                ordinals.append(day.toordinal())
+                closes.append(float(close))
+
+        out = {}
+        for item_id, (ordinals, closes) in rows_by_item.items():
+            ordinals = np.asarray(ordinals, dtype=np.int64)
+            closes = np.asarray(closes, dtype=np.float64)
+            days, inverse = np.unique(ordinals, return_inverse=True)
+            if len(days) < len(ordinals):
+                # Several markets have a bucket for the same day: average them
+                closes = np.bincount(inverse, weights=closes) / np.bincount(inverse)
+            out[item_id] = (days, closes)
+        return out
+
+
+def warm_daily_closes(db: Session) -> int:
+    """Loads today's series of every held item, so the first /analytics call is warm too."""
+    item_ids = [item_id for (item_id,) in db.query(UserItem.item_id).distinct().all()]
+    _daily_cache.get_many(db, item_ids, datetime.date.today())
+    return len(item_ids)
+
+
+def _fill_gaps(prices: np.ndarray, fallback: np.ndarray) -> np.ndarray:
+    """Forward-fills NaNs along days; leading NaNs take the first known price (or fallback)."""
+    n_rows, n_days = prices.shape
+    valid = ~np.isnan(prices)
+    idx = np.where(valid, np.arange(n_days), 0)
+    np.maximum.accumulate(idx, axis=1, out=idx)
+    filled = prices[np.arange(n_rows)[:, None], idx]
+
+    has_any = valid.any(axis=1)
+    first = np.where(has_any, prices[np.arange(n_rows), valid.argmax(axis=1)], fallback)
+    leading = np.isnan(filled)
+    return np.where(leading, first[:, None], filled)
+
+
+def _xirr(times_years: np.ndarray, flows: np.ndarray) -> float | None:
+    """Annualized money-weighted return: rate r with sum(flow * (1 + r) ** -t) == 0."""
+    if not (flows < 0).any() or not (flows > 0).any():
+        return None
+
+    def npv(rate):
+        return float(np.sum(flows * np.power(1.0 + rate, -times_years)))
+
+    rate = 0.1
+    for _ in range(50):
+        disc = np.power(1.0 + rate, -times_years)
+        value = float(np.sum(flows * disc))
+        deriv = float(np.sum(-times_years * flows * disc / (1.0 + rate)))
+        if deriv == 0:
+            break
+        step = value / deriv
+        rate -= step
+        if rate <= -0.999999:
+            break
+        if abs(step) < 1e-10:
+            return rate
+
+    # Newton did not converge: bisection over a wide bracket
+    lo, hi = -0.999999, 1.0
+    while npv(hi) > 0 and hi < 1e6:
+        hi *= 10
+    if npv(lo) * npv(hi) > 0:
+        return None
+    for _ in range(200):
+        mid = (lo + hi) / 2
+        if npv(lo) * npv(mid) <= 0:
+            hi = mid
+        else:
+            lo = mid
+        if hi - lo < 1e-10:
+            break
+    return (lo + hi) / 2
+
+
+def _round(value, digits: int = 6):
+    if value is None or not np.isfinite(value):
+        return None
+    return round(float(value), digits)
+
+
+def compute_portfolio_analytics(
+    db: Session,
+    user_id: int,
+    window: datetime.timedelta | None = None,
+    top: int = 10,
+    today: datetime.date | None = None,
+) -> dict | None:
+    """
+    Return and risk figures of the current holdings over the window (None =
+    since the first buy). Every USERITEM row is held from its buy_date;
+    today's prices are the holdings' current prices. Returns None for an
+    empty portfolio.
+    """
+    today = today or datetime.date.today()
+    holdings = (
+        db.query(
+            UserItem.item_id,
+            UserItem.amount,
+            UserItem.buy_price,
+            UserItem.current_price,
+            UserItem.buy_date,
+            Item.name,
+        )
+        .join(Item, Item.item_id == UserItem.item_id)
+        .filter(UserItem.user_id == user_id)
+        .all()
+    )
+    if not holdings:
+        return None
+
+    item_ids = sorted({h.item_id for h in holdings})
+    item_pos = {item_id: i for i, item_id in enumerate(item_ids)}
+    names = {h.item_id: h.name for h in holdings}
+    row_item = np.fromiter((item_pos[h.item_id] for h in holdings), dtype=np.int64, count=len(holdings))
+    amount = np.fromiter((h.amount or 1 for h in holdings), dtype=np.float64, count=len(holdings))
+    buy_price = np.fromiter((float(h.buy_price or 0) for h in holdings), dtype=np.float64, count=len(holdings))
+    current_price = np.fromiter((float(h.current_price or 0) for h in holdings), dtype=np.float64, count=len(holdings))
+    buy_ord = np.fromiter(
+        ((h.buy_date or today).toordinal() for h in holdings), dtype=np.int64, count=len(holdings)
+    )
+
+    today_ord = today.toordinal()
+    first_buy = int(buy_ord.min())
+    start_ord = first_buy if window is None else max(first_buy, today_ord - max(1, window.days))
+    start_ord = min(start_ord, today_ord - 1)
+    n_days = today_ord - start_ord + 1
+
+    # Item x day close matrix; the last column is today
+    item_current = np.zeros(len(item_ids))
+    item_current[row_item] = current_price
+    series = _daily_cache.get_many(db, item_ids, today)
+    item_prices = np.full((len(item_ids), n_days), np.nan)
+    has_history = np.zeros(len(item_ids), dtype=bool)
+    for item_id, (ordinals, closes) in series.items():
+        if not len(ordinals):
+            continue
+        has_history[item_pos[item_id]] = True
+        pos = ordinals - start_ord
+        inside = (pos >= 0) & (pos < n_days - 1)
+        item_prices[item_pos[item_id], pos[inside]] = closes[inside]
+        if not inside.all() and (pos < 0).any():
+            # Last close before the window seeds the forward fill
+            before = np.flatnonzero(pos < 0)[-1]
+            if np.isnan(item_prices[item_pos[item_id], 0]):
+                item_prices[item_pos[item_id], 0] = closes[before]
+    item_prices[:, -1] = np.nan
+    item_prices = _fill_gaps(item_prices, item_current)
+
+    # Row-level prices/holdings: a row counts from its buy date on
+    prices = item_prices[row_item]
+    # Rows without any price history (cash, new items) keep their own price
+    no_history = ~has_history[row_item]
+    prices[no_history] = current_price[no_history, None]
+    prices[:, -1] = current_price
+    held_from = np.clip(buy_ord - start_ord, 0, None)
+    holding = (np.arange(n_days)[None, :] >= held_from[:, None]) * amount[:, None]
+    values = holding * prices
+    portfolio_value = values.sum(axis=0)
+
+    # Time-weighted: new positions enter at market value, so flows do not count as return
+    new_money = (np.diff(holding, axis=1) * prices[:, 1:]).sum(axis=0)
+    prev_value = portfolio_value[:-1]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        daily_returns = np.where(prev_value > 0, (portfolio_value[1:] - new_money) / prev_value - 1.0, 0.0)
+    growth = np.cumprod(1.0 + daily_returns)
+    twr = float(growth[-1] - 1.0) if len(growth) else 0.0
+    period_years = (n_days - 1) / DAYS_PER_YEAR
+    twr_annualized = (1.0 + twr) ** (1.0 / period_years) - 1.0 if period_years >= 1 and twr > -1 else None
+
+    active = prev_value > 0
+    vol_daily = float(np.std(daily_returns[active], ddof=1)) if active.sum() > 1 else None
+    vol_annual = vol_daily * np.sqrt(DAYS_PER_YEAR) if vol_daily is not None else None
+
+    wealth = np.concatenate(([1.0], growth))
+    peaks = np.maximum.accumulate(wealth)
+    drawdowns = wealth / peaks - 1.0
+    trough = int(drawdowns.argmin())
+    peak = int(wealth[:trough + 1].argmax())
+
+    # Money-weighted: value at window start + actual buys inside the window, value today
+    times = []
+    flows = []
+    start_value = float(values[buy_ord < start_ord, 0].sum())
+    if start_value > 0:
+        times.append(0.0)
+        flows.append(-start_value)
+    in_window = buy_ord >= start_ord
+    times.extend(((buy_ord[in_window] - start_ord) / DAYS_PER_YEAR).tolist())
+    flows.extend((-(buy_price[in_window] * amount[in_window])).tolist())
+    times.append((n_days - 1) / DAYS_PER_YEAR)
+    flows.append(float(portfolio_value[-1]))
+    mwr_annualized = _xirr(np.asarray(times), np.asarray(flows)) if n_days > 1 else None
+    # Over less than a year the annualized rate is just noise; report the period rate
+    mwr = (1.0 + mwr_annualized) ** period_years - 1.0 if mwr_annualized is not None else None
+    if period_years < 1:
+        mwr_annualized = None
+
+    # Per-item figures (rows of the same item summed)
+    n_items = len(item_ids)
+    item_value = np.bincount(row_item, weights=values[:, -1], minlength=n_items)
+    item_invested = np.bincount(row_item, weights=buy_price * amount, minlength=n_items)
+    row_weights = np.zeros_like(values[:, :-1])
+    np.divide(values[:, :-1], prev_value[None, :], out=row_weights, where=prev_value[None, :] > 0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        row_returns = np.where(prices[:, :-1] > 0, prices[:, 1:] / prices[:, :-1] - 1.0, 0.0)
+    row_contrib = (row_weights * row_returns).sum(axis=1)
+    item_contrib = np.bincount(row_item, weights=row_contrib, minlength=n_items)
+
+    top = max(1, int(top))
+    by_contrib = np.argsort(-np.abs(item_contrib))[:top]
+    contributions = [
+        {
+            "item_id": item_ids[i],
+            "name": names[item_ids[i]],
+            "value": _round(item_value[i], 2),
+            "invested": _round(item_invested[i], 2),
+            "profit": _round(item_value[i] - item_invested[i], 2),
+            "return_contribution": _round(item_contrib[i]),
+        }
+        for i in by_contrib
+    ]
+
+    # Correlation of daily price returns between the largest positions
+    by_value = [i for i in np.argsort(-item_value)[:top] if item_value[i] > 0]
+    correlation = {"items": [], "matrix": []}
+    if len(by_value) > 1 and n_days > 2:
+        sel = item_prices[by_value]
+        sel[:, -1] = item_current[by_value]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            rets = np.where(sel[:, :-1] > 0, sel[:, 1:] / sel[:, :-1] - 1.0, 0.0)
+            matrix = np.corrcoef(rets)
+        correlation = {
+            "items": [{"item_id": item_ids[i], "name": names[item_ids[i]]} for i in by_value],
+            "matrix": [[_round(v, 4) for v in row] for row in np.atleast_2d(matrix)],
+        }
+
+    return {
+        "user_id": user_id,
+        "start": datetime.date.fromordinal(start_ord).isoformat(),
+        "end": today.isoformat(),
+        "days": n_days,
+        "positions": len(holdings),
+        "value": _round(portfolio_value[-1], 2),
+        "time_weighted_return": _round(twr),
+        "time_weighted_return_annualized": _round(twr_annualized),
+        "money_weighted_return": _round(mwr),
+        "money_weighted_return_annualized": _round(mwr_annualized),
+        "volatility_daily": _round(vol_daily),
+        "volatility_annualized": _round(vol_annual),
+        "max_drawdown": _round(float(drawdowns[trough])),
+        "max_drawdown_peak": datetime.date.fromordinal(start_ord + peak).isoformat(),
+        "max_drawdown_trough": datetime.date.fromordinal(start_ord + trough).isoformat(),
+        "contributions": contributions,
+        "correlation": correlation,
+    }
+
+
+_daily_cache = DailyCloseCache(Config().ANALYTICS_SERIES_CACHE_ITEMS)
@@ -0,0 +1,118 @@
+"""
+/analytics/{user_id} on a synthetic portfolio: --items holdings, each with a
+year of daily rollups. Reports the cold call (daily closes loaded from the
+DB) and warm calls (series cached for the day), p50/p95 in ms.
+
+Usage (from csinvest-backend/):
+  python benchmarks/analytics_benchmark.py                      # temporary SQLite file
+  python benchmarks/analytics_benchmark.py --database-url postgresql://...  # throwaway DB!
+
+An empty database is filled with synthetic users, items and rollups, so
+never point it at a real database.
+"""
+import argparse
+import datetime
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", default=None)
+    parser.add_argument("--items", type=int, default=1000)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--repeat", type=int, default=20)
+    return parser.parse_args()
+
+
+def _setup_env(args):
+    if not args.database_url:
+        path = os.path.join(tempfile.mkdtemp(prefix="csinvest-bench-"), "bench.db")
+        args.database_url = f"sqlite:///{path}"
+    os.environ["DATABASE_URL"] = args.database_url
+    os.environ.setdefault("SECRET_KEY", "benchmark")
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _seed(db, items: int, days: int) -> int:
+    from models import User, Item, UserItem, Market, MarketPriceRollup
+    user = db.query(User).filter(User.username == "bench").first()
+    if user:
+        return user.user_id
+
+    rnd = random.Random(11)
+    user = User(username="bench", email="bench@example.com", password_hash="x")
+    db.add(user)
+    db.add(Market(market_id=1, name="Bench market"))
+    db.commit()
+
+    today = datetime.date.today()
+    item_rows, holding_rows, rollup_rows = [], [], []
+    for i in range(items):
+        item_id = i + 1
+        price = rnd.uniform(0.5, 500)
+        drift = rnd.gauss(0.0002, 0.0005)
+        vol = rnd.uniform(0.005, 0.04)
+        for d in range(days, 0, -1):
+            price = max(0.03, price * (1 + drift + rnd.gauss(0, vol)))
+            day = datetime.datetime.combine(today - datetime.timedelta(days=d), datetime.time.min)
+            rollup_rows.append({
+                "market_id": 1, "item_id": item_id, "resolution": "day", "bucket_start": day,
+                "open_price": round(price, 2), "high_price": round(price, 2), "low_price": round(price, 2),
+                "close_price": round(price, 2), "first_timestamp": day, "last_timestamp": day, "sample_count": 1,
+            })
+        item_rows.append({"item_id": item_id, "name": f"Bench item {item_id}", "item_type": "skin",
+                          "slug": f"bench-{item_id}", "current_price": round(price, 2)})
+        holding_rows.append({
+            "user_id": user.user_id, "item_id": item_id, "amount": rnd.randint(1, 5),
+            "buy_price": round(price * rnd.uniform(0.7, 1.3), 2), "current_price": round(price, 2),
+            "buy_date": today - datetime.timedelta(days=rnd.randint(0, days)),
+        })
+    db.bulk_insert_mappings(Item, item_rows)
+    db.bulk_insert_mappings(UserItem, holding_rows)
+    for start in range(0, len(rollup_rows), 20000):
+        db.bulk_insert_mappings(MarketPriceRollup, rollup_rows[start:start + 20000])
+    db.commit()
+    return user.user_id
+
+
+def main():
+    args = _parse_args()
+    _setup_env(args)
+
+    from database import Base, SessionLocal, engine
+    from models import User, Item, UserItem, Market, MarketPriceRollup
+    from analytics import compute_portfolio_analytics
+
+    Base.metadata.create_all(engine, tables=[
+        User.__table__, Item.__table__, UserItem.__table__, Market.__table__, MarketPriceRollup.__table__,
+    ])
+    db = SessionLocal()
+    user_id = _seed(db, args.items, args.days)
+    window = datetime.timedelta(days=args.days)
+
+    started = time.perf_counter()
+    result = compute_portfolio_analytics(db, user_id, window=window)
+    cold = (time.perf_counter() - started) * 1000
+
+    samples = []
+    for _ in range(args.repeat):
+        started = time.perf_counter()
+        compute_portfolio_analytics(db, user_id, window=window)
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+
+    print(f"{engine.dialect.name}: {result['positions']} positions x {result['days']} days")
+    print(f"TWR {result['time_weighted_return']}, MWR {result['money_weighted_return']}, "
+          f"vol {result['volatility_annualized']}, max DD {result['max_drawdown']}")
+    print(f"cold (series loaded): {cold:.1f} ms")
+    print(f"warm (series cached): p50 {statistics.median(samples):.1f} ms  p95 {samples[int(len(samples) * 0.95) - 1]:.1f} ms")
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+/cases/{slug} contents: the old three get_case_items_by_types queries plus
+rarity reclassification in Python vs. one CASEMEMBERSHIP lookup. Timed over
+every case in the database, p50/p99 in ms.
+
+Usage (from csinvest-backend/):
+  python benchmarks/case_detail_benchmark.py                      # temporary SQLite file
+  python benchmarks/case_detail_benchmark.py --database-url postgresql://...  # throwaway DB!
+
+A database without cases is filled with --cases synthetic cases, so never
+point it at a real database.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", default=None)
+    parser.add_argument("--cases", type=int, default=300)
+    parser.add_argument("--rounds", type=int, default=3)
+    return parser.parse_args()
+
+
+def _setup_env(args):
+    if not args.database_url:
+        path = os.path.join(tempfile.mkdtemp(prefix="csinvest-bench-"), "bench.db")
+        args.database_url = f"sqlite:///{path}"
+    os.environ["DATABASE_URL"] = args.database_url
+    os.environ.setdefault("SECRET_KEY", "benchmark")
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _seed(db, cases: int):
+    from models import Item
+    if db.query(Item).filter(Item.item_type == "case").count():
+        return
+    rnd = random.Random(7)
+    rows = []
+    next_id = 1
+    for c in range(cases):
+        case_id = next_id
+        next_id += 1
+        rows.append({"item_id": case_id, "name": f"Bench Case {c}", "item_type": "case", "slug": f"bench-case-{c}"})
+        members = (
+            [("skin", rnd.choice(["Mil-Spec", "Restricted", "Classified", "Covert"])) for _ in range(17)]
+            + [("skin", rnd.choice(["knife", "knife/glove"])) for _ in range(5)]
+            + [("knife", "Covert") for _ in range(20)]
+            + [("glove", "Extraordinary") for _ in range(10)]
+        )
+        for item_type, rarity in members:
+            rows.append({
+                "item_id": next_id,
+                "name": f"Bench {item_type} {next_id}",
+                "item_type": item_type,
+                "rarity": rarity,
+                "case_id": case_id,
+                "slug": f"bench-{next_id}",
+            })
+            next_id += 1
+    for start in range(0, len(rows), 5000):
+        db.bulk_insert_mappings(Item, rows[start:start + 5000])
+    db.commit()
+
+
+def _legacy_case_contents(repo, case_id: int) -> dict:
+    from repository import classify_case_items
+    skins = repo.get_case_items_by_types(case_id, ["skin"])
+    knives = repo.get_case_items_by_types(case_id, ["knife"])
+    gloves = repo.get_case_items_by_types(case_id, ["glove"])
+    return classify_case_items(skins + knives + gloves)
+
+
+def _measure(fn, case_ids: list[int], rounds: int) -> dict:
+    samples = []
+    for _ in range(rounds):
+        for case_id in case_ids:
+            started = time.perf_counter()
+            fn(case_id)
+            samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return {
+        "p50": statistics.median(samples),
+        "p99": samples[max(0, int(len(samples) * 0.99) - 1)],
+    }
+
+
+def main():
+    args = _parse_args()
+    _setup_env(args)
+
+    from database import Base, SessionLocal, engine
+    from models import Item, CaseMembership
+    from repository import ItemRepository
+
+    Base.metadata.create_all(engine, tables=[Item.__table__, CaseMembership.__table__])
+    db = SessionLocal()
+    _seed(db, args.cases)
+    repo = ItemRepository(db)
+
+    started = time.perf_counter()
+    rows = repo.rebuild_case_membership()
+    print(f"{engine.dialect.name}: CASEMEMBERSHIP rebuild {rows} rows in {(time.perf_counter() - started) * 1000:.0f} ms")
+
+    case_ids = [cid for (cid,) in db.query(Item.item_id).filter(Item.item_type == "case").all()]
+    # Same buckets from both paths before timing anything
+    for case_id in case_ids[:20]:
+        old = _legacy_case_contents(repo, case_id)
+        new = repo.get_case_contents(case_id)
+        assert all([i.item_id for i in old[b]] == [i.item_id for i in new[b]] for b in old), case_id
+        db.expunge_all()
+
+    def legacy(case_id):
+        _legacy_case_contents(repo, case_id)
+        db.expunge_all()
+
+    def membership(case_id):
+        repo.get_case_contents(case_id)
+        db.expunge_all()
+
+    before = _measure(legacy, case_ids, args.rounds)
+    after = _measure(membership, case_ids, args.rounds)
+    print(f"{len(case_ids)} cases x {args.rounds} rounds")
+    print(f"before (3 queries + reclassify): p50 {before['p50']:.3f} ms  p99 {before['p99']:.3f} ms")
+    print(f"after  (CASEMEMBERSHIP lookup):  p50 {after['p50']:.3f} ms  p99 {after['p99']:.3f} ms")
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Load-tests the MarketRegistry fan-out offline with FakeMarketStrategy
+markets (no network, no database):
+
+  no hedge   - every market gets a single request, slow tails hit p95
+  hedged     - a second request after --hedge-ms, the first answer wins
+  min=N      - returns once N markets answered (--min-results)
+
+Usage (from csinvest-backend/):
+  python benchmarks/market_fanout_benchmark.py
+  python benchmarks/market_fanout_benchmark.py --markets 5 --latency-ms 80 --concurrency 50
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--markets", type=int, default=3)
+    parser.add_argument("--latency-ms", type=float, default=100.0)
+    parser.add_argument("--tail-probability", type=float, default=0.05)
+    parser.add_argument("--failure-rate", type=float, default=0.02)
+    parser.add_argument("--timeout-ms", type=float, default=2000.0)
+    parser.add_argument("--hedge-ms", type=float, default=250.0)
+    parser.add_argument("--min-results", type=int, default=2)
+    parser.add_argument("--items", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=20)
+    return parser.parse_args()
+
+
+def _setup_env():
+    os.environ.setdefault("SECRET_KEY", "benchmark")
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _build_registry(args, hedge_seconds: float, min_results: int):
+    from market_registry import FakeMarketStrategy, MarketRegistry, RegisteredMarket
+    registry = MarketRegistry(min_results=min_results)
+    for i in range(args.markets):
+        registry.register(RegisteredMarket(
+            100 + i,
+            f"Fake {i}",
+            FakeMarketStrategy(
+                latency_ms=args.latency_ms,
+                tail_probability=args.tail_probability,
+                failure_rate=args.failure_rate,
+                price_factor=1.0 + i * 0.05,
+                seed=i,
+            ),
+            timeout_seconds=args.timeout_ms / 1000.0,
+            hedge_after_seconds=hedge_seconds,
+        ))
+    return registry
+
+
+async def _run(registry, args) -> dict:
+    semaphore = asyncio.Semaphore(args.concurrency)
+    samples, answered = [], []
+
+    async def one(i: int):
+        query = {"market_name": f"Benchmark Item {i}", "phase": None, "min_float": None, "max_float": None}
+        async with semaphore:
+            started = time.perf_counter()
+            results = await registry.fetch(query)
+            samples.append((time.perf_counter() - started) * 1000)
+            answered.append(len(results))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(args.items)))
+    elapsed = time.perf_counter() - started
+    samples.sort()
+    calls = sum(m.strategy.calls for m in registry.markets)
+    return {
+        "p50": statistics.median(samples),
+        "p95": samples[int(len(samples) * 0.95) - 1],
+        "max": samples[-1],
+        "answered": statistics.mean(answered),
+        "calls": calls / args.items,
+        "items_per_s": args.items / elapsed,
+    }
+
+
+def main():
+    args = _parse_args()
+    _setup_env()
+    scenarios = [
+        ("no hedge", 0.0, 0),
+        ("hedged", args.hedge_ms / 1000.0, 0),
+        (f"hedged, min={args.min_results}", args.hedge_ms / 1000.0, args.min_results),
+    ]
+    print(
+        f"{args.items} items x {args.markets} fake markets, latency ~{args.latency_ms:.0f} ms, "
+        f"tail {args.tail_probability:.0%}, failures {args.failure_rate:.0%}, concurrency {args.concurrency}"
+    )
+    print(f"{'scenario':<20}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}{'markets':>10}{'calls/item':>12}{'items/s':>10}")
+    for name, hedge_seconds, min_results in scenarios:
+        registry = _build_registry(args, hedge_seconds, min_results)
+        stats = asyncio.run(_run(registry, args))
+        print(
+            f"{name:<20}{stats['p50']:>10.1f}{stats['p95']:>10.1f}{stats['max']:>10.1f}"
+            f"{stats['answered']:>10.2f}{stats['calls']:>12.2f}{stats['items_per_s']:>10.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Compares the two /search backends on a synthetic catalog:
+
+  memory - search_index.CatalogSearchIndex (SEARCH_BACKEND=memory)
+  db     - ItemRepository.search_items (SEARCH_BACKEND=db; pg_trgm on Postgres,
+           LIKE + Python dedupe elsewhere)
+
+Usage (from csinvest-backend/):
+  python benchmarks/search_benchmark.py                      # temporary SQLite file
+  python benchmarks/search_benchmark.py --database-url postgresql://...  # throwaway DB!
+
+The ITEM table of the target database is filled with --items synthetic rows
+when it has fewer rows than that, so never point it at a real database.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+QUERIES = ["ak", "ak47", "ak-47 red", "tec 9", "tec9 white", "m4a1s", "karambit doppler", "glove", "case", "zzz"]
+WEAPONS = ["AK-47", "M4A1-S", "M4A4", "AWP", "Tec-9", "Glock-18", "USP-S", "Desert Eagle", "P250", "MP9"]
+KNIVES = ["★ Karambit", "★ Butterfly Knife", "★ Bayonet", "★ Skeleton Knife"]
+GLOVES = ["★ Sport Gloves", "★ Driver Gloves", "★ Specialist Gloves"]
+FINISHES = ["Redline", "Whiteout", "Doppler", "Fade", "Asiimov", "Vice", "Hyper Beast", "Slaughter", "Case Hardened", "Neo-Noir"]
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", default=None)
+    parser.add_argument("--items", type=int, default=50_000)
+    parser.add_argument("--repeat", type=int, default=50)
+    return parser.parse_args()
+
+
+def _setup_env(args):
+    if not args.database_url:
+        path = os.path.join(tempfile.mkdtemp(prefix="csinvest-bench-"), "bench.db")
+        args.database_url = f"sqlite:///{path}"
+    os.environ["DATABASE_URL"] = args.database_url
+    os.environ.setdefault("SECRET_KEY", "benchmark")
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _seed(db, count: int):
+    from models import Item
+    existing = db.query(Item).count()
+    if existing >= count:
+        return existing
+    rnd = random.Random(42)
+    rows = []
+    for i in range(existing, count):
+        kind = rnd.random()
+        if kind < 0.8:
+            base, item_type = rnd.choice(WEAPONS), "skin"
+        elif kind < 0.9:
+            base, item_type = rnd.choice(KNIVES), "knife"
+        elif kind < 0.97:
+            base, item_type = rnd.choice(GLOVES), "glove"
+        else:
+            base, item_type = f"Operation {rnd.randint(1, 400)}", "case"
+        name = f"{base} | {rnd.choice(FINISHES)} {i // 3}" if item_type != "case" else f"{base} Case"
+        rows.append({"item_id": i + 1, "name": name, "item_type": item_type, "slug": f"bench-{i + 1}"})
+    for start in range(0, len(rows), 5000):
+        db.bulk_insert_mappings(Item, rows[start:start + 5000])
+    db.commit()
+    return count
+
+
+def _time(fn, repeat: int) -> dict:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return {"p50": statistics.median(samples), "p95": samples[int(len(samples) * 0.95) - 1]}
+
+
+def main():
+    args = _parse_args()
+    _setup_env(args)
+
+    from config import Config
+    from database import Base, SessionLocal, engine
+    from models import Item
+    from repository import ItemRepository, ensure_pg_search_schema
+    from search_index import CatalogSearchIndex
+
+    Base.metadata.create_all(engine, tables=[Item.__table__])
+    trigram = ensure_pg_search_schema(engine)
+    db = SessionLocal()
+    total = _seed(db, args.items)
+    print(f"{engine.dialect.name}: {total} items (trigram index: {'yes' if trigram else 'no'})")
+
+    index = CatalogSearchIndex()
+    started = time.perf_counter()
+    index.rebuild(db)
+    print(f"memory index build: {(time.perf_counter() - started) * 1000:.0f} ms")
+
+    cfg = Config()
+    cfg.SEARCH_BACKEND = "db"
+    repo = ItemRepository(db)
+
+    def cold_search(query):
+        index._results.clear()
+        return index.search(query, limit=10)
+
+    print(f"{'query':<20}{'memory cold p50/p95':>22}{'memory warm p50/p95':>22}{'db p50/p95 (ms)':>22}")
+    for query in QUERIES:
+        cold = _time(lambda: cold_search(query), args.repeat)
+        warm = _time(lambda: index.search(query, limit=10), args.repeat)
+        sql = _time(lambda: repo.search_items(query, limit=10), max(1, args.repeat // 5))
+        print(
+            f"{query:<20}{cold['p50']:>11.3f}/{cold['p95']:<10.3f}"
+            f"{warm['p50']:>11.3f}/{warm['p95']:<10.3f}{sql['p50']:>11.3f}/{sql['p95']:<10.3f}"
+        )
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
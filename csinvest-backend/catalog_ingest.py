@@ -0,0 +1,215 @@
+import datetime
+import json
+import time
+from typing import Iterable, Iterator
+import requests
+from sqlalchemy.orm import Session
+from config import Config
+from fetch_engine import PriceFetchEngine, pool_for_api_key
+from market_name import catalog_name, item_query
+from market_registry import CSFLOAT_MARKET_ID
+from models import Item
+from price_cache import get_market_strategy
+from price_factory import PriceFactory
+from repository import ItemRepository
+from strategy import _CSFloatBase, retry_after_seconds
+
+
+class CSFloatListingPager(_CSFloatBase):
+    """
+    Pages through broad CSFloat listing queries (buy-now listings sorted by
+    price, one query per def_index) instead of asking for one item at a
+    time. Requests share the server API key pool: a 429 parks the key for
+    Retry-After and the page is retried with the next free key.
+
+    A def_index is paged until its listings run out; one that still has
+    listings after max_pages (or failed) ends up in `incomplete`.
+    """
+
+    PAGE_SIZE = 50
+    MAX_ATTEMPTS = 3
+
+    def __init__(self, max_pages: int, config: Config | None = None) -> None:
+        super().__init__(config)
+        self.max_pages = max(1, int(max_pages))
+        self.requests_made = 0
+        self.incomplete: set[int] = set()
+
+    def _get_page(self, params: dict) -> dict | None:
+        pool = pool_for_api_key(None, self.config)
+        for attempt in range(self.MAX_ATTEMPTS):
+            api_key, wait = pool.reserve()
+            if wait > 0:
+                time.sleep(wait)
+            self.requests_made += 1
+            try:
+                response = requests.get(self.BASE_URL, params=params, headers=self._headers(api_key or ""), timeout=15)
+            except Exception as e:
+                print(f"[CatalogIngest] Chyba spojení: {e}")
+                continue
+            if response.status_code == 429:
+                retry_after = retry_after_seconds(response)
+                print(f"[CatalogIngest] API Rate Limited (429), klíč pozastaven na {retry_after:.0f}s. Pokus {attempt + 1}/{self.MAX_ATTEMPTS}.")
+                pool.penalize(api_key, retry_after)
+                continue
+            if response.status_code != 200:
+                print(f"[CatalogIngest] Chyba API: {response.status_code} {response.text[:200]}")
+                return None
+            try:
+                data = response.json()
+            except json.JSONDecodeError:
+                print("[CatalogIngest] API vrátilo neplatný JSON.")
+                return None
+            return {"data": data} if isinstance(data, list) else data
+        return None
+
+    def iter_pages(self, def_index: int) -> Iterator[list[dict]]:
+        """Listing pages of one def_index, cheapest first, until the data runs out."""
+        cursor = None
+        for page in range(self.max_pages):
+            params = {
+                "def_index": def_index,
+                "sort_by": "lowest_price",
+                "type": "buy_now",
+                "limit": self.PAGE_SIZE,
+            }
+            # Newer API responses carry a cursor, older ones are paged by number
+            if cursor:
+                params["cursor"] = cursor
+            else:
+                params["page"] = page
+            data = self._get_page(params)
+            if not data:
+                self.incomplete.add(def_index)
+                return
+            listings = data.get("data") or []
+            if listings:
+                yield listings
+            cursor = data.get("cursor")
+            if len(listings) < self.PAGE_SIZE:
+                return
+        self.incomplete.add(def_index)
+
+    def iter_listings(self, def_indexes: Iterable[int]) -> Iterator[dict]:
+        for def_index in def_indexes:
+            for listings in self.iter_pages(def_index):
+                yield from listings
+
+
+def reduce_min_prices(listings: Iterable[dict]) -> dict[str, int]:
+    """
+    One pass over the listings -> lowest price in cents per catalog name.
+    Listing names are reduced to ITEM.name (no wear, no ★, see
+    catalog_name), so every wear of a skin counts towards its catalog price.
+    Phased items are also counted under "<name> <phase>", the name Doppler
+    variants have in the catalog.
+    """
+    lowest: dict[str, int] = {}
+    for listing in listings:
+        if listing.get("type") == "auction":
+            continue
+        price = listing.get("price")
+        item = listing.get("item") or {}
+        name = item.get("market_hash_name")
+        if name:
+            name = catalog_name(name)
+        if not name or not isinstance(price, (int, float)) or price <= 0:
+            continue
+        names = (name, f"{name} {item['phase']}") if item.get("phase") else (name,)
+        for key in names:
+            current = lowest.get(key)
+            if current is None or price < current:
+                lowest[key] = int(price)
+    return lowest
+
+
+class CatalogIngest:
+    """
+    Catalog price refresh from listing snapshots. The requested item types
+    decide which def_indexes are paged (a case refresh pages only case
+    listings); the listings are streamed into reduce_min_prices and the
+    matching ITEM rows get their new price and a MARKETPRICE row in bulk
+    (PriceWriteBatch, chunked executemany). The cost is the number of pages,
+    not the number of items.
+
+    Items the snapshot does not price (no def_index, their def_index hit
+    max_pages / failed, or no listing name matched) are fetched one by one
+    through PriceFetchEngine; the run log counts each case.
+    """
+
+    def __init__(self, db: Session, pager: CSFloatListingPager, item_types: list[str], chunk_size: int = 500) -> None:
+        self.db = db
+        self.repo = ItemRepository(db)
+        self.pager = pager
+        self.item_types = list(item_types)
+        self.factory = PriceFactory()
+        self.chunk_size = max(1, int(chunk_size))
+
+    def _catalog(self, item_type: str | None) -> list:
+        q = self.db.query(Item.item_id, Item.name, Item.item_type, Item.def_index)
+        if item_type:
+            q = q.filter(Item.item_type == item_type)
+        elif self.item_types:
+            q = q.filter(Item.item_type.in_(self.item_types))
+        return q.all()
+
+    def _fetch_uncovered(self, items: list) -> dict[int, float]:
+        prices = {}
+        if not items:
+            return prices
+        print(f"[CatalogIngest] {len(items)} itemů mimo snapshot, dotazuji jednotlivě")
+        engine = PriceFetchEngine(get_market_strategy(), self.pager.config)
+        for index, raw in engine.fetch_iter([item_query(itm) for itm in items]):
+            clean = self.factory.create_price(raw, items[index].item_id, market_id=CSFLOAT_MARKET_ID)
+            if clean:
+                prices[items[index].item_id] = clean["price"]
+        return prices
+
+    def run(self, item_type: str | None = None, progress=None) -> list[dict]:
+        started = time.monotonic()
+        catalog = self._catalog(item_type)
+        def_indexes = sorted({itm.def_index for itm in catalog if itm.def_index is not None})
+        lowest = reduce_min_prices(self.pager.iter_listings(def_indexes))
+
+        prices = {itm.item_id: round(lowest[itm.name] / 100.0, 2) for itm in catalog if itm.name in lowest}
+        # Everything the snapshot did not price falls through to per-item fetches
+        uncovered = [itm for itm in catalog if itm.item_id not in prices]
+        no_def_index = sum(1 for itm in uncovered if itm.def_index is None)
+        unfinished = sum(1 for itm in uncovered if itm.def_index in self.pager.incomplete)
+        print(
+            f"[CatalogIngest] {len(def_indexes)} def_index, {self.pager.requests_made} stránek, "
+            f"{len(prices)}/{len(catalog)} itemů ze snapshotu ({time.monotonic() - started:.1f}s); "
+            f"mimo snapshot {len(uncovered)}: {no_def_index} bez def_index, {unfinished} z nedokončených def_index, "
+            f"{len(uncovered) - no_def_index - unfinished} bez shody jména"
+        )
+        prices.update(self._fetch_uncovered(uncovered))
+        if progress:
+            progress.set_total(len(prices))
+
+        now = datetime.datetime.now()
+        batch = self.repo.price_write_batch(chunk_size=self.chunk_size)
+        results = []
+        for itm in catalog:
+            price = prices.get(itm.item_id)
+            if price is None:
+                continue
+            batch.add_market_price(market_id=CSFLOAT_MARKET_ID, item_id=itm.item_id, price=price, timestamp=now)
+            batch.set_item_price(itm.item_id, price)
+            results.append({
+                "item_id": itm.item_id,
+                "name": itm.name,
+                "item_type": itm.item_type,
+                "new_price": price,
+                "currency": "USD",
+            })
+        batch.flush()
+        if progress:
+            for result in results:
+                progress.item_done(result)
+        return results
+
+
+def build_catalog_ingest(db: Session) -> CatalogIngest:
+    cfg = Config()
+    pager = CSFloatListingPager(cfg.CATALOG_INGEST_MAX_PAGES, cfg)
+    return CatalogIngest(db, pager, cfg.CATALOG_REFRESH_ITEM_TYPES)
@@ -0,0 +1,269 @@
+import datetime
+import logging
+import math
+import threading
+import time
+from collections import deque
+from sqlalchemy import func, or_
+from sqlalchemy.orm import Session
+from config import Config
+from database import SessionLocal
+from fetch_engine import PriceFetchEngine
+from market_name import item_query
+from market_registry import CSFLOAT_MARKET_ID
+from models import Item, UserItem, MarketPriceRollup
+from price_cache import get_market_strategy
+from price_factory import PriceFactory
+from repository import ItemRepository
+
+logger = logging.getLogger("scheduler")
+
+# Items never priced rank as if they were this old
+MAX_STALENESS_HOURS = 30 * 24
+VOLATILITY_WINDOW_DAYS = 30
+
+
+class CatalogRefreshQueue:
+    """
+    Picks the catalog items whose price is most worth refreshing next.
+
+    Candidates come from the ITEM.last_update index (oldest first, only rows
+    older than min_age_hours), candidate_factor times as many as requested.
+    They are ranked by
+
+        staleness_hours * (1 + holder_weight * ln(1 + holders))
+                        * (1 + volatility_weight * volatility)
+
+    where holders is the number of USERITEM rows and volatility the relative
+    daily price range over the last 30 days (MARKETPRICEROLLUP).
+    """
+
+    def __init__(
+        self,
+        db: Session,
+        item_types: list[str],
+        min_age_hours: float = 24.0,
+        holder_weight: float = 1.0,
+        volatility_weight: float = 2.0,
+        candidate_factor: int = 5,
+    ) -> None:
+        self.db = db
+        self.item_types = list(item_types)
+        self.min_age = datetime.timedelta(hours=max(0.0, float(min_age_hours)))
+        self.holder_weight = holder_weight
+        self.volatility_weight = volatility_weight
+        self.candidate_factor = max(1, int(candidate_factor))
+
+    @classmethod
+    def from_config(cls, db: Session, item_types: list[str] | None = None) -> "CatalogRefreshQueue":
+        cfg = Config()
+        return cls(
+            db,
+            item_types or cfg.CATALOG_REFRESH_ITEM_TYPES,
+            min_age_hours=cfg.CATALOG_REFRESH_MIN_AGE_HOURS,
+            holder_weight=cfg.CATALOG_REFRESH_HOLDER_WEIGHT,
+            volatility_weight=cfg.CATALOG_REFRESH_VOLATILITY_WEIGHT,
+        )
+
+    def _candidates(self, now: datetime.datetime, limit: int, exclude: set[int] | None) -> list[Item]:
+        def base():
+            q = self.db.query(Item)
+            if self.item_types:
+                q = q.filter(Item.item_type.in_(self.item_types))
+            if exclude:
+                q = q.filter(~Item.item_id.in_(exclude))
+            return q
+
+        # Unpriced rows are due whatever their last_update (new rows get now());
+        # they are read on their own, NULL sorts differently on SQLite and Postgres
+        never = base().filter(or_(Item.current_price == None, Item.last_update == None)).limit(limit).all()
+        if len(never) >= limit:
+            return never
+        stale = (
+            base()
+            .filter(Item.last_update < now - self.min_age, Item.current_price != None)
+            .order_by(Item.last_update)
+            .limit(limit - len(never))
+            .all()
+        )
+        return never + stale
+
+    def _holders(self, item_ids: list[int]) -> dict[int, int]:
+        rows = (
+            self.db.query(UserItem.item_id, func.count(UserItem.user_item_id))
+            .filter(UserItem.item_id.in_(item_ids))
+            .group_by(UserItem.item_id)
+        )
+        return {item_id: count for item_id, count in rows}
+
+    def _volatility(self, item_ids: list[int], now: datetime.datetime) -> dict[int, float]:
+        rows = (
+            self.db.query(
+                MarketPriceRollup.item_id,
+                func.max(MarketPriceRollup.high_price),
+                func.min(MarketPriceRollup.low_price),
+                func.avg(MarketPriceRollup.close_price),
+            )
+            .filter(
+                MarketPriceRollup.item_id.in_(item_ids),
+                MarketPriceRollup.resolution == "day",
+                MarketPriceRollup.bucket_start >= now - datetime.timedelta(days=VOLATILITY_WINDOW_DAYS),
+            )
+            .group_by(MarketPriceRollup.item_id)
+        )
+        result = {}
+        for item_id, high, low, avg in rows:
+            if high is None or low is None or not avg:
+                continue
+            result[item_id] = (float(high) - float(low)) / float(avg)
+        return result
+
+    def priority(self, itm: Item, now: datetime.datetime, holders: int, volatility: float) -> float:
+        if itm.last_update is None or itm.current_price is None:
+            staleness = MAX_STALENESS_HOURS
+        else:
+            staleness = min(MAX_STALENESS_HOURS, max(0.0, (now - itm.last_update).total_seconds() / 3600))
+        return (
+            staleness
+            * (1 + self.holder_weight * math.log1p(holders))
+            * (1 + self.volatility_weight * volatility)
+        )
+
+    def next_due(self, limit: int, now: datetime.datetime | None = None, exclude: set[int] | None = None) -> list[Item]:
+        """Up to `limit` due items, most important first."""
+        if limit <= 0:
+            return []
+        now = now or datetime.datetime.now()
+        candidates = self._candidates(now, limit * self.candidate_factor, exclude)
+        if not candidates:
+            return []
+        ids = [itm.item_id for itm in candidates]
+        holders = self._holders(ids)
+        volatility = self._volatility(ids, now)
+        candidates.sort(
+            key=lambda itm: self.priority(itm, now, holders.get(itm.item_id, 0), volatility.get(itm.item_id, 0.0)),
+            reverse=True,
+        )
+        return candidates[:limit]
+
+
+class HourlyBudget:
+    """Rolling one-hour allowance of price requests, shared by the process."""
+
+    def __init__(self, per_hour: int) -> None:
+        self.per_hour = max(0, int(per_hour))
+        self._spent: deque[tuple[float, int]] = deque()
+        self._lock = threading.Lock()
+
+    def _prune(self, now: float) -> None:
+        while self._spent and self._spent[0][0] <= now - 3600:
+            self._spent.popleft()
+
+    def remaining(self) -> int:
+        with self._lock:
+            self._prune(time.monotonic())
+            return max(0, self.per_hour - sum(n for _, n in self._spent))
+
+    def take(self, count: int) -> int:
+        """Grants up to `count` requests; the caller spends exactly what it got."""
+        with self._lock:
+            now = time.monotonic()
+            self._prune(now)
+            granted = max(0, min(int(count), self.per_hour - sum(n for _, n in self._spent)))
+            if granted:
+                self._spent.append((now, granted))
+            return granted
+
+    def refund(self, count: int) -> None:
+        # Unused part of the latest grant, taken back from that grant so it
+        # expires with it
+        with self._lock:
+            while count > 0 and self._spent:
+                ts, spent = self._spent.pop()
+                back = min(spent, int(count))
+                count -= back
+                if spent > back:
+                    self._spent.append((ts, spent - back))
+                    break
+
+
+class CatalogRefresher:
+    """
+    Scheduler job: every interval_minutes it takes its share of the hourly
+    API budget and refreshes that many items from CatalogRefreshQueue,
+    concurrently through PriceFetchEngine and written with one
+    PriceWriteBatch. Items without a price are left alone for min_age_hours
+    so they do not eat the budget of every run.
+    """
+
+    def __init__(self, budget: HourlyBudget, interval_minutes: int, strategy_factory=get_market_strategy) -> None:
+        self.budget = budget
+        self.interval_minutes = max(1, int(interval_minutes))
+        self.strategy_factory = strategy_factory
+        self.factory = PriceFactory()
+        self._failed_until: dict[int, datetime.datetime] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def per_run(self) -> int:
+        # The hour's budget spread evenly over the runs
+        return math.ceil(self.budget.per_hour * self.interval_minutes / 60)
+
+    def _exclude(self, now: datetime.datetime) -> set[int]:
+        for item_id in [i for i, until in self._failed_until.items() if until <= now]:
+            del self._failed_until[item_id]
+        return set(self._failed_until)
+
+    def run_once(self) -> dict:
+        # Skipped, not queued, when the previous run is still going
+        if not self._lock.acquire(blocking=False):
+            return {"refreshed": 0, "failed": 0, "skipped": True}
+        try:
+            return self._run()
+        finally:
+            self._lock.release()
+
+    def _run(self) -> dict:
+        stats = {"refreshed": 0, "failed": 0}
+        granted = self.budget.take(self.per_run)
+        if not granted:
+            return stats
+
+        now = datetime.datetime.now()
+        db = SessionLocal()
+        try:
+            queue = CatalogRefreshQueue.from_config(db)
+            items = queue.next_due(granted, now, exclude=self._exclude(now))
+            self.budget.refund(granted - len(items))
+            if not items:
+                return stats
+
+            engine = PriceFetchEngine(self.strategy_factory())
+            batch = ItemRepository(db).price_write_batch()
+            for index, raw in engine.fetch_iter([item_query(itm) for itm in items]):
+                itm = items[index]
+                clean = self.factory.create_price(raw, itm.item_id, market_id=CSFLOAT_MARKET_ID)
+                if not clean:
+                    self._failed_until[itm.item_id] = now + queue.min_age
+                    stats["failed"] += 1
+                    continue
+                batch.add_market_price(market_id=CSFLOAT_MARKET_ID, item_id=itm.item_id, price=clean["price"])
+                batch.set_item_price(itm.item_id, clean["price"])
+                stats["refreshed"] += 1
+            batch.flush()
+        finally:
+            db.close()
+
+        logger.info(
+            f"Catalog refresh: {stats['refreshed']} refreshed, {stats['failed']} failed, "
+            f"{self.budget.remaining()}/{self.budget.per_hour} requests left this hour"
+        )
+        return stats
+
+
+def _build_refresher() -> CatalogRefresher:
+    cfg = Config()
+    return CatalogRefresher(HourlyBudget(cfg.CATALOG_REFRESH_BUDGET_PER_HOUR), cfg.CATALOG_REFRESH_INTERVAL_MINUTES)
+
+
+catalog_refresher = _build_refresher()
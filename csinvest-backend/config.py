@@ -3,6 +3,22 @@ from typing import List, Optional
 from dotenv import load_dotenv
 
 
+def _env_int(name: str, default: int) -> int:
+    raw = (os.getenv(name, "") or "").strip()
+    try:
+        return int(raw) if raw else default
+    except ValueError:
+        return default
+
+
+def _env_float(name: str, default: float) -> float:
+    raw = (os.getenv(name, "") or "").strip()
+    try:
+        return float(raw) if raw else default
+    except ValueError:
+        return default
+
+
 class _Singleton(type):
     _instances = {}
 
@@ -20,7 +36,103 @@ class Config(metaclass=_Singleton):
         self.CSFLOAT_API_KEYS: List[str] = [k.strip() for k in os.getenv("CSFLOAT_API_KEY", "").split(',') if k.strip()]
         # Primary key for backward compatibility or simple access
         self.CSFLOAT_API_KEY: str = self.CSFLOAT_API_KEYS[0] if self.CSFLOAT_API_KEYS else ""
-        
+
+        # Price fetch engine: one token bucket per API key, shared worker pool
+        self.CSFLOAT_RATE_PER_KEY: float = _env_float("CSFLOAT_RATE_PER_KEY", 1.0)
+        self.CSFLOAT_BURST_PER_KEY: int = _env_int("CSFLOAT_BURST_PER_KEY", 1)
+        self.PRICE_FETCH_WORKERS: int = _env_int("PRICE_FETCH_WORKERS", 8)
+        # Async CSFloat client (pooled keep-alive connections, bounded concurrency)
+        self.CSFLOAT_HTTP_MAX_CONNECTIONS: int = _env_int("CSFLOAT_HTTP_MAX_CONNECTIONS", 10)
+        self.CSFLOAT_HTTP_TIMEOUT_SECONDS: float = _env_float("CSFLOAT_HTTP_TIMEOUT_SECONDS", 10.0)
+
+        # Shared price cache in front of the market strategy (in-process unless PRICE_CACHE_URL=redis://...)
+        self.PRICE_CACHE_TTL_SECONDS: int = _env_int("PRICE_CACHE_TTL_SECONDS", 300)
+        self.PRICE_CACHE_MAX_ENTRIES: int = _env_int("PRICE_CACHE_MAX_ENTRIES", 5000)
+        self.PRICE_CACHE_URL: str = (os.getenv("PRICE_CACHE_URL", "") or "").strip()
+
+        # /search backend: "memory" (in-process index, rebuilt from ITEM every N seconds)
+        # or "db" (stateless; pg_trgm indexed column on Postgres, LIKE elsewhere)
+        self.SEARCH_BACKEND: str = (os.getenv("SEARCH_BACKEND", "memory") or "memory").strip().lower()
+        if self.SEARCH_BACKEND not in {"memory", "db"}:
+            self.SEARCH_BACKEND = "memory"
+        self.SEARCH_INDEX_REFRESH_SECONDS: int = _env_int("SEARCH_INDEX_REFRESH_SECONDS", 600)
+
+        # Cached JSON of catalog endpoints (/cases, /collections, /items/{slug}), dropped on ITEM writes
+        self.CATALOG_CACHE_TTL_SECONDS: int = _env_int("CATALOG_CACHE_TTL_SECONDS", 300)
+        self.CATALOG_CACHE_MAX_ENTRIES: int = _env_int("CATALOG_CACHE_MAX_ENTRIES", 2000)
+
+        # CASEMEMBERSHIP is compared with ITEM this often (catalog changes made outside the API)
+        self.CASE_MEMBERSHIP_SYNC_MINUTES: int = _env_int("CASE_MEMBERSHIP_SYNC_MINUTES", 10)
+
+        # Background refresh jobs (/refresh-portfolio, /refresh-items)
+        self.REFRESH_JOB_WORKERS: int = _env_int("REFRESH_JOB_WORKERS", 2)
+        self.REFRESH_JOB_RETENTION_SECONDS: int = _env_int("REFRESH_JOB_RETENTION_SECONDS", 3600)
+
+        # /refresh-items pages through CSFloat listings one def_index at a time;
+        # a def_index with more pages than this falls back to per-item queries
+        self.CATALOG_INGEST_MAX_PAGES: int = _env_int("CATALOG_INGEST_MAX_PAGES", 200)
+
+        # Background catalog refresh: the most stale / most held / most volatile
+        # items first, at most CATALOG_REFRESH_BUDGET_PER_HOUR requests an hour.
+        # Spends the server CSFloat keys shared with user refreshes, so it is
+        # opt-in (0 = off)
+        self.CATALOG_REFRESH_BUDGET_PER_HOUR: int = _env_int("CATALOG_REFRESH_BUDGET_PER_HOUR", 0)
+        self.CATALOG_REFRESH_INTERVAL_MINUTES: int = _env_int("CATALOG_REFRESH_INTERVAL_MINUTES", 5)
+        self.CATALOG_REFRESH_MIN_AGE_HOURS: float = _env_float("CATALOG_REFRESH_MIN_AGE_HOURS", 24.0)
+        # Item types with a market price (also what /refresh-items covers without item_type)
+        self.CATALOG_REFRESH_ITEM_TYPES: List[str] = [
+            t.strip() for t in os.getenv("CATALOG_REFRESH_ITEM_TYPES", "skin,knife,glove,case").split(',') if t.strip()
+        ]
+        self.CATALOG_REFRESH_HOLDER_WEIGHT: float = _env_float("CATALOG_REFRESH_HOLDER_WEIGHT", 1.0)
+        self.CATALOG_REFRESH_VOLATILITY_WEIGHT: float = _env_float("CATALOG_REFRESH_VOLATILITY_WEIGHT", 2.0)
+
+        # PORTFOLIOTOTALS is compared with a full USERITEM aggregate this often
+        self.PORTFOLIO_TOTALS_CHECK_MINUTES: int = _env_int("PORTFOLIO_TOTALS_CHECK_MINUTES", 60)
+
+        # PORTFOLIOHISTORY keeps raw snapshots this long, older days are compacted
+        # to one row per day; daily rows are kept forever when retention is 0
+        self.PORTFOLIO_HISTORY_RAW_RETENTION_DAYS: int = _env_int("PORTFOLIO_HISTORY_RAW_RETENTION_DAYS", 30)
+        self.PORTFOLIO_HISTORY_DAILY_RETENTION_DAYS: int = _env_int("PORTFOLIO_HISTORY_DAILY_RETENTION_DAYS", 0)
+
+        # /analytics keeps daily close series of this many items in memory
+        self.ANALYTICS_SERIES_CACHE_ITEMS: int = _env_int("ANALYTICS_SERIES_CACHE_ITEMS", 20000)
+
+        # /useritemhistory/summary results per user, dropped on USERITEMHISTORY writes
+        self.REALIZED_PNL_CACHE_TTL_SECONDS: int = _env_int("REALIZED_PNL_CACHE_TTL_SECONDS", 300)
+
+        # The in-memory notification minute index is reloaded from USER this often;
+        # it is how a settings change reaches the other worker processes
+        self.NOTIFICATION_INDEX_RELOAD_MINUTES: int = _env_int("NOTIFICATION_INDEX_RELOAD_MINUTES", 1)
+
+        # Scheduled refresh: parallel batches of due users, a time budget per tick
+        # (leftovers go to the next tick) and user_id shards leased per process
+        self.SCHEDULED_REFRESH_WORKERS: int = _env_int("SCHEDULED_REFRESH_WORKERS", 4)
+        self.SCHEDULED_REFRESH_BATCH_SIZE: int = _env_int("SCHEDULED_REFRESH_BATCH_SIZE", 10)
+        self.SCHEDULED_REFRESH_TICK_SECONDS: int = _env_int("SCHEDULED_REFRESH_TICK_SECONDS", 60)
+        self.SCHEDULED_REFRESH_TICK_BUDGET_SECONDS: int = _env_int("SCHEDULED_REFRESH_TICK_BUDGET_SECONDS", 50)
+        self.SCHEDULED_REFRESH_SHARDS: int = _env_int("SCHEDULED_REFRESH_SHARDS", 1)
+        # 0 = an even share of the shards between the live processes
+        self.SCHEDULED_REFRESH_SHARDS_PER_PROCESS: int = _env_int("SCHEDULED_REFRESH_SHARDS_PER_PROCESS", 0)
+        self.SCHEDULED_REFRESH_LEASE_SECONDS: int = _env_int("SCHEDULED_REFRESH_LEASE_SECONDS", 180)
+
+        # Discord webhook outbox: parallel sends, attempts per message (429s not counted), queue cap
+        self.DISCORD_DISPATCH_CONCURRENCY: int = _env_int("DISCORD_DISPATCH_CONCURRENCY", 4)
+        self.DISCORD_DISPATCH_MAX_ATTEMPTS: int = _env_int("DISCORD_DISPATCH_MAX_ATTEMPTS", 5)
+        self.DISCORD_OUTBOX_MAX_EVENTS: int = _env_int("DISCORD_OUTBOX_MAX_EVENTS", 10000)
+
+        # Background refresh of the process-wide FX rates (also persisted to FXRATE)
+        self.FX_REFRESH_MINUTES: int = _env_int("FX_REFRESH_MINUTES", 720)
+
+        # Multi-market fan-out: per-market timeout, hedged second request after
+        # MARKET_HEDGE_AFTER_SECONDS (0 = off), answers to wait for (0 = all markets)
+        self.MARKET_TIMEOUT_SECONDS: float = _env_float("MARKET_TIMEOUT_SECONDS", 8.0)
+        self.MARKET_HEDGE_AFTER_SECONDS: float = _env_float("MARKET_HEDGE_AFTER_SECONDS", 2.0)
+        self.MARKET_MIN_RESULTS: int = _env_int("MARKET_MIN_RESULTS", 0)
+        # Offline fake market (load tests only, its prices land in MARKETPRICE)
+        self.FAKE_MARKET_ENABLED: bool = (os.getenv("FAKE_MARKET_ENABLED", "false") or "false").strip().lower() in {"1", "true", "yes", "on"}
+        self.FAKE_MARKET_ID: int = _env_int("FAKE_MARKET_ID", 90)
+        self.FAKE_MARKET_LATENCY_MS: float = _env_float("FAKE_MARKET_LATENCY_MS", 150.0)
+
         self.CSFLOAT_ENCRYPTION_KEY: str = os.getenv("CSFLOAT_ENCRYPTION_KEY", "")
         self.CSFLOAT_ENCRYPTION_LEGACY_KEYS: List[str] = [
             key.strip()
@@ -0,0 +1,254 @@
+import csv
+import datetime
+import io
+import json
+from decimal import Decimal
+from database import SessionLocal
+from models import UserItem, UserItemHistory, Item, MarketPrice
+
+EXPORT_CHUNK_ROWS = 1000
+
+# Column name, selected expression, value kind (used for the Arrow schema)
+_DATASETS = {
+    "portfolio": [
+        ("user_item_id", UserItem.user_item_id, "int"),
+        ("item_id", UserItem.item_id, "int"),
+        ("item_name", Item.name, "str"),
+        ("item_slug", Item.slug, "str"),
+        ("item_type", Item.item_type, "str"),
+        ("amount", UserItem.amount, "int"),
+        ("buy_price", UserItem.buy_price, "decimal"),
+        ("current_price", UserItem.current_price, "decimal"),
+        ("float_value", UserItem.float_value, "decimal"),
+        ("pattern", UserItem.pattern, "int"),
+        ("wear", UserItem.wear, "str"),
+        ("variant", UserItem.variant, "str"),
+        ("phase", UserItem.phase, "str"),
+        ("buy_date", UserItem.buy_date, "date"),
+        ("last_update", UserItem.last_update, "datetime"),
+    ],
+    "trades": [
+        ("user_item_history_id", UserItemHistory.user_item_history_id, "int"),
+        ("item_id", UserItemHistory.item_id, "int"),
+        ("item_name", Item.name, "str"),
+        ("item_slug", Item.slug, "str"),
+        ("item_type", Item.item_type, "str"),
+        ("amount", UserItemHistory.amount, "int"),
+        ("buy_price", UserItemHistory.buy_price, "decimal"),
+        ("sell_price", UserItemHistory.sell_price, "decimal"),
+        ("sell_fee_pct", UserItemHistory.sell_fee_pct, "decimal"),
+        ("withdraw_fee_pct", UserItemHistory.withdraw_fee_pct, "decimal"),
+        ("final_price", UserItemHistory.final_price, "decimal"),
+        ("sold_date", UserItemHistory.sold_date, "date"),
+    ],
+    "prices": [
+        ("item_id", MarketPrice.item_id, "int"),
+        ("item_slug", Item.slug, "str"),
+        ("market_id", MarketPrice.market_id, "int"),
+        ("price", MarketPrice.price, "decimal"),
+        ("timestamp", MarketPrice.timestamp, "datetime"),
+    ],
+}
+
+EXPORT_DATASETS = tuple(_DATASETS)
+
+EXPORT_FORMATS = {
+    "csv": ("text/csv; charset=utf-8", "csv"),
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+    "arrow": ("application/vnd.apache.arrow.stream", "arrows"),
+}
+
+
+def export_needs_pyarrow(fmt: str) -> bool:
+    return fmt in ("parquet", "arrow")
+
+
+def pyarrow_available() -> bool:
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _query(db, dataset: str, user_id: int, item_id: int | None, since: datetime.datetime | None):
+    exprs = [expr for _, expr, _ in _DATASETS[dataset]]
+    if dataset == "portfolio":
+        q = (
+            db.query(*exprs)
+            .join(Item, Item.item_id == UserItem.item_id)
+            .filter(UserItem.user_id == user_id)
+            .order_by(UserItem.user_item_id)
+        )
+        if item_id is not None:
+            q = q.filter(UserItem.item_id == item_id)
+        return q
+    if dataset == "trades":
+        q = (
+            db.query(*exprs)
+            .join(Item, Item.item_id == UserItemHistory.item_id)
+            .filter(UserItemHistory.user_id == user_id)
+            .order_by(UserItemHistory.user_item_history_id)
+        )
+        if item_id is not None:
+            q = q.filter(UserItemHistory.item_id == item_id)
+        if since is not None:
+            q = q.filter(UserItemHistory.sold_date >= since.date())
+        return q
+
+    # prices: one item, or every item currently in the user's portfolio
+    q = db.query(*exprs).join(Item, Item.item_id == MarketPrice.item_id)
+    if item_id is not None:
+        q = q.filter(MarketPrice.item_id == item_id)
+    else:
+        held = db.query(UserItem.item_id).filter(UserItem.user_id == user_id).distinct()
+        q = q.filter(MarketPrice.item_id.in_(held))
+    if since is not None:
+        q = q.filter(MarketPrice.timestamp >= since)
+    return q.order_by(MarketPrice.item_id, MarketPrice.timestamp)
+
+
+def _iter_chunks(dataset: str, user_id: int, item_id: int | None, since: datetime.datetime | None):
+    # Own session: the response body is produced after the request's
+    # dependencies (and their session) are gone.
+    db = SessionLocal()
+    try:
+        chunk = []
+        # yield_per streams the result (server-side cursor on Postgres), so
+        # memory stays at one chunk no matter how many rows there are.
+        for row in _query(db, dataset, user_id, item_id, since).yield_per(EXPORT_CHUNK_ROWS):
+            chunk.append(tuple(row))
+            if len(chunk) >= EXPORT_CHUNK_ROWS:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+    finally:
+        db.close()
+
+
+def _json_value(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    return value
+
+
+def _stream_csv(columns: list[str], chunks):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(columns)
+    # Header goes out before the first query round-trip finishes
+    yield buf.getvalue().encode("utf-8")
+    for chunk in chunks:
+        buf.seek(0)
+        buf.truncate()
+        writer.writerows(chunk)
+        yield buf.getvalue().encode("utf-8")
+
+
+def _stream_ndjson(columns: list[str], chunks):
+    for chunk in chunks:
+        lines = [
+            json.dumps({c: _json_value(v) for c, v in zip(columns, row)}, ensure_ascii=False)
+            for row in chunk
+        ]
+        yield ("\n".join(lines) + "\n").encode("utf-8")
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file object for pyarrow writers; collected bytes are drained per batch."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._parts: list[bytes] = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        # The Parquet writer records column chunk offsets
+        return self._position
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._parts.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b"".join(self._parts)
+        self._parts.clear()
+        return data
+
+
+def _arrow_schema(pa, spec):
+    types = {
+        "int": pa.int64(),
+        "str": pa.string(),
+        "decimal": pa.float64(),
+        "date": pa.date32(),
+        "datetime": pa.timestamp("us"),
+    }
+    return pa.schema([(name, types[kind]) for name, _, kind in spec])
+
+
+def _arrow_batch(pa, schema, spec, chunk):
+    arrays = []
+    for idx, (_, _, kind) in enumerate(spec):
+        values = [row[idx] for row in chunk]
+        if kind == "decimal":
+            values = [None if v is None else float(v) for v in values]
+        arrays.append(pa.array(values, type=schema.field(idx).type))
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def _stream_arrow(fmt: str, spec, chunks):
+    import pyarrow as pa
+
+    schema = _arrow_schema(pa, spec)
+    sink = _ChunkSink()
+    if fmt == "parquet":
+        import pyarrow.parquet as pq
+        writer = pq.ParquetWriter(sink, schema, compression="zstd")
+    else:
+        writer = pa.ipc.new_stream(sink, schema)
+    try:
+        # One row group / record batch per chunk, shipped as soon as it is written
+        for chunk in chunks:
+            writer.write_batch(_arrow_batch(pa, schema, spec, chunk))
+            data = sink.drain()
+            if data:
+                yield data
+    finally:
+        writer.close()
+    data = sink.drain()
+    if data:
+        yield data
+
+
+def stream_export(
+    dataset: str,
+    fmt: str,
+    user_id: int,
+    item_id: int | None = None,
+    since: datetime.datetime | None = None,
+):
+    """Byte chunks of the export, for a StreamingResponse."""
+    spec = _DATASETS[dataset]
+    columns = [name for name, _, _ in spec]
+    chunks = _iter_chunks(dataset, user_id, item_id, since)
+    if fmt == "csv":
+        return _stream_csv(columns, chunks)
+    if fmt == "ndjson":
+        return _stream_ndjson(columns, chunks)
+    if fmt in ("parquet", "arrow"):
+        return _stream_arrow(fmt, spec, chunks)
+    raise ValueError(f"Neznámý formát exportu: {fmt}")
+
+
+def export_filename(dataset: str, fmt: str) -> str:
+    return f"csinvest-{dataset}-{datetime.date.today().isoformat()}.{EXPORT_FORMATS[fmt][1]}"
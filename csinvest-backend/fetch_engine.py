@@ -0,0 +1,199 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from config import Config
+from strategy import IMarketStrategy, IAsyncMarketStrategy
+
+
+class TokenBucket:
+    """
+    Reservation based token bucket. reserve() never blocks, it books the next
+    free slot and returns how long the caller has to wait before using it.
+    """
+
+    def __init__(self, rate: float, capacity: int = 1) -> None:
+        self.rate = max(0.01, float(rate))
+        self.capacity = max(1, int(capacity))
+        self._tokens = float(self.capacity)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(float(self.capacity), self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def peek_wait(self) -> float:
+        with self._lock:
+            self._refill(time.monotonic())
+            return max(0.0, (1.0 - self._tokens) / self.rate)
+
+    def reserve(self) -> float:
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens -= 1.0
+            return max(0.0, -self._tokens / self.rate)
+
+    def pause(self, seconds: float) -> None:
+        # After a 429: the next slot is no earlier than Retry-After from now
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens = min(self._tokens, -max(0.0, float(seconds)) * self.rate)
+
+
+class ApiKeyPool:
+    """Spreads requests over several API keys, each with its own token bucket."""
+
+    def __init__(self, keys: list[str | None], rate: float, capacity: int = 1) -> None:
+        self.keys = list(keys) or [None]
+        self._buckets = [TokenBucket(rate, capacity) for _ in self.keys]
+        self._lock = threading.Lock()
+
+    def reserve(self) -> tuple[str | None, float]:
+        # Pick the key whose bucket frees up first; the lock keeps two workers
+        # from both seeing the same bucket as the cheapest one.
+        with self._lock:
+            best = min(range(len(self._buckets)), key=lambda i: self._buckets[i].peek_wait())
+            wait = self._buckets[best].reserve()
+        return self.keys[best], wait
+
+    def try_reserve(self) -> tuple[str | None, bool]:
+        """Like reserve(), but only takes a token that is free right now."""
+        with self._lock:
+            best = min(range(len(self._buckets)), key=lambda i: self._buckets[i].peek_wait())
+            if self._buckets[best].peek_wait() > 0:
+                return None, False
+            self._buckets[best].reserve()
+        return self.keys[best], True
+
+    def penalize(self, key: str | None, seconds: float) -> None:
+        """The key was rate limited: no request goes out with it for `seconds`."""
+        if key in self.keys:
+            self._buckets[self.keys.index(key)].pause(seconds)
+
+
+_key_pools: dict[tuple, ApiKeyPool] = {}
+_key_pools_lock = threading.Lock()
+
+
+def get_key_pool(keys: list[str | None] | tuple, config: Config | None = None) -> ApiKeyPool:
+    """
+    Returns the process-wide pool for the given keys, so rate limits hold across
+    PriceService instances (a new one is built for every request/scheduler tick).
+    """
+    cfg = config or Config()
+    pool_key = tuple(keys) or (None,)
+    with _key_pools_lock:
+        pool = _key_pools.get(pool_key)
+        if pool is None:
+            pool = ApiKeyPool(list(pool_key), cfg.CSFLOAT_RATE_PER_KEY, cfg.CSFLOAT_BURST_PER_KEY)
+            _key_pools[pool_key] = pool
+        return pool
+
+
+def pool_for_api_key(api_key: str | None, config: Config | None = None) -> ApiKeyPool:
+    # A user's own key gets its own bucket, otherwise the server key pool is used.
+    cfg = config or Config()
+    if api_key:
+        return get_key_pool((api_key,), cfg)
+    return get_key_pool(tuple(cfg.CSFLOAT_API_KEYS), cfg)
+
+
+class PriceFetchEngine:
+    """
+    Runs many fetch_price calls concurrently. Each query is a dict with
+    market_name, min_float, max_float, optionally phase (already split off
+    market_name) and api_key (user key).
+    Results are yielded as they arrive; DB work stays on the caller's thread.
+    """
+
+    def __init__(self, strategy: IMarketStrategy, config: Config | None = None) -> None:
+        self.strategy = strategy
+        self.config = config or Config()
+
+    def _fetch_one(self, query: dict, default_api_key: str | None):
+        # Cached strategies answer without spending a rate-limit token.
+        get_cached = getattr(self.strategy, "get_cached", None)
+        if get_cached is not None:
+            cached = get_cached(query["market_name"], query.get("min_float"), query.get("max_float"), query.get("phase"))
+            if cached is not None:
+                return cached
+        fetch = getattr(self.strategy, "fetch_uncached", self.strategy.fetch_price)
+
+        pool = pool_for_api_key(query.get("api_key") or default_api_key, self.config)
+        # The strategy recognises a server key picked here and leaves 429s to the pool
+        # (penalize) instead of rotating keys itself
+        key, wait = pool.reserve()
+        if wait > 0:
+            time.sleep(wait)
+        return fetch(
+            query["market_name"],
+            min_float=query.get("min_float"),
+            max_float=query.get("max_float"),
+            api_key=key,
+            phase=query.get("phase"),
+        )
+
+    def fetch_iter(self, queries: list[dict], api_key: str | None = None):
+        if not queries:
+            return
+
+        workers = max(1, min(int(self.config.PRICE_FETCH_WORKERS or 1), len(queries)))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="price-fetch") as pool:
+            futures = {pool.submit(self._fetch_one, q, api_key): i for i, q in enumerate(queries)}
+            for future in as_completed(futures):
+                index = futures[future]
+                try:
+                    raw = future.result()
+                except Exception as e:
+                    print(f"[PriceFetchEngine] Chyba při stahování {queries[index].get('market_name')}: {e}")
+                    raw = None
+                yield index, raw
+
+    def fetch_all(self, queries: list[dict], api_key: str | None = None) -> list:
+        results = [None] * len(queries)
+        for index, raw in self.fetch_iter(queries, api_key=api_key):
+            results[index] = raw
+        return results
+
+
+class AsyncPriceFetchEngine:
+    """Same as PriceFetchEngine for an IAsyncMarketStrategy; waits with asyncio.sleep."""
+
+    def __init__(self, strategy: IAsyncMarketStrategy, config: Config | None = None) -> None:
+        self.strategy = strategy
+        self.config = config or Config()
+
+    async def _afetch_one(self, query: dict, default_api_key: str | None):
+        get_cached = getattr(self.strategy, "get_cached", None)
+        if get_cached is not None:
+            cached = get_cached(query["market_name"], query.get("min_float"), query.get("max_float"), query.get("phase"))
+            if cached is not None:
+                return cached
+        fetch = getattr(self.strategy, "fetch_uncached", self.strategy.fetch_price)
+
+        pool = pool_for_api_key(query.get("api_key") or default_api_key, self.config)
+        # The strategy recognises a server key picked here and leaves 429s to the pool
+        # (penalize) instead of rotating keys itself
+        key, wait = pool.reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        try:
+            return await fetch(
+                query["market_name"],
+                min_float=query.get("min_float"),
+                max_float=query.get("max_float"),
+                api_key=key,
+                phase=query.get("phase"),
+            )
+        except Exception as e:
+            print(f"[AsyncPriceFetchEngine] Chyba při stahování {query.get('market_name')}: {e}")
+            return None
+
+    async def fetch_one(self, query: dict, api_key: str | None = None):
+        return await self._afetch_one(query, api_key)
+
+    async def fetch_all(self, queries: list[dict], api_key: str | None = None) -> list:
+        if not queries:
+            return []
+        return list(await asyncio.gather(*(self._afetch_one(q, api_key) for q in queries)))
@@ -0,0 +1,124 @@
+import datetime
+import threading
+import numpy as np
+import requests
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from models import FxRate
+
+FX_CURRENCIES = ("USD", "EUR", "GBP", "CZK", "RUB")
+
+# Used until the first successful refresh (or persisted rates) is available
+DEFAULT_FX_RATES = {
+    "USD": 1.0,
+    "EUR": 0.86,
+    "GBP": 0.75,
+    "CZK": 20.77,
+    "RUB": 77.73,
+}
+
+
+def _pick_rates(rates_obj: dict) -> dict:
+    return {
+        k: float(rates_obj[k])
+        for k in FX_CURRENCIES
+        if k != "USD" and isinstance(rates_obj.get(k), (int, float)) and rates_obj[k] > 0
+    }
+
+
+def fetch_remote_fx_rates() -> dict | None:
+    """USD -> currency rates from exchangerate.host, open.er-api.com as fallback. Blocking."""
+    symbols = [c for c in FX_CURRENCIES if c != "USD"]
+    try:
+        r = requests.get(
+            f"https://api.exchangerate.host/latest?base=USD&symbols={','.join(symbols)}",
+            timeout=5,
+        )
+        r.raise_for_status()
+        data = r.json()
+        picked = _pick_rates(data.get("rates") or data.get("data", {}).get("rates") or {})
+        if picked:
+            return picked
+    except Exception:
+        pass
+
+    try:
+        r = requests.get("https://open.er-api.com/v6/latest/USD", timeout=5)
+        r.raise_for_status()
+        data = r.json()
+        picked = _pick_rates(data.get("rates") or data.get("conversion_rates") or {})
+        if picked:
+            return picked
+    except Exception:
+        pass
+    return None
+
+
+class FxRateStore:
+    """
+    Process-wide USD -> currency rates. Reads never touch the network: the
+    scheduler refreshes the rates in the background and persists them to
+    FXRATE, so a fresh process starts from the last known rates.
+    """
+
+    def __init__(self) -> None:
+        self._rates = dict(DEFAULT_FX_RATES)
+        self._updated_at: datetime.datetime | None = None
+        self._lock = threading.Lock()
+
+    @property
+    def updated_at(self) -> datetime.datetime | None:
+        return self._updated_at
+
+    def _set(self, rates: dict, updated_at: datetime.datetime) -> None:
+        with self._lock:
+            # Readers always see a complete dict, never a half-updated one
+            self._rates = {**self._rates, **rates, "USD": 1.0}
+            self._updated_at = updated_at
+
+    def rates(self) -> dict:
+        return dict(self._rates)
+
+    def rate(self, currency: str | None) -> float:
+        return self._rates.get(str(currency or "USD").upper(), 1.0)
+
+    def convert(self, usd_value: float, currency: str | None) -> float:
+        return float(usd_value or 0.0) * self.rate(currency)
+
+    def convert_many(self, usd_values, currency: str | None) -> np.ndarray:
+        """A whole portfolio's prices in one step (None -> 0)."""
+        values = np.array([0.0 if v is None else float(v) for v in usd_values], dtype=float)
+        return values * self.rate(currency)
+
+    def load(self, db: Session) -> bool:
+        rows = db.query(FxRate).all()
+        rates = {r.currency: float(r.rate) for r in rows if r.currency in FX_CURRENCIES and r.rate}
+        if not rates:
+            return False
+        stamps = [r.updated_at for r in rows if r.updated_at]
+        self._set(rates, max(stamps) if stamps else None)
+        return True
+
+    def refresh(self, db: Session | None = None) -> bool:
+        """Fetches the remote rates; on failure the current ones stay in use."""
+        rates = fetch_remote_fx_rates()
+        if not rates:
+            return False
+        now = datetime.datetime.now()
+        self._set(rates, now)
+        if db is not None:
+            try:
+                self._persist(db, rates, now)
+            except IntegrityError:
+                # Another process inserted the rows first, now they exist
+                db.rollback()
+                self._persist(db, rates, now)
+        return True
+
+    def _persist(self, db: Session, rates: dict, updated_at: datetime.datetime) -> None:
+        for currency, rate in rates.items():
+            db.merge(FxRate(currency=currency, rate=rate, updated_at=updated_at))
+        db.commit()
+
+
+fx_rates = FxRateStore()
@@ -0,0 +1,125 @@
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from config import Config
+
+
+class RefreshJob:
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+    def __init__(self, kind: str, coalesce_key: str, owner_user_id: int | None = None) -> None:
+        self.job_id = uuid.uuid4().hex
+        self.kind = kind
+        self.coalesce_key = coalesce_key
+        self.owner_user_id = owner_user_id
+        self.status = self.QUEUED
+        self.total = 0
+        self.processed = 0
+        self.results: list[dict] = []
+        self.error: str | None = None
+        self.created_at = time.time()
+        self.started_at: float | None = None
+        self.finished_at: float | None = None
+        self._lock = threading.Lock()
+
+    @property
+    def is_active(self) -> bool:
+        return self.status in (self.QUEUED, self.RUNNING)
+
+    # Progress hooks called from the service while the job runs
+    def set_total(self, total: int) -> None:
+        with self._lock:
+            self.total = max(0, int(total))
+
+    def item_done(self, result: dict | None = None) -> None:
+        with self._lock:
+            self.processed += 1
+            if result is not None:
+                self.results.append(result)
+
+    def to_dict(self, include_results: bool = True) -> dict:
+        with self._lock:
+            data = {
+                "job_id": self.job_id,
+                "kind": self.kind,
+                "status": self.status,
+                "total": self.total,
+                "processed": self.processed,
+                "updated": len(self.results),
+                "error": self.error,
+                "created_at": self.created_at,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+            }
+            if include_results:
+                data["results"] = list(self.results)
+            return data
+
+
+class JobQueue:
+    """
+    Bounded worker pool for long-running price refreshes. Submitting work with
+    the coalesce_key of a job that is still queued/running returns that job
+    instead of queueing a duplicate.
+    """
+
+    def __init__(self, max_workers: int = 2, retention_seconds: int = 3600) -> None:
+        self._executor = ThreadPoolExecutor(max_workers=max(1, int(max_workers)), thread_name_prefix="refresh-job")
+        self._jobs: dict[str, RefreshJob] = {}
+        self._active_by_key: dict[str, str] = {}
+        self._retention_seconds = retention_seconds
+        self._lock = threading.Lock()
+
+    def submit(self, kind: str, coalesce_key: str, fn, owner_user_id: int | None = None) -> tuple[RefreshJob, bool]:
+        """fn(job) does the work. Returns (job, created)."""
+        with self._lock:
+            self._prune()
+            active_id = self._active_by_key.get(coalesce_key)
+            if active_id:
+                active = self._jobs.get(active_id)
+                if active and active.is_active:
+                    return active, False
+
+            job = RefreshJob(kind, coalesce_key, owner_user_id)
+            self._jobs[job.job_id] = job
+            self._active_by_key[coalesce_key] = job.job_id
+
+        self._executor.submit(self._run, job, fn)
+        return job, True
+
+    def _run(self, job: RefreshJob, fn) -> None:
+        job.status = RefreshJob.RUNNING
+        job.started_at = time.time()
+        try:
+            fn(job)
+            job.status = RefreshJob.DONE
+        except Exception as e:
+            print(f"[JobQueue] Job {job.kind} {job.job_id} selhal: {e}")
+            job.error = str(e)
+            job.status = RefreshJob.FAILED
+        finally:
+            job.finished_at = time.time()
+            with self._lock:
+                if self._active_by_key.get(job.coalesce_key) == job.job_id:
+                    del self._active_by_key[job.coalesce_key]
+
+    def get(self, job_id: str) -> RefreshJob | None:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _prune(self) -> None:
+        cutoff = time.time() - self._retention_seconds
+        stale = [
+            job_id for job_id, job in self._jobs.items()
+            if not job.is_active and job.finished_at is not None and job.finished_at < cutoff
+        ]
+        for job_id in stale:
+            del self._jobs[job_id]
+
+
+_cfg = Config()
+refresh_jobs = JobQueue(max_workers=_cfg.REFRESH_JOB_WORKERS, retention_seconds=_cfg.REFRESH_JOB_RETENTION_SECONDS)
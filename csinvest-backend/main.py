@@ -1,23 +1,38 @@
 from fastapi import FastAPI, Depends, HTTPException, Query, Request, Response
 from typing import List, Optional
-from sqlalchemy.orm import Session
-from database import get_db
-from repository import ItemRepository
+from sqlalchemy.orm import Session, joinedload
+from database import get_db, SessionLocal
+from repository import ItemRepository, ensure_pg_search_schema
 from service import PriceService
-from strategy import CSFloatStrategy
-from models import PortfolioHistory, User, Item, MarketPrice
+from price_cache import get_market_strategy, get_async_market_strategy, close_async_market_strategy
+from models import PortfolioHistory, PortfolioHistoryDaily, PortfolioTotals, User, UserItem, Item, MarketPrice, MarketPriceRollup, CaseMembership, SchedulerLease, SchedulerMember, FxRate, Market
+from price_history import parse_window, get_price_history, rebuild_price_rollups
+from portfolio_history import get_portfolio_history as get_portfolio_history_points
+from analytics import compute_portfolio_analytics
+from export import EXPORT_DATASETS, EXPORT_FORMATS, export_filename, export_needs_pyarrow, pyarrow_available, stream_export
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, EmailStr, Field
 from auth import hash_password, verify_password, create_access_token, get_current_user
 from config import Config
 from sqlalchemy import func, text
-from scheduler import start_scheduler
+from scheduler import start_scheduler, rebuild_search_index, on_notification_settings_changed
+from scheduled_refresh import scheduled_refresh
+from notifications import discord_outbox
+from fx import fx_rates
+from market_name import apply_market_fields
+from market_registry import get_market_registry
+from catalog_ingest import build_catalog_ingest
+from search_index import catalog_index
+from jobs import refresh_jobs
+from read_model import catalog_read_model, etag_matches
 from encryption import encrypt_api_key
 from mailer import send_password_reset_code
 import datetime
 import re
 import hashlib
 import secrets
+import base64
 from database import engine
 from security import (
     FixedWindowRateLimiter,
@@ -33,9 +48,30 @@ app = FastAPI()
 def startup_event():
     _ensure_useritemhistory_columns()
     _ensure_user_password_reset_columns()
+    _ensure_useritem_market_columns()
+    _ensure_price_history_schema()
+    _ensure_catalog_indexes()
+    _ensure_case_membership()
+    _ensure_portfolio_totals()
+    _ensure_portfolio_history_schema()
+    _ensure_scheduler_lease_table()
+    _ensure_fx_rates()
+    _ensure_markets()
+    if cfg.SEARCH_BACKEND == "db":
+        _ensure_search_schema()
+    else:
+        rebuild_search_index()
+    discord_outbox.start()
     start_scheduler()
 
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    await scheduled_refresh.close()
+    await discord_outbox.close()
+    await close_async_market_strategy()
+
+
 def _ensure_useritemhistory_columns():
     expected_columns = {
         "sell_fee_pct": "NUMERIC(5, 2) NOT NULL DEFAULT 0",
@@ -100,6 +136,160 @@ def _ensure_user_password_reset_columns():
             conn.execute(text(f"ALTER TABLE \"USER\" ADD COLUMN {col_name} {col_def}"))
 
 
+def _ensure_useritem_market_columns():
+    # Stored CSFloat query per USERITEM (see market_name.py); rows without it are resolved here
+    expected_columns = {
+        "market_hash_name": "VARCHAR",
+        "market_phase": "VARCHAR",
+        "market_min_float": "NUMERIC(10, 8)",
+        "market_max_float": "NUMERIC(10, 8)",
+    }
+
+    from sqlalchemy import inspect
+    with engine.begin() as conn:
+        existing = {c["name"] for c in inspect(conn).get_columns("USERITEM")}
+        for col_name, col_def in expected_columns.items():
+            if col_name in existing:
+                continue
+            conn.execute(text(f"ALTER TABLE \"USERITEM\" ADD COLUMN {col_name} {col_def}"))
+
+    db = SessionLocal()
+    try:
+        last_id = 0
+        while True:
+            rows = (
+                db.query(UserItem)
+                .options(joinedload(UserItem.item))
+                .filter(UserItem.market_hash_name == None, UserItem.user_item_id > last_id)
+                .order_by(UserItem.user_item_id)
+                .limit(1000)
+                .all()
+            )
+            if not rows:
+                break
+            for rec in rows:
+                if rec.item:
+                    apply_market_fields(rec, rec.item)
+            last_id = rows[-1].user_item_id
+            db.commit()
+    finally:
+        db.close()
+
+
+def _ensure_catalog_indexes():
+    # (item_type, name) backs the keyset-paginated catalog listings,
+    # last_update the catalog refresh queue
+    with engine.begin() as conn:
+        for index in Item.__table__.indexes:
+            index.create(conn, checkfirst=True)
+
+
+def _ensure_case_membership():
+    from sqlalchemy import inspect
+    from database import SessionLocal
+
+    with engine.begin() as conn:
+        created = not inspect(conn).has_table(CaseMembership.__tablename__)
+        CaseMembership.__table__.create(conn, checkfirst=True)
+
+    db = SessionLocal()
+    try:
+        if created:
+            count = ItemRepository(db).rebuild_case_membership()
+            print(f"[Cases] CASEMEMBERSHIP naplněna: {count} záznamů")
+        else:
+            # ITEM imports done while the API was down
+            changed = ItemRepository(db).sync_case_membership()
+            if changed:
+                print(f"[Cases] CASEMEMBERSHIP aktualizována pro {changed} cases")
+    finally:
+        db.close()
+
+
+def _ensure_portfolio_totals():
+    # USERITEM user_id/item_id indexes + running totals table, filled from
+    # one grouped aggregate the first time it is created.
+    from sqlalchemy import inspect
+
+    with engine.begin() as conn:
+        created = not inspect(conn).has_table(PortfolioTotals.__tablename__)
+        PortfolioTotals.__table__.create(conn, checkfirst=True)
+        for index in UserItem.__table__.indexes:
+            index.create(conn, checkfirst=True)
+
+    if created:
+        db = SessionLocal()
+        try:
+            count = ItemRepository(db).reconcile_portfolio_totals()
+            print(f"[PortfolioTotals] PORTFOLIOTOTALS naplněna: {count} uživatelů")
+        finally:
+            db.close()
+
+
+def _ensure_portfolio_history_schema():
+    # PORTFOLIOHISTORY (user_id, timestamp) index + daily compaction table
+    with engine.begin() as conn:
+        PortfolioHistoryDaily.__table__.create(conn, checkfirst=True)
+        for index in PortfolioHistory.__table__.indexes:
+            index.create(conn, checkfirst=True)
+
+
+def _ensure_scheduler_lease_table():
+    # Shard leases of the scheduled refresh (rows are created by the first renew)
+    with engine.begin() as conn:
+        SchedulerLease.__table__.create(conn, checkfirst=True)
+        SchedulerMember.__table__.create(conn, checkfirst=True)
+
+
+def _ensure_fx_rates():
+    # FXRATE table; the last persisted rates are served until the first refresh
+    with engine.begin() as conn:
+        FxRate.__table__.create(conn, checkfirst=True)
+    db = SessionLocal()
+    try:
+        fx_rates.load(db)
+    finally:
+        db.close()
+
+
+def _ensure_markets():
+    # MARKET rows for the registered markets (MARKETPRICE.market_id references them)
+    db = SessionLocal()
+    try:
+        existing = {m for (m,) in db.query(Market.market_id)}
+        for market in get_market_registry().markets:
+            if market.market_id not in existing:
+                db.add(Market(market_id=market.market_id, name=market.name))
+        db.commit()
+    finally:
+        db.close()
+
+
+def _ensure_search_schema():
+    # SEARCH_BACKEND=db: generated name_normalized column + trigram index (Postgres)
+    ensure_pg_search_schema(engine)
+
+
+def _ensure_price_history_schema():
+    # MARKETPRICE (item_id, timestamp) index + rollup table; rollups are
+    # backfilled from existing prices the first time the table is created.
+    from sqlalchemy import inspect
+    from database import SessionLocal
+
+    with engine.begin() as conn:
+        created = not inspect(conn).has_table(MarketPriceRollup.__tablename__)
+        MarketPriceRollup.__table__.create(conn, checkfirst=True)
+        for index in MarketPrice.__table__.indexes:
+            index.create(conn, checkfirst=True)
+
+    if created:
+        db = SessionLocal()
+        try:
+            rebuild_price_rollups(db)
+        finally:
+            db.close()
+
+
 cfg = Config()
 origins = cfg.CORS_ORIGINS
 
@@ -118,6 +308,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-History-Resolution"],
 )
 # ------------------------------------
 
@@ -441,6 +632,12 @@ def update_user_me(payload: UpdateUserRequest, db: Session = Depends(get_db), cu
     for key, value in update_data.items():
         setattr(current, key, value)
     db.commit()
+    if 'discord_portfolio_webhook_url' in update_data or 'discord_portfolio_notification_time' in update_data:
+        on_notification_settings_changed(
+            current.user_id,
+            current.discord_portfolio_webhook_url,
+            current.discord_portfolio_notification_time,
+        )
     return user_to_schema(current)
 
 class SearchResponseItem(BaseModel):
@@ -477,31 +674,68 @@ def to_search_item(itm: Item) -> SearchResponseItem:
         max_float=itm.max_float,
     )
 
-def _list_unique_items_by_type(item_type: str, q: str | None, db: Session, limit: int | None = None, offset: int = 0):
+def _use_search_index() -> bool:
+    return cfg.SEARCH_BACKEND == "memory" and catalog_index.is_ready
+
+
+CATALOG_PAGE_SIZE = 100
+
+
+def _encode_cursor(name: str) -> str:
+    return base64.urlsafe_b64encode(name.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> str:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        return base64.b64decode(padded.encode("ascii"), altchars=b"-_", validate=True).decode("utf-8")
+    except (ValueError, UnicodeError):
+        raise HTTPException(status_code=400, detail="Neplatný cursor")
+
+
+def _list_unique_items_by_type(
+    item_type: str,
+    q: str | None,
+    db: Session,
+    limit: int | None = None,
+    offset: int = 0,
+    cursor: str | None = None,
+    response: Response | None = None,
+):
+    """
+    Catalog listing deduplicated by name. Without q the list is ordered by name
+    and can be walked with keyset pagination: pass limit, then the value of the
+    X-Next-Cursor response header as cursor for the next page. Without limit
+    and cursor the whole list is returned (old behaviour).
+    """
     repo = ItemRepository(db)
     safe_offset = max(0, offset)
     safe_limit = max(1, min(limit, 2000)) if limit is not None else None
 
     if q:
-        fetch_limit = (safe_offset + safe_limit) if safe_limit is not None else 10_000_000
-        items = [r for r in repo.search_items(q, limit=fetch_limit) if r.item_type == item_type]
-    else:
-        if safe_limit is None:
-            items = repo.get_items(item_type=item_type, limit=10_000_000, offset=0)
+        fetch_limit = safe_limit if safe_limit is not None else 10_000_000
+        if _use_search_index():
+            items = catalog_index.search(q, limit=fetch_limit, offset=safe_offset, item_type=item_type)
         else:
-            items = repo.get_items(item_type=item_type, limit=safe_limit, offset=safe_offset)
-
-    seen = set()
-    unique = []
-    for item in items:
-        if item.name not in seen:
-            seen.add(item.name)
-            unique.append(item)
-
-    if q and safe_limit is not None:
-        unique = unique[safe_offset:safe_offset + safe_limit]
+            items = repo.search_items(q, limit=fetch_limit, offset=safe_offset, item_type=item_type)
+        return [to_search_item(item) for item in items]
+
+    after_name = _decode_cursor(cursor) if cursor else None
+    if after_name is not None and safe_limit is None:
+        safe_limit = CATALOG_PAGE_SIZE
+    items = repo.list_unique_items_by_type(
+        item_type,
+        # one extra row tells whether there is a next page
+        limit=safe_limit + 1 if safe_limit is not None else None,
+        offset=0 if after_name is not None else safe_offset,
+        after_name=after_name,
+    )
+    if safe_limit is not None and len(items) > safe_limit:
+        items = items[:safe_limit]
+        if response is not None:
+            response.headers["X-Next-Cursor"] = _encode_cursor(items[-1].name)
 
-    return [to_search_item(item) for item in unique]
+    return [to_search_item(item) for item in items]
 
 @app.get("/search")
 def search_items(
@@ -514,32 +748,56 @@ def search_items(
     client_ip = get_client_ip(request)
     _enforce_limit(search_rate_limiter, f"search:ip:{client_ip}", limit=120, window_seconds=60, detail="Too many search requests")
 
-    repo = ItemRepository(db)
-    results = repo.search_items(q.strip(), limit=limit, exclude_types=exclude_item_type)
+    # Answered from the in-memory index unless SEARCH_BACKEND=db (or it is not built yet).
+    if _use_search_index():
+        results = catalog_index.search(q.strip(), limit=limit, exclude_types=exclude_item_type)
+    else:
+        repo = ItemRepository(db)
+        results = repo.search_items(q.strip(), limit=limit, exclude_types=exclude_item_type)
     return [to_search_item(r) for r in results]
 
 # ----------- Knives & Gloves listing/search -----------
 @app.get("/knives")
-def list_knives(q: str | None = None, db: Session = Depends(get_db)):
-    return _list_unique_items_by_type('knife', q, db)
+def list_knives(
+    response: Response,
+    q: str | None = None,
+    limit: int | None = Query(None, ge=1, le=2000),
+    cursor: str | None = None,
+    db: Session = Depends(get_db),
+):
+    return _list_unique_items_by_type('knife', q, db, limit=limit, cursor=cursor, response=response)
 
 @app.get("/gloves")
-def list_gloves(q: str | None = None, db: Session = Depends(get_db)):
-    return _list_unique_items_by_type('glove', q, db)
+def list_gloves(
+    response: Response,
+    q: str | None = None,
+    limit: int | None = Query(None, ge=1, le=2000),
+    cursor: str | None = None,
+    db: Session = Depends(get_db),
+):
+    return _list_unique_items_by_type('glove', q, db, limit=limit, cursor=cursor, response=response)
 
 # ----------- Agents listing/search -----------
 @app.get("/agents")
-def list_agents(q: str | None = None, db: Session = Depends(get_db)):
-    return _list_unique_items_by_type('agent', q, db)
+def list_agents(
+    response: Response,
+    q: str | None = None,
+    limit: int | None = Query(None, ge=1, le=2000),
+    cursor: str | None = None,
+    db: Session = Depends(get_db),
+):
+    return _list_unique_items_by_type('agent', q, db, limit=limit, cursor=cursor, response=response)
 
 @app.get("/weapons")
 def list_weapons(
+    response: Response,
     q: str | None = None,
     limit: int | None = Query(None, ge=1, le=2000),
     offset: int = Query(0, ge=0),
+    cursor: str | None = None,
     db: Session = Depends(get_db),
 ):
-    return _list_unique_items_by_type('skin', q, db, limit=limit, offset=offset)
+    return _list_unique_items_by_type('skin', q, db, limit=limit, offset=offset, cursor=cursor, response=response)
 
 @app.get("/")
 def read_root():
@@ -561,6 +819,56 @@ def get_my_user_item_history(db: Session = Depends(get_db), current: User = Depe
     repo = ItemRepository(db)
     return repo.get_user_item_history(current.user_id)
 
+@app.get("/export/{dataset}")
+def export_my_data(
+    dataset: str,
+    format: str = Query("csv", pattern="^(csv|ndjson|parquet|arrow)$"),
+    item: Optional[str] = Query(None, description="slug itemu; bez něj celé portfolio"),
+    window: Optional[str] = Query(None, description="např. 7d, 1y nebo all (trades, prices)"),
+    db: Session = Depends(get_db),
+    current: User = Depends(get_current_user),
+):
+    """
+    Streamovaný export portfolia (`portfolio`), prodejů (`trades`) nebo cenové
+    historie držených itemů (`prices`) jako CSV, NDJSON, Parquet nebo Arrow.
+    """
+    if dataset not in EXPORT_DATASETS:
+        raise HTTPException(status_code=404, detail="Neznámý export")
+    if export_needs_pyarrow(format) and not pyarrow_available():
+        raise HTTPException(status_code=501, detail="Export do Parquet/Arrow vyžaduje balíček pyarrow")
+    try:
+        window_delta = parse_window(window)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    item_id = None
+    if item:
+        itm = ItemRepository(db).get_item_by_slug(item)
+        if not itm:
+            raise HTTPException(status_code=404, detail="Item nenalezen")
+        item_id = itm.item_id
+    since = datetime.datetime.now() - window_delta if window_delta is not None else None
+
+    media_type, _ = EXPORT_FORMATS[format]
+    return StreamingResponse(
+        stream_export(dataset, format, current.user_id, item_id=item_id, since=since),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{export_filename(dataset, format)}"'},
+    )
+
+@app.get("/useritemhistory/summary")
+def get_my_realized_pnl(
+    top: int = Query(50, ge=1, le=1000),
+    db: Session = Depends(get_db),
+    current: User = Depends(get_current_user),
+):
+    """
+    Realizovaný zisk z prodaných položek: souhrn, po měsících a po itemech
+    (nejvýše `top` itemů seřazených podle zisku), včetně poplatků.
+    """
+    summary = ItemRepository(db).get_realized_pnl(current.user_id)
+    return {**summary, "per_item": summary["per_item"][:top]}
+
 @app.post("/useritemhistory")
 def create_user_item_history(payload: CreateUserItemHistoryRequest, db: Session = Depends(get_db), current: User = Depends(get_current_user)):
     repo = ItemRepository(db)
@@ -704,10 +1012,27 @@ def update_user_item(user_item_id: int, payload: UpdateUserItemRequest, db: Sess
         raise HTTPException(status_code=404, detail="User item nenalezen")
     return updated
 
-@app.post("/refresh-portfolio/{user_id}")
-def refresh_portfolio(user_id: int, request: Request, db: Session = Depends(get_db), current: User = Depends(get_current_user)):
+def _run_portfolio_refresh_job(user_id: int, job) -> None:
+    db = SessionLocal()
+    try:
+        PriceService(db, get_market_strategy()).update_portfolio_prices(user_id, progress=job)
+    finally:
+        db.close()
+
+
+def _run_items_refresh_job(item_type: str | None, job) -> None:
+    db = SessionLocal()
+    try:
+        # Listing snapshots, a page at a time, instead of one request per item
+        build_catalog_ingest(db).run(item_type=item_type, progress=job)
+    finally:
+        db.close()
+
+
+@app.post("/refresh-portfolio/{user_id}", status_code=202)
+def refresh_portfolio(user_id: int, request: Request, current: User = Depends(get_current_user)):
     """
-    Spustí aktualizaci cen z CSFloat.
+    Spustí aktualizaci cen z CSFloat na pozadí. Průběh lze sledovat přes GET /jobs/{job_id}.
     """
     if user_id != current.user_id:
         raise HTTPException(status_code=403, detail="Forbidden")
@@ -720,39 +1045,127 @@ def refresh_portfolio(user_id: int, request: Request, db: Session = Depends(get_
         detail="Too many portfolio refresh requests",
     )
 
-    strategy = CSFloatStrategy()
-    service = PriceService(db, strategy)
-    try:
-        updated_items = service.update_portfolio_prices(user_id)
-        return {
-            "message": "Portfolio úspěšně aktualizováno!", 
-            "source": "CSFloat API",
-            "changes": updated_items
-        }
-    except Exception:
-        raise HTTPException(status_code=500, detail="Portfolio refresh failed")
+    job, created = refresh_jobs.submit(
+        "portfolio",
+        f"portfolio:{user_id}",
+        lambda job: _run_portfolio_refresh_job(user_id, job),
+        owner_user_id=user_id,
+    )
+    return {
+        "message": "Aktualizace portfolia spuštěna." if created else "Aktualizace portfolia již probíhá.",
+        "source": "CSFloat API",
+        "job_id": job.job_id,
+        "status": job.status,
+        "coalesced": not created,
+    }
     
     
+@app.get("/portfolio-totals/{user_id}")
+def get_portfolio_totals(user_id: int, db: Session = Depends(get_db), current: User = Depends(get_current_user)):
+    """
+    Souhrn portfolia (investováno, hodnota, zisk) z průběžně vedených součtů.
+    """
+    if user_id != current.user_id:
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+    return ItemRepository(db).get_portfolio_totals(user_id)
+
+
+@app.get("/fx-rates")
+def get_fx_rates():
+    """
+    Kurzy USD -> měna sdílené celým backendem (obnovuje je scheduler).
+    """
+    updated_at = fx_rates.updated_at
+    return {
+        "base": "USD",
+        "rates": fx_rates.rates(),
+        "updated_at": updated_at.isoformat() if updated_at else None,
+    }
+
+
+@app.get("/analytics/{user_id}")
+def get_portfolio_analytics(
+    user_id: int,
+    window: Optional[str] = Query("1y", description="např. 30d, 6m, 1y nebo all"),
+    top: int = Query(10, ge=1, le=50),
+    db: Session = Depends(get_db),
+    current: User = Depends(get_current_user),
+):
+    """
+    Výnos (časově i peněžně vážený), volatilita, max. drawdown, korelace a
+    příspěvky položek k výnosu aktuálního portfolia za zvolené období.
+    """
+    if user_id != current.user_id:
+        raise HTTPException(status_code=403, detail="Forbidden")
+    try:
+        window_delta = parse_window(window)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    result = compute_portfolio_analytics(db, user_id, window=window_delta, top=top)
+    if result is None:
+        return {"message": "Tento uživatel nemá žádné položky nebo neexistuje."}
+    return result
+
+
 @app.get("/portfolio-history/{user_id}")
-def get_portfolio_history(user_id: int, db: Session = Depends(get_db), current: User = Depends(get_current_user)):
+def get_portfolio_history(
+    user_id: int,
+    response: Response,
+    window: Optional[str] = Query(None, description="např. 24h, 7d, 1m, 1y nebo all"),
+    resolution: Optional[str] = Query(None, pattern="^(5m|hour|day)$"),
+    limit: int = Query(500, ge=1, le=2000),
+    db: Session = Depends(get_db),
+    current: User = Depends(get_current_user),
+):
     """
-    Vrátí historická data pro graf (hodnota portfolia v čase).
+    Vrátí historická data pro graf (hodnota portfolia v čase), převzorkovaná
+    na nejjemnější rozlišení, které se vejde do `limit` bodů.
     """
     if user_id != current.user_id:
         raise HTTPException(status_code=403, detail="Forbidden")
 
-    repo = ItemRepository(db)
-    history_records = db.query(PortfolioHistory).filter(
-        PortfolioHistory.user_id == user_id
-    ).order_by(PortfolioHistory.timestamp.asc()).all()
-    if not history_records:
+    try:
+        window_delta = parse_window(window)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    used_resolution, points = get_portfolio_history_points(
+        db,
+        user_id,
+        window=window_delta,
+        max_points=limit,
+        resolution=resolution,
+    )
+    if not points:
         return {"message": "Historie nenalezena."}
 
-    return history_records
+    response.headers["X-History-Resolution"] = used_resolution
+    return points
+
+
+def _catalog_response(request: Request, key: str, builder) -> Response:
+    """
+    Serves a catalog view from the read model. A matching If-None-Match is
+    answered with 304 before any DB or serialization work.
+    """
+    cached = catalog_read_model.get(key, builder)
+    if etag_matches(request.headers.get("if-none-match"), cached.etag):
+        return Response(status_code=304, headers={"ETag": cached.etag, "Cache-Control": "no-cache"})
+    return Response(
+        content=cached.body,
+        media_type="application/json",
+        headers={"ETag": cached.etag, "Cache-Control": "no-cache"},
+    )
 
 
 @app.get("/cases")
-def get_cases(db: Session = Depends(get_db)):
+def get_cases(request: Request, db: Session = Depends(get_db)):
+    return _catalog_response(request, "cases", lambda: _build_cases(db))
+
+
+def _build_cases(db: Session):
     from sqlalchemy.orm import joinedload
     items = db.query(Item).filter(Item.item_type == 'case').options(
         joinedload(Item.collection_item)
@@ -775,46 +1188,37 @@ def get_cases(db: Session = Depends(get_db)):
 
 
 @app.get("/cases/{slug}")
-def get_case_detail(slug: str, db: Session = Depends(get_db)):
+def get_case_detail(slug: str, request: Request, db: Session = Depends(get_db)):
+    return _catalog_response(request, f"cases/{slug}", lambda: _build_case_detail(db, slug))
+
+
+def _build_case_detail(db: Session, slug: str):
     repo = ItemRepository(db)
     case = repo.get_case_by_slug(slug)
     if not case:
         raise HTTPException(status_code=404, detail="Case nenalezena")
-    skins = repo.get_case_items_by_types(case.item_id, ["skin"])
-    # Include explicit knives plus any skin entries marked with knife-like rarity
-    knives_explicit = repo.get_case_items_by_types(case.item_id, ["knife"])  
-    gloves_explicit = repo.get_case_items_by_types(case.item_id, ["glove"]) 
-    # Fallback classification to be robust against data changes
-    knife_like_from_skins = [s for s in skins if (s.rarity or "").lower() in ("knife", "knife/glove")]
-    glove_like_from_skins = [s for s in skins if (s.rarity or "").lower() in ("glove", "knife/glove")]
-    # Deduplicate by item_id
-    def dedupe(arr):
-        seen = set()
-        out = []
-        for x in arr:
-            if x.item_id in seen:
-                continue
-            seen.add(x.item_id)
-            out.append(x)
-        return out
-    knives = dedupe(knives_explicit + knife_like_from_skins)
-    gloves = dedupe(gloves_explicit + glove_like_from_skins)
+    # Skins / knives / gloves (incl. knife-like rarities) are bucketed in CASEMEMBERSHIP
+    contents = repo.get_case_contents(case.item_id)
     return {
         "case": case,
-        "skins": skins,
-        "knives": knives,
-        "gloves": gloves,
+        "skins": contents["skin"],
+        "knives": contents["knife"],
+        "gloves": contents["glove"],
     }
 
 
 @app.get("/collections")
-def get_collections(db: Session = Depends(get_db)):
+def get_collections(request: Request, db: Session = Depends(get_db)):
     repo = ItemRepository(db)
-    return repo.get_items(item_type='collection', limit=500)
+    return _catalog_response(request, "collections", lambda: repo.get_items(item_type='collection', limit=500))
 
 
 @app.get("/collections/{slug}")
-def get_collection_detail(slug: str, db: Session = Depends(get_db)):
+def get_collection_detail(slug: str, request: Request, db: Session = Depends(get_db)):
+    return _catalog_response(request, f"collections/{slug}", lambda: _build_collection_detail(db, slug))
+
+
+def _build_collection_detail(db: Session, slug: str):
     repo = ItemRepository(db)
     coll = repo.get_collection_by_slug(slug)
     if not coll:
@@ -826,19 +1230,16 @@ def get_collection_detail(slug: str, db: Session = Depends(get_db)):
     }
 
 
-@app.post("/refresh-items")
+@app.post("/refresh-items", status_code=202)
 def refresh_items(
     request: Request,
     item_type: str | None = None,
-    db: Session = Depends(get_db),
     current: User = Depends(get_current_user),
 ):
     """
-    Aktualizuje ceny pro daný typ itemů (např. item_type='case' nebo 'skin').
+    Aktualizuje ceny pro daný typ itemů (např. item_type='case' nebo 'skin') na pozadí.
     Pokud není zadán item_type, zkusí aktualizovat všechny relevantní typy.
     """
-    strategy = CSFloatStrategy()
-    service = PriceService(db, strategy)
     _enforce_limit(
         refresh_rate_limiter,
         f"refresh-items:user:{current.user_id}:{item_type or 'all'}",
@@ -847,27 +1248,40 @@ def refresh_items(
         detail="Too many items refresh requests",
     )
 
-    try:
-        updated = service.update_items_prices(item_type=item_type)
-        return {
-            "message": "Ceny položek aktualizovány!",
-            "item_type": item_type or "all",
-            "count": len(updated),
-            "changes": updated,
-        }
-    except Exception:
-        raise HTTPException(status_code=500, detail="Items refresh failed")
+    job, created = refresh_jobs.submit(
+        "items",
+        f"items:{item_type or 'all'}",
+        lambda job: _run_items_refresh_job(item_type, job),
+    )
+    return {
+        "message": "Aktualizace cen spuštěna." if created else "Aktualizace cen již probíhá.",
+        "item_type": item_type or "all",
+        "job_id": job.job_id,
+        "status": job.status,
+        "coalesced": not created,
+    }
+
+
+@app.get("/jobs/{job_id}")
+def get_refresh_job(job_id: str, include_results: bool = True, current: User = Depends(get_current_user)):
+    """
+    Stav úlohy spuštěné přes /refresh-portfolio nebo /refresh-items.
+    """
+    job = refresh_jobs.get(job_id)
+    if not job or (job.owner_user_id is not None and job.owner_user_id != current.user_id):
+        raise HTTPException(status_code=404, detail="Job nenalezen")
+    return job.to_dict(include_results=include_results)
 
 
 @app.post("/useritems/{user_item_id}/refresh")
-def refresh_user_item_price(user_item_id: int, db: Session = Depends(get_db), current: User = Depends(get_current_user)):
+async def refresh_user_item_price(user_item_id: int, db: Session = Depends(get_db), current: User = Depends(get_current_user)):
     """
     Refresh price for a specific UserItem (taking wear/float into account).
     """
-    strategy = CSFloatStrategy()
+    strategy = get_async_market_strategy()
     service = PriceService(db, strategy)
     try:
-        updated = service.update_specific_user_item_price(user_item_id, current.user_id)
+        updated = await service.aupdate_specific_user_item_price(user_item_id, current.user_id)
         if not updated:
              # If update returns None (not found or error fetching), return a 404 or 400
              # raising 404 is okay, but user will get an error in frontend.
@@ -880,12 +1294,12 @@ def refresh_user_item_price(user_item_id: int, db: Session = Depends(get_db), cu
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/items/{item_id}/refresh")
-def refresh_single_item(item_id: int, request: Request, db: Session = Depends(get_db), current: User = Depends(get_current_user)):
+async def refresh_single_item(item_id: int, request: Request, db: Session = Depends(get_db), current: User = Depends(get_current_user)):
     """
     Refresh price for a single item.
     """
-    strategy = CSFloatStrategy()
-    service = PriceService(db, strategy)
+    registry = get_market_registry()
+    service = PriceService(db, get_async_market_strategy())
     _enforce_limit(
         refresh_rate_limiter,
         f"refresh-single:user:{current.user_id}:{item_id}",
@@ -895,7 +1309,8 @@ def refresh_single_item(item_id: int, request: Request, db: Session = Depends(ge
     )
 
     try:
-        updated = service.update_single_item_price(item_id)
+        # Every registered market at once; the lowest price becomes the item's price
+        updated = await service.aupdate_single_item_price_all_markets(item_id, registry)
         if not updated:
             raise HTTPException(status_code=404, detail="Item not found")
         return updated
@@ -1037,7 +1452,11 @@ def infer_rarity_index(rarity: str | None, item_type: str | None = None) -> int:
 
 
 @app.get("/items/{slug}")
-def get_item_detail(slug: str, db: Session = Depends(get_db)):
+def get_item_detail(slug: str, request: Request, db: Session = Depends(get_db)):
+    return _catalog_response(request, f"items/{slug}", lambda: _build_item_detail(db, slug))
+
+
+def _build_item_detail(db: Session, slug: str):
     repo = ItemRepository(db)
     itm = repo.get_item_by_slug(slug)
     if not itm:
@@ -1067,26 +1486,37 @@ def get_item_detail(slug: str, db: Session = Depends(get_db)):
     }
 
 @app.get("/items/{slug}/history")
-def get_item_price_history(slug: str, limit: int = Query(200, ge=1, le=1000), db: Session = Depends(get_db)):
+def get_item_price_history(
+    slug: str,
+    limit: int = Query(200, ge=1, le=1000),
+    window: Optional[str] = Query(None, description="např. 24h, 7d, 6m, 1y nebo all"),
+    resolution: Optional[str] = Query(None, pattern="^(raw|hour|day)$"),
+    db: Session = Depends(get_db),
+):
     """
-    Vrátí poslední záznamy cen pro daný item (case/skin) seřazené podle času.
+    Vrátí historii cen pro daný item (case/skin) seřazenou podle času.
+    Bez parametru window posledních `limit` záznamů; s window se pro delší
+    období čtou hodinové/denní OHLC agregace (nejvýše `limit` bodů).
     """
     repo = ItemRepository(db)
     itm = repo.get_item_by_slug(slug)
     if not itm:
         raise HTTPException(status_code=404, detail="Item nenalezen")
-    prices = (
-        db.query(MarketPrice)
-        .filter(MarketPrice.item_id == itm.item_id)
-        .order_by(MarketPrice.timestamp.asc())
-        .all()
+    try:
+        window_delta = parse_window(window)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if window is not None and window_delta is None and resolution is None:
+        resolution = "day"
+
+    used_resolution, result = get_price_history(
+        db,
+        itm.item_id,
+        window=window_delta,
+        max_points=limit,
+        resolution=resolution,
     )
-    # Zredukuj výstup na pole {timestamp, price}
-    result = [
-        {"timestamp": p.timestamp.isoformat(), "price": float(p.price)}
-        for p in prices[-limit:]
-    ]
-    return {"item_id": itm.item_id, "slug": slug, "history": result}
+    return {"item_id": itm.item_id, "slug": slug, "resolution": used_resolution, "history": result}
 
 # CSFloat API Key Management
 
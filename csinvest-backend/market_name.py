@@ -0,0 +1,123 @@
+import math
+import re
+
+# "Phase 2", "Sapphire", ... anywhere in a market name
+PHASE_RE = re.compile(r"(Phase\s\d+|Sapphire|Ruby|Black Pearl|Emerald)", re.IGNORECASE)
+
+# "(Field-Tested)" etc. in a market name
+WEAR_RE = re.compile(r"\s*\((Factory New|Minimal Wear|Field-Tested|Well-Worn|Battle-Scarred)\)")
+
+# Item types whose market name carries wear / StatTrak™ / ★ / phase
+WEARABLE_TYPES = ("skin", "knife", "glove")
+STAR_TYPES = ("knife", "glove")
+
+
+def calculate_wear(float_value: float) -> str | None:
+    if float_value is None:
+        return None
+    
+    # Ensure float is treated as a number
+    try:
+        val = float(float_value)
+    except (ValueError, TypeError):
+        return None
+
+    if val < 0.07:
+        return "Factory New"
+    elif val < 0.15:
+        return "Minimal Wear"
+    elif val < 0.38:
+        return "Field-Tested"
+    elif val < 0.45:
+        return "Well-Worn"
+    else:
+        return "Battle-Scarred"
+
+
+def split_phase(name: str) -> tuple[str, str | None]:
+    """
+    "★ Karambit | Doppler (Factory New) Phase 2"
+    -> ("★ Karambit | Doppler (Factory New)", "Phase 2")
+    """
+    match = PHASE_RE.search(name)
+    if not match:
+        return name, None
+    phase = match.group(0)
+    return " ".join(name.replace(phase, "").split()), phase
+
+
+def catalog_name(market_hash_name: str) -> str:
+    """
+    ITEM.name of a market name, without wear and ★:
+    "★ Karambit | Doppler (Factory New)" -> "Karambit | Doppler"
+    """
+    name = WEAR_RE.sub("", market_hash_name).strip()
+    if name.startswith("★"):
+        name = name[1:].strip()
+    return name
+
+
+def float_ceiling(float_value) -> float | None:
+    # 0.091512 -> 0.10, 0.141535 -> 0.15: listings up to the next 0.01
+    if float_value is None:
+        return None
+    try:
+        return math.ceil(float(float_value) * 100) / 100.0
+    except (TypeError, ValueError):
+        return None
+
+
+def build_market_name(item_name: str, item_type: str | None, wear: str | None, variant: str | None, phase: str | None) -> str:
+    """Full market name, e.g. "★ StatTrak™ Karambit | Doppler (Factory New) Phase 2"."""
+    if item_type not in WEARABLE_TYPES:
+        return item_name
+    name = f"{item_name} ({wear})" if wear else item_name
+    if variant:
+        name = f"{variant} {name}"
+    if item_type in STAR_TYPES and not name.startswith("★"):
+        name = f"★ {name}"
+    if phase:
+        name = f"{name} {phase}"
+    return name.strip()
+
+
+def resolve_user_item(item, wear: str | None, variant: str | None, phase: str | None, float_value) -> dict:
+    """USERITEM market_* columns: CSFloat market_hash_name, phase filter and float range."""
+    item_type = getattr(item, "item_type", None)
+    market_name = build_market_name(item.name, item_type, wear, variant, phase)
+    market_hash_name, market_phase = split_phase(market_name)
+    max_float = float_ceiling(float_value) if item_type in WEARABLE_TYPES else None
+    return {
+        "market_hash_name": market_hash_name,
+        "market_phase": market_phase,
+        "market_min_float": 0.0 if max_float is not None else None,
+        "market_max_float": max_float,
+    }
+
+
+def apply_market_fields(rec, item) -> None:
+    """Recomputes the stored market_* columns of a UserItem (call on every write)."""
+    # Rows from before wear was derived on write only have the float
+    wear = rec.wear or calculate_wear(rec.float_value)
+    for key, value in resolve_user_item(item, wear, rec.variant, rec.phase, rec.float_value).items():
+        setattr(rec, key, value)
+
+
+def user_item_query(rec) -> dict:
+    """CSFloat query straight from the stored columns."""
+    return {
+        "market_name": rec.market_hash_name,
+        "phase": rec.market_phase,
+        "min_float": float(rec.market_min_float) if rec.market_min_float is not None else None,
+        "max_float": float(rec.market_max_float) if rec.market_max_float is not None else None,
+    }
+
+
+def item_query(item) -> dict:
+    # Catalog rows have no wear / variant, the catalog name is the market name
+    return {"market_name": item.name, "phase": None, "min_float": None, "max_float": None}
+
+
+def display_name(query: dict) -> str:
+    phase = query.get("phase")
+    return f"{query['market_name']} {phase}" if phase else query["market_name"]
@@ -0,0 +1,204 @@
+import asyncio
+import random
+import threading
+import zlib
+from config import Config
+from strategy import IAsyncMarketStrategy
+from fetch_engine import pool_for_api_key
+from price_cache import get_async_market_strategy
+
+# MARKET.market_id of the built-in markets
+CSFLOAT_MARKET_ID = 2
+
+
+class FakeMarketStrategy(IAsyncMarketStrategy):
+    """
+    Offline market for load-testing the fan-out: answers after a random
+    latency (with an occasional slow tail and failures) with a price derived
+    from the query, so repeated runs see the same prices.
+    """
+
+    def __init__(
+        self,
+        latency_ms: float = 150.0,
+        tail_probability: float = 0.05,
+        tail_factor: float = 10.0,
+        failure_rate: float = 0.0,
+        price_factor: float = 1.0,
+        seed: int | None = None,
+    ) -> None:
+        self.latency_ms = max(0.0, float(latency_ms))
+        self.tail_probability = tail_probability
+        self.tail_factor = tail_factor
+        self.failure_rate = failure_rate
+        self.price_factor = price_factor
+        self._random = random.Random(seed)
+        self.calls = 0
+
+    async def fetch_price(self, skin_name: str, min_float: float = None, max_float: float = None, api_key: str = None, phase: str = None) -> dict:
+        self.calls += 1
+        latency = self.latency_ms * self._random.uniform(0.5, 1.5)
+        if self._random.random() < self.tail_probability:
+            latency *= self.tail_factor
+        await asyncio.sleep(latency / 1000.0)
+        if self._random.random() < self.failure_rate:
+            return None
+        key = f"{skin_name}|{phase or ''}|{min_float}|{max_float}".encode("utf-8")
+        cents = 100 + zlib.crc32(key) % 100000
+        return {
+            "success": True,
+            "price_cents_usd": int(cents * self.price_factor),
+            "item_name": skin_name,
+            "market_name": "Fake",
+        }
+
+
+class RegisteredMarket:
+    def __init__(
+        self,
+        market_id: int,
+        name: str,
+        strategy: IAsyncMarketStrategy,
+        timeout_seconds: float,
+        hedge_after_seconds: float = 0.0,
+        csfloat_keys: bool = False,
+    ) -> None:
+        self.market_id = market_id
+        self.name = name
+        self.strategy = strategy
+        self.timeout_seconds = timeout_seconds
+        # 0 = no hedged second request
+        self.hedge_after_seconds = hedge_after_seconds
+        # Requests spend tokens of the shared CSFloat API key pools
+        self.csfloat_keys = csfloat_keys
+
+
+class MarketRegistry:
+    """
+    Queries every registered market for one item concurrently. Each market
+    has its own timeout; a market that has not answered hedge_after_seconds
+    after its request went out gets a second (hedged) request and the first
+    answer wins. Markets on the CSFloat key pools hedge only when a token is
+    free right away. fetch() returns once min_results markets answered
+    (default: all) or every market finished / timed out.
+    """
+
+    def __init__(self, min_results: int = 0) -> None:
+        self.min_results = max(0, int(min_results))
+        self._markets: dict[int, RegisteredMarket] = {}
+
+    def register(self, market: RegisteredMarket) -> None:
+        self._markets[market.market_id] = market
+
+    @property
+    def markets(self) -> list[RegisteredMarket]:
+        return list(self._markets.values())
+
+    async def _attempt(self, market: RegisteredMarket, query: dict, key: str | None):
+        try:
+            return await market.strategy.fetch_price(
+                query["market_name"],
+                min_float=query.get("min_float"),
+                max_float=query.get("max_float"),
+                api_key=key,
+                phase=query.get("phase"),
+            )
+        except Exception as e:
+            print(f"[MarketRegistry] {market.name}: chyba při stahování {query.get('market_name')}: {e}")
+            return None
+
+    async def _fetch_market(self, market: RegisteredMarket, query: dict, api_key: str | None):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + market.timeout_seconds
+        key = api_key
+        if market.csfloat_keys:
+            key, wait = pool_for_api_key(api_key).reserve()
+            if wait >= deadline - loop.time():
+                print(f"[MarketRegistry] {market.name}: timeout po {market.timeout_seconds}s (čekání na API klíč)")
+                return None
+            if wait > 0:
+                await asyncio.sleep(wait)
+        # The hedge timer covers only the network call, not the wait for a token
+        hedge_at = loop.time() + market.hedge_after_seconds if market.hedge_after_seconds > 0 else None
+        attempts = {asyncio.ensure_future(self._attempt(market, query, key))}
+        hedged = False
+        try:
+            while attempts:
+                now = loop.time()
+                if now >= deadline:
+                    print(f"[MarketRegistry] {market.name}: timeout po {market.timeout_seconds}s")
+                    return None
+                wake = deadline if hedged or hedge_at is None else min(deadline, hedge_at)
+                done, attempts = await asyncio.wait(attempts, timeout=max(0.0, wake - now), return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    result = task.result()
+                    if result:
+                        return result
+                # A failed or slow first attempt gets one hedged request
+                if not hedged and hedge_at is not None and (done or loop.time() >= hedge_at):
+                    hedged = True
+                    hedge_key, free = key, True
+                    if market.csfloat_keys:
+                        # Only with a token free right now: no hedging while the keys are rate limited
+                        hedge_key, free = pool_for_api_key(api_key).try_reserve()
+                    if free:
+                        attempts.add(asyncio.ensure_future(self._attempt(market, query, hedge_key)))
+            return None
+        finally:
+            for task in attempts:
+                task.cancel()
+
+    async def fetch(self, query: dict, api_key: str | None = None, min_results: int | None = None) -> dict[int, dict]:
+        """market_id -> raw strategy result for the markets that answered."""
+        if not self._markets:
+            return {}
+        need = min_results if min_results is not None else self.min_results
+        need = min(need or len(self._markets), len(self._markets))
+        tasks = {
+            asyncio.ensure_future(self._fetch_market(market, query, api_key)): market.market_id
+            for market in self._markets.values()
+        }
+        results = {}
+        pending = set(tasks)
+        try:
+            while pending and len(results) < need:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    raw = task.result()
+                    if raw:
+                        results[tasks[task]] = raw
+        finally:
+            for task in pending:
+                task.cancel()
+        return results
+
+
+_registry: MarketRegistry | None = None
+_registry_lock = threading.Lock()
+
+
+def get_market_registry() -> MarketRegistry:
+    """CSFloat (async, behind the price cache) plus the fake market when FAKE_MARKET_ENABLED."""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            cfg = Config()
+            registry = MarketRegistry(min_results=cfg.MARKET_MIN_RESULTS)
+            registry.register(RegisteredMarket(
+                CSFLOAT_MARKET_ID,
+                "CSFloat",
+                get_async_market_strategy(),
+                timeout_seconds=cfg.MARKET_TIMEOUT_SECONDS,
+                hedge_after_seconds=cfg.MARKET_HEDGE_AFTER_SECONDS,
+                csfloat_keys=True,
+            ))
+            if cfg.FAKE_MARKET_ENABLED:
+                registry.register(RegisteredMarket(
+                    cfg.FAKE_MARKET_ID,
+                    "Fake market",
+                    FakeMarketStrategy(latency_ms=cfg.FAKE_MARKET_LATENCY_MS),
+                    timeout_seconds=cfg.MARKET_TIMEOUT_SECONDS,
+                    hedge_after_seconds=cfg.MARKET_HEDGE_AFTER_SECONDS,
+                ))
+            _registry = registry
+        return _registry
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Numeric, Date, DateTime, ForeignKey, Boolean
+from sqlalchemy import Column, Integer, String, Numeric, Date, DateTime, ForeignKey, Boolean, Index
 from sqlalchemy.orm import relationship
 from database import Base
 import datetime
@@ -52,11 +52,31 @@ class Item(Base):
     case = relationship("Item", remote_side=[item_id], foreign_keys=[case_id], uselist=False)
     collection_item = relationship("Item", remote_side=[item_id], foreign_keys=[collection_id], uselist=False)
 
+    __table_args__ = (
+        Index("ix_item_type_name", "item_type", "name"),
+        # Catalog refresh queue: oldest prices first
+        Index("ix_item_last_update", "last_update"),
+    )
+
+class CaseMembership(Base):
+    """
+    Denormalized case contents: which skins/knives/gloves drop from a case,
+    bucketed once when the catalog is (re)loaded. One item can sit in more
+    buckets (a skin with rarity 'knife' is listed as skin and knife).
+    """
+    __tablename__ = "CASEMEMBERSHIP"
+    case_id = Column(Integer, ForeignKey("ITEM.item_id"), primary_key=True)
+    bucket = Column(String(8), primary_key=True)
+    item_id = Column(Integer, ForeignKey("ITEM.item_id"), primary_key=True)
+    sort_order = Column(Integer, nullable=False, default=0)
+
+    item = relationship("Item", foreign_keys=[item_id])
+
 class UserItem(Base):
     __tablename__ = "USERITEM"
     user_item_id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("USER.user_id"))
-    item_id = Column(Integer, ForeignKey("ITEM.item_id"))
+    user_id = Column(Integer, ForeignKey("USER.user_id"), index=True)
+    item_id = Column(Integer, ForeignKey("ITEM.item_id"), index=True)
     amount = Column(Integer, default=1)
     float_value = Column(Numeric(10, 8))
     pattern = Column(Integer)
@@ -69,6 +89,11 @@ class UserItem(Base):
     discord_webhook_url = Column(String)
     variant = Column(String) # For 'StatTrak™' or 'Souvenir'
     phase = Column(String)   # For Doppler phases
+    # CSFloat query, resolved by market_name.apply_market_fields on every write
+    market_hash_name = Column(String)
+    market_phase = Column(String)
+    market_min_float = Column(Numeric(10, 8))
+    market_max_float = Column(Numeric(10, 8))
     item = relationship("Item")
 
 class UserItemHistory(Base):
@@ -99,6 +124,38 @@ class MarketPrice(Base):
     timestamp = Column(DateTime, primary_key=True)
     price = Column(Numeric(10, 2))
 
+    __table_args__ = (
+        Index("ix_marketprice_item_timestamp", "item_id", "timestamp"),
+    )
+
+class MarketPriceRollup(Base):
+    """OHLC bucket of MARKETPRICE rows, resolution 'hour' or 'day'."""
+    __tablename__ = "MARKETPRICEROLLUP"
+    market_id = Column(Integer, ForeignKey("MARKET.market_id"), primary_key=True)
+    item_id = Column(Integer, ForeignKey("ITEM.item_id"), primary_key=True)
+    resolution = Column(String(8), primary_key=True)
+    bucket_start = Column(DateTime, primary_key=True)
+    open_price = Column(Numeric(10, 2))
+    high_price = Column(Numeric(10, 2))
+    low_price = Column(Numeric(10, 2))
+    close_price = Column(Numeric(10, 2))
+    first_timestamp = Column(DateTime)
+    last_timestamp = Column(DateTime)
+    sample_count = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        Index("ix_marketpricerollup_item_res_bucket", "item_id", "resolution", "bucket_start"),
+    )
+
+class PortfolioTotals(Base):
+    # Running per-user sums over USERITEM (buy_price * amount, current_price * amount),
+    # kept in step by the repository writes and checked by a periodic job.
+    __tablename__ = "PORTFOLIOTOTALS"
+    user_id = Column(Integer, ForeignKey("USER.user_id"), primary_key=True)
+    total_invested = Column(Numeric(14, 2), nullable=False, default=0)
+    total_value = Column(Numeric(14, 2), nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.datetime.now)
+
 class PortfolioHistory(Base):
     __tablename__ = "PORTFOLIOHISTORY"
     history_id = Column(Integer, primary_key=True, index=True)
@@ -106,4 +163,46 @@ class PortfolioHistory(Base):
     total_invested = Column(Numeric(10, 2))
     total_value = Column(Numeric(10, 2))
     total_profit = Column(Numeric(10, 2))
-    timestamp = Column(DateTime, default=datetime.datetime.now)
\ No newline at end of file
+    timestamp = Column(DateTime, default=datetime.datetime.now)
+
+    __table_args__ = (
+        Index("ix_portfoliohistory_user_timestamp", "user_id", "timestamp"),
+    )
+
+class PortfolioHistoryDaily(Base):
+    # Raw PORTFOLIOHISTORY snapshots past the retention window, one row per user and day.
+    # total_* are the day's last snapshot.
+    __tablename__ = "PORTFOLIOHISTORYDAILY"
+    user_id = Column(Integer, ForeignKey("USER.user_id"), primary_key=True)
+    bucket_start = Column(DateTime, primary_key=True)
+    total_invested = Column(Numeric(14, 2))
+    total_value = Column(Numeric(14, 2))
+    total_profit = Column(Numeric(14, 2))
+    value_high = Column(Numeric(14, 2))
+    value_low = Column(Numeric(14, 2))
+    first_timestamp = Column(DateTime)
+    last_timestamp = Column(DateTime)
+    sample_count = Column(Integer, nullable=False, default=0)
+
+class SchedulerLease(Base):
+    # Scheduled-refresh shards (user_id % shard count); a process refreshes only
+    # the users of shards it holds a lease on.
+    __tablename__ = "SCHEDULERLEASE"
+    shard = Column(Integer, primary_key=True, autoincrement=False)
+    owner = Column(String)
+    expires_at = Column(DateTime)
+
+class SchedulerMember(Base):
+    # Live scheduled-refresh processes (heartbeat on every lease renewal); the
+    # shards are split evenly between them.
+    __tablename__ = "SCHEDULERMEMBER"
+    owner = Column(String, primary_key=True)
+    expires_at = Column(DateTime, nullable=False)
+
+
+class FxRate(Base):
+    # Last fetched USD -> currency rates, loaded at startup by the FX rate store
+    __tablename__ = "FXRATE"
+    currency = Column(String(3), primary_key=True)
+    rate = Column(Numeric(18, 8), nullable=False)
+    updated_at = Column(DateTime)
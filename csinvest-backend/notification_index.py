@@ -0,0 +1,91 @@
+import bisect
+import threading
+from sqlalchemy.orm import Session
+from models import User
+
+MINUTES_PER_DAY = 24 * 60
+
+
+def parse_minute_of_day(value: str | None) -> int | None:
+    """'HH:MM' (UTC) -> minute of day, None when empty or malformed."""
+    if not value:
+        return None
+    try:
+        hours, minutes = value.strip().split(":")
+        hours, minutes = int(hours), int(minutes)
+    except ValueError:
+        return None
+    if not (0 <= hours < 24 and 0 <= minutes < 60):
+        return None
+    return hours * 60 + minutes
+
+
+class NotificationMinuteIndex:
+    """
+    minute of day -> user_ids with a scheduled portfolio notification
+    (webhook set and notification time set). Loaded from USER at startup
+    and on the periodic reload, kept current in between by PATCH /users/me
+    in the process that served it.
+    """
+
+    def __init__(self) -> None:
+        self._by_minute: dict[int, set[int]] = {}
+        self._minute_of_user: dict[int, int] = {}
+        self._minutes: list[int] = []
+        self._lock = threading.Lock()
+
+    def load(self, db: Session) -> int:
+        rows = db.query(User.user_id, User.discord_portfolio_notification_time).filter(
+            User.discord_portfolio_webhook_url != None,
+            User.discord_portfolio_webhook_url != "",
+            User.discord_portfolio_notification_time != None,
+        ).all()
+        by_minute: dict[int, set[int]] = {}
+        minute_of_user = {}
+        for user_id, time_str in rows:
+            minute = parse_minute_of_day(time_str)
+            if minute is None:
+                continue
+            by_minute.setdefault(minute, set()).add(user_id)
+            minute_of_user[user_id] = minute
+        with self._lock:
+            self._by_minute = by_minute
+            self._minute_of_user = minute_of_user
+            self._minutes = sorted(by_minute)
+        return len(minute_of_user)
+
+    def update_user(self, user_id: int, webhook_url: str | None, notification_time: str | None) -> bool:
+        """Returns True when the user's slot changed."""
+        minute = parse_minute_of_day(notification_time) if webhook_url else None
+        with self._lock:
+            previous = self._minute_of_user.get(user_id)
+            if previous == minute:
+                return False
+            if previous is not None:
+                users = self._by_minute.get(previous)
+                if users is not None:
+                    users.discard(user_id)
+                    if not users:
+                        del self._by_minute[previous]
+                del self._minute_of_user[user_id]
+            if minute is not None:
+                self._by_minute.setdefault(minute, set()).add(user_id)
+                self._minute_of_user[user_id] = minute
+            self._minutes = sorted(self._by_minute)
+        return True
+
+    def users_at(self, minute: int) -> list[int]:
+        with self._lock:
+            return sorted(self._by_minute.get(minute, ()))
+
+    def next_minute_after(self, minute: int) -> int | None:
+        """First minute with users strictly after `minute`, wrapping past midnight."""
+        with self._lock:
+            minutes = self._minutes
+            if not minutes:
+                return None
+            i = bisect.bisect_right(minutes, minute)
+            return minutes[i] if i < len(minutes) else minutes[0]
+
+
+notification_index = NotificationMinuteIndex()
@@ -0,0 +1,256 @@
+import asyncio
+import logging
+import random
+import threading
+import time
+from collections import deque
+from config import Config
+
+logger = logging.getLogger("notifications")
+
+# Discord limits for one webhook message
+MAX_EMBEDS_PER_MESSAGE = 10
+MAX_EMBED_CHARS_PER_MESSAGE = 6000
+
+
+def _embed_size(embed: dict) -> int:
+    # What Discord counts towards the 6000 character limit
+    size = len(embed.get("title") or "") + len(embed.get("description") or "")
+    size += len((embed.get("footer") or {}).get("text") or "")
+    for field in embed.get("fields") or ():
+        size += len(field.get("name") or "") + len(field.get("value") or "")
+    return size
+
+
+def _retry_after_seconds(response) -> float | None:
+    try:
+        body = response.json()
+        if isinstance(body, dict) and body.get("retry_after") is not None:
+            return float(body["retry_after"])
+    except ValueError:
+        pass
+    for header in ("Retry-After", "X-RateLimit-Reset-After"):
+        raw = response.headers.get(header)
+        if raw:
+            try:
+                return float(raw)
+            except ValueError:
+                continue
+    return None
+
+
+class _WebhookBucket:
+    def __init__(self) -> None:
+        self.events: deque[dict] = deque()
+        self.ready_at = 0.0
+        self.sending = False
+
+
+class DiscordOutbox:
+    """
+    Outgoing Discord webhook messages. Price refreshes only enqueue embeds
+    (from any thread); a dispatcher task on the event loop sends them over
+    one pooled httpx client.
+
+    Embeds waiting for the same webhook are merged into one message (up to
+    10 embeds / 6000 characters). Every webhook is its own rate-limit
+    bucket: a 429 or an exhausted X-RateLimit-Remaining parks only that
+    webhook until Retry-After, a global 429 parks all of them. Network
+    errors and 5xx are retried with exponential backoff.
+    """
+
+    def __init__(self, concurrency: int = 4, max_attempts: int = 5, max_events: int = 10000, timeout: float = 10.0) -> None:
+        self.concurrency = max(1, int(concurrency))
+        self.max_attempts = max(1, int(max_attempts))
+        self.max_events = max(1, int(max_events))
+        self.timeout = timeout
+        self._buckets: dict[str, _WebhookBucket] = {}
+        self._size = 0
+        self._global_ready_at = 0.0
+        self._lock = threading.Lock()
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._wake: asyncio.Event | None = None
+        self._task: asyncio.Task | None = None
+        self._client = None
+        self._sends: set[asyncio.Task] = set()
+
+    @property
+    def pending_count(self) -> int:
+        return self._size
+
+    def enqueue(self, webhook_url: str, embed: dict) -> None:
+        with self._lock:
+            if self._size >= self.max_events:
+                logger.warning(f"Discord outbox full ({self._size}), dropping notification")
+                return
+            self._buckets.setdefault(webhook_url, _WebhookBucket()).events.append({"embed": embed, "attempts": 0})
+            self._size += 1
+        self._notify()
+
+    def _notify(self) -> None:
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            self._wake.set()
+        else:
+            loop.call_soon_threadsafe(self._wake.set)
+
+    def start(self) -> None:
+        """Starts the dispatcher on the running event loop (app startup)."""
+        if self._task is not None and not self._task.done():
+            return
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        self._task = self._loop.create_task(self._run())
+
+    def _get_client(self):
+        if self._client is None or self._client.is_closed:
+            import httpx
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(self.timeout, connect=5.0),
+                limits=httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency),
+            )
+        return self._client
+
+    def _take_message(self, bucket: _WebhookBucket) -> list[dict]:
+        events, chars = [], 0
+        while bucket.events and len(events) < MAX_EMBEDS_PER_MESSAGE:
+            size = _embed_size(bucket.events[0]["embed"])
+            if events and chars + size > MAX_EMBED_CHARS_PER_MESSAGE:
+                break
+            events.append(bucket.events.popleft())
+            chars += size
+        return events
+
+    def _due_buckets(self, now: float) -> tuple[list[tuple[str, list[dict]]], float | None]:
+        # -> messages to send now, seconds until the next parked bucket is ready
+        messages, wait = [], None
+        with self._lock:
+            if now < self._global_ready_at:
+                return [], self._global_ready_at - now
+            for url, bucket in list(self._buckets.items()):
+                if bucket.sending:
+                    continue
+                if not bucket.events:
+                    del self._buckets[url]
+                    continue
+                if bucket.ready_at > now:
+                    wait = min(wait, bucket.ready_at - now) if wait is not None else bucket.ready_at - now
+                    continue
+                if len(self._sends) + len(messages) >= self.concurrency:
+                    break
+                bucket.sending = True
+                messages.append((url, self._take_message(bucket)))
+        return messages, wait
+
+    async def _run(self) -> None:
+        while True:
+            self._wake.clear()
+            messages, wait = self._due_buckets(time.monotonic())
+            for url, events in messages:
+                task = asyncio.create_task(self._send(url, events))
+                self._sends.add(task)
+                task.add_done_callback(self._sends.discard)
+            try:
+                await asyncio.wait_for(self._wake.wait(), wait)
+            except asyncio.TimeoutError:
+                pass
+
+    def _finish(self, url: str, events: list[dict], requeue: bool, ready_at: float = 0.0) -> None:
+        with self._lock:
+            bucket = self._buckets.setdefault(url, _WebhookBucket())
+            bucket.sending = False
+            bucket.ready_at = max(bucket.ready_at, ready_at)
+            if requeue:
+                # Back to the front, the order of alerts is kept
+                bucket.events.extendleft(reversed(events))
+            else:
+                self._size -= len(events)
+        self._wake.set()
+
+    def _retry_or_drop(self, url: str, events: list[dict], reason: str) -> None:
+        for event in events:
+            event["attempts"] += 1
+        attempts = max(event["attempts"] for event in events)
+        if attempts >= self.max_attempts:
+            logger.error(f"Discord notification dropped after {attempts} attempts: {reason}")
+            self._finish(url, events, requeue=False)
+            return
+        backoff = min(300.0, 2 ** attempts) * random.uniform(0.8, 1.2)
+        logger.warning(f"Discord notification failed ({reason}), retry in {backoff:.1f}s")
+        self._finish(url, events, requeue=True, ready_at=time.monotonic() + backoff)
+
+    async def _send(self, url: str, events: list[dict]) -> None:
+        try:
+            response = await self._get_client().post(url, json={"embeds": [e["embed"] for e in events]})
+        except Exception as e:
+            self._retry_or_drop(url, events, str(e) or type(e).__name__)
+            return
+
+        now = time.monotonic()
+        if response.status_code == 429:
+            retry_after = _retry_after_seconds(response) or 1.0
+            try:
+                is_global = bool(response.json().get("global"))
+            except (ValueError, AttributeError):
+                is_global = False
+            if is_global:
+                with self._lock:
+                    self._global_ready_at = max(self._global_ready_at, now + retry_after)
+            logger.warning(f"Discord rate limited{' (global)' if is_global else ''}, retry in {retry_after:.2f}s")
+            # Rate limits are not failures, the attempt counter stays
+            self._finish(url, events, requeue=True, ready_at=now + retry_after)
+            return
+        if response.status_code >= 500:
+            self._retry_or_drop(url, events, f"HTTP {response.status_code}")
+            return
+        if response.status_code >= 400:
+            # Deleted webhook / invalid payload: retrying will not help
+            logger.error(f"Discord webhook rejected notification: HTTP {response.status_code} {response.text[:200]}")
+            self._finish(url, events, requeue=False)
+            return
+
+        ready_at = 0.0
+        if response.headers.get("X-RateLimit-Remaining") == "0":
+            reset_after = response.headers.get("X-RateLimit-Reset-After")
+            try:
+                ready_at = now + float(reset_after)
+            except (TypeError, ValueError):
+                pass
+        self._finish(url, events, requeue=False, ready_at=ready_at)
+
+    async def close(self, drain_seconds: float = 5.0) -> None:
+        """Gives queued messages a moment to go out, then stops the dispatcher."""
+        if self._task is None:
+            return
+        deadline = time.monotonic() + drain_seconds
+        while (self._size or self._sends) and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        if self._size:
+            logger.warning(f"Discord outbox closed with {self._size} unsent notifications")
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+        self._client = None
+
+
+def _build_outbox() -> DiscordOutbox:
+    cfg = Config()
+    return DiscordOutbox(
+        concurrency=cfg.DISCORD_DISPATCH_CONCURRENCY,
+        max_attempts=cfg.DISCORD_DISPATCH_MAX_ATTEMPTS,
+        max_events=cfg.DISCORD_OUTBOX_MAX_EVENTS,
+    )
+
+
+discord_outbox = _build_outbox()
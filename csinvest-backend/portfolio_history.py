@@ -0,0 +1,212 @@
+import datetime
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from models import PortfolioHistory, PortfolioHistoryDaily
+
+# Buckets the chart can be resampled to, finest first
+RESAMPLE_RESOLUTIONS = {
+    "5m": datetime.timedelta(minutes=5),
+    "hour": datetime.timedelta(hours=1),
+    "day": datetime.timedelta(days=1),
+}
+
+
+def bucket_start(ts: datetime.datetime, resolution: str) -> datetime.datetime:
+    if resolution == "day":
+        return ts.replace(hour=0, minute=0, second=0, microsecond=0)
+    if resolution == "hour":
+        return ts.replace(minute=0, second=0, microsecond=0)
+    if resolution == "5m":
+        return ts.replace(minute=ts.minute - ts.minute % 5, second=0, microsecond=0)
+    raise ValueError(f"Neznámé rozlišení: {resolution}")
+
+
+def choose_resolution(span: datetime.timedelta, max_points: int) -> str:
+    """Finest resolution that covers the span in at most max_points buckets."""
+    for resolution, step in RESAMPLE_RESOLUTIONS.items():
+        if span / step <= max_points:
+            return resolution
+    return "day"
+
+
+def _earliest_timestamp(db: Session, user_id: int) -> datetime.datetime | None:
+    candidates = [
+        db.query(func.min(PortfolioHistoryDaily.bucket_start)).filter(PortfolioHistoryDaily.user_id == user_id).scalar(),
+        db.query(func.min(PortfolioHistory.timestamp)).filter(PortfolioHistory.user_id == user_id).scalar(),
+    ]
+    candidates = [c for c in candidates if c is not None]
+    return min(candidates) if candidates else None
+
+
+def _point(ts: datetime.datetime, invested, value, profit) -> dict:
+    return {
+        "timestamp": ts.isoformat(),
+        "total_invested": float(invested or 0),
+        "total_value": float(value or 0),
+        "total_profit": float(profit or 0),
+    }
+
+
+def get_portfolio_history(
+    db: Session,
+    user_id: int,
+    window: datetime.timedelta | None = None,
+    max_points: int = 500,
+    resolution: str | None = None,
+) -> tuple[str, list[dict]]:
+    """
+    Returns (resolution, points) ordered by time, at most max_points of them.
+    Each bucket carries the last snapshot taken in it; days older than the raw
+    retention come from PORTFOLIOHISTORYDAILY.
+    """
+    now = datetime.datetime.now()
+    since = now - window if window is not None else None
+    if resolution is None:
+        start = since if since is not None else _earliest_timestamp(db, user_id)
+        resolution = choose_resolution(now - start, max_points) if start is not None else "day"
+    if resolution not in RESAMPLE_RESOLUTIONS:
+        raise ValueError(f"Neznámé rozlišení: {resolution}")
+
+    buckets: dict[datetime.datetime, dict] = {}
+
+    daily = db.query(
+        PortfolioHistoryDaily.bucket_start,
+        PortfolioHistoryDaily.total_invested,
+        PortfolioHistoryDaily.total_value,
+        PortfolioHistoryDaily.total_profit,
+    ).filter(PortfolioHistoryDaily.user_id == user_id)
+    if since is not None:
+        daily = daily.filter(PortfolioHistoryDaily.bucket_start >= bucket_start(since, "day"))
+    for start, invested, value, profit in daily.order_by(PortfolioHistoryDaily.bucket_start):
+        buckets[start] = _point(start, invested, value, profit)
+
+    raw = db.query(
+        PortfolioHistory.timestamp,
+        PortfolioHistory.total_invested,
+        PortfolioHistory.total_value,
+        PortfolioHistory.total_profit,
+    ).filter(PortfolioHistory.user_id == user_id)
+    if since is not None:
+        raw = raw.filter(PortfolioHistory.timestamp >= since)
+    # Ascending order: the last snapshot of a bucket overwrites earlier ones
+    for ts, invested, value, profit in raw.order_by(PortfolioHistory.timestamp).yield_per(1000):
+        if ts is None:
+            continue
+        start = bucket_start(ts, resolution)
+        buckets[start] = _point(start, invested, value, profit)
+
+    points = [buckets[k] for k in sorted(buckets)]
+    return resolution, points[-max_points:]
+
+
+def compact_portfolio_history(
+    db: Session,
+    raw_retention_days: int,
+    daily_retention_days: int = 0,
+    users_per_batch: int = 200,
+) -> tuple[int, int]:
+    """
+    Folds raw PORTFOLIOHISTORY snapshots of whole days older than
+    raw_retention_days into PORTFOLIOHISTORYDAILY and deletes them. Daily rows
+    older than daily_retention_days are dropped (0 keeps them forever).
+    Returns (compacted raw rows, deleted daily rows).
+    """
+    now = datetime.datetime.now()
+    cutoff = bucket_start(now - datetime.timedelta(days=max(1, raw_retention_days)), "day")
+
+    user_ids = [
+        uid for (uid,) in db.query(PortfolioHistory.user_id)
+        .filter(PortfolioHistory.timestamp < cutoff)
+        .distinct()
+        .all()
+    ]
+
+    compacted = 0
+    for start in range(0, len(user_ids), users_per_batch):
+        batch = user_ids[start:start + users_per_batch]
+        try:
+            buckets: dict[tuple, dict] = {}
+            rows = (
+                db.query(
+                    PortfolioHistory.user_id,
+                    PortfolioHistory.timestamp,
+                    PortfolioHistory.total_invested,
+                    PortfolioHistory.total_value,
+                    PortfolioHistory.total_profit,
+                )
+                .filter(PortfolioHistory.user_id.in_(batch), PortfolioHistory.timestamp < cutoff)
+                .order_by(PortfolioHistory.user_id, PortfolioHistory.timestamp)
+            )
+            for uid, ts, invested, value, profit in rows.yield_per(5000):
+                if ts is None:
+                    continue
+                value = float(value or 0)
+                key = (uid, bucket_start(ts, "day"))
+                agg = buckets.get(key)
+                if agg is None:
+                    agg = buckets[key] = {"first": ts, "high": value, "low": value, "count": 0}
+                agg.update(last=ts, invested=invested, value=value, profit=profit)
+                agg["high"] = max(agg["high"], value)
+                agg["low"] = min(agg["low"], value)
+                agg["count"] += 1
+
+            existing = {
+                (rec.user_id, rec.bucket_start): rec
+                for rec in db.query(PortfolioHistoryDaily).filter(
+                    PortfolioHistoryDaily.user_id.in_(batch),
+                    PortfolioHistoryDaily.bucket_start.in_(sorted({day for _, day in buckets})),
+                )
+            }
+            for (uid, day), agg in buckets.items():
+                rec = existing.get((uid, day))
+                if rec is None:
+                    db.add(PortfolioHistoryDaily(
+                        user_id=uid,
+                        bucket_start=day,
+                        total_invested=agg["invested"],
+                        total_value=agg["value"],
+                        total_profit=agg["profit"],
+                        value_high=agg["high"],
+                        value_low=agg["low"],
+                        first_timestamp=agg["first"],
+                        last_timestamp=agg["last"],
+                        sample_count=agg["count"],
+                    ))
+                    continue
+                if rec.last_timestamp is None or agg["last"] >= rec.last_timestamp:
+                    rec.total_invested = agg["invested"]
+                    rec.total_value = agg["value"]
+                    rec.total_profit = agg["profit"]
+                    rec.last_timestamp = agg["last"]
+                if rec.first_timestamp is None or agg["first"] < rec.first_timestamp:
+                    rec.first_timestamp = agg["first"]
+                rec.value_high = agg["high"] if rec.value_high is None else max(float(rec.value_high), agg["high"])
+                rec.value_low = agg["low"] if rec.value_low is None else min(float(rec.value_low), agg["low"])
+                rec.sample_count = (rec.sample_count or 0) + agg["count"]
+
+            compacted += (
+                db.query(PortfolioHistory)
+                .filter(PortfolioHistory.user_id.in_(batch), PortfolioHistory.timestamp < cutoff)
+                .delete(synchronize_session=False)
+            )
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+
+    dropped = 0
+    if daily_retention_days > 0:
+        try:
+            dropped = (
+                db.query(PortfolioHistoryDaily)
+                .filter(PortfolioHistoryDaily.bucket_start < now - datetime.timedelta(days=daily_retention_days))
+                .delete(synchronize_session=False)
+            )
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+
+    if compacted or dropped:
+        print(f"[PortfolioHistory] Zkompaktováno {compacted} snímků, smazáno {dropped} denních záznamů.")
+    return compacted, dropped
@@ -0,0 +1,243 @@
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+import json
+import threading
+import time
+from config import Config
+from market_name import split_phase
+from strategy import IMarketStrategy, IAsyncMarketStrategy, CSFloatStrategy, AsyncCSFloatStrategy
+
+
+def make_cache_key(skin_name: str, min_float: float = None, max_float: float = None, phase: str = None) -> str:
+    """
+    Normalized (market_hash_name, phase, float bucket) key, e.g.
+    "★ karambit | doppler (factory new)|phase 2|0.00-0.07"
+    """
+    name = str(skin_name or "")
+    if not phase:
+        name, phase = split_phase(name)
+    phase = phase.lower() if phase else ""
+    name = " ".join(name.lower().split())
+
+    if min_float is None and max_float is None:
+        float_bucket = "any"
+    else:
+        lo = f"{float(min_float):.2f}" if min_float is not None else ""
+        hi = f"{float(max_float):.2f}" if max_float is not None else ""
+        float_bucket = f"{lo}-{hi}"
+    return f"{name}|{phase}|{float_bucket}"
+
+
+class IPriceCacheBackend(ABC):
+    @abstractmethod
+    def get(self, key: str) -> dict | None:
+        pass
+
+    @abstractmethod
+    def set(self, key: str, value: dict, ttl_seconds: int) -> None:
+        pass
+
+    @abstractmethod
+    def clear(self) -> None:
+        pass
+
+
+class InMemoryPriceCacheBackend(IPriceCacheBackend):
+    """Per-process TTL + LRU cache. Also the local stand-in for shared backends."""
+
+    def __init__(self, max_entries: int = 5000) -> None:
+        self.max_entries = max(1, int(max_entries))
+        self._entries: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> dict | None:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= now:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return dict(value)
+
+    def set(self, key: str, value: dict, ttl_seconds: int) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl_seconds, dict(value))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class RedisPriceCacheBackend(IPriceCacheBackend):
+    """
+    Shared backend for several uvicorn workers. Works with any client exposing
+    redis-py style get/set(ex=)/scan_iter/delete, so it can be exercised with a
+    local stand-in instead of a real server.
+    """
+
+    PREFIX = "csinvest:price:"
+
+    def __init__(self, client) -> None:
+        self.client = client
+
+    @classmethod
+    def from_url(cls, url: str) -> "RedisPriceCacheBackend":
+        import redis  # optional dependency, only needed for PRICE_CACHE_URL=redis://...
+        return cls(redis.Redis.from_url(url))
+
+    def get(self, key: str) -> dict | None:
+        raw = self.client.get(self.PREFIX + key)
+        if raw is None:
+            return None
+        try:
+            return json.loads(raw)
+        except (TypeError, ValueError):
+            return None
+
+    def set(self, key: str, value: dict, ttl_seconds: int) -> None:
+        self.client.set(self.PREFIX + key, json.dumps(value), ex=max(1, int(ttl_seconds)))
+
+    def clear(self) -> None:
+        for k in self.client.scan_iter(match=self.PREFIX + "*"):
+            self.client.delete(k)
+
+
+class PriceCache:
+    def __init__(self, backend: IPriceCacheBackend, ttl_seconds: int = 300) -> None:
+        self.backend = backend
+        self.ttl_seconds = max(1, int(ttl_seconds))
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> dict | None:
+        try:
+            value = self.backend.get(key)
+        except Exception as e:
+            print(f"[PriceCache] Backend get selhal: {e}")
+            value = None
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def set(self, key: str, value: dict) -> None:
+        try:
+            self.backend.set(key, value, self.ttl_seconds)
+        except Exception as e:
+            print(f"[PriceCache] Backend set selhal: {e}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": (self.hits / total) if total else 0.0,
+                "backend": type(self.backend).__name__,
+                "ttl_seconds": self.ttl_seconds,
+            }
+
+
+class CachedMarketStrategy(IMarketStrategy):
+    """Caching decorator around any IMarketStrategy. Failed lookups are not cached."""
+
+    def __init__(self, inner: IMarketStrategy, cache: PriceCache) -> None:
+        self.inner = inner
+        self.cache = cache
+
+    def get_cached(self, skin_name: str, min_float: float = None, max_float: float = None, phase: str = None) -> dict | None:
+        return self.cache.get(make_cache_key(skin_name, min_float, max_float, phase))
+
+    def fetch_uncached(self, skin_name: str, min_float: float = None, max_float: float = None, api_key: str = None, phase: str = None) -> dict:
+        # For callers that already did get_cached() and missed.
+        result = self.inner.fetch_price(skin_name, min_float=min_float, max_float=max_float, api_key=api_key, phase=phase)
+        if result:
+            self.cache.set(make_cache_key(skin_name, min_float, max_float, phase), result)
+        return result
+
+    def fetch_price(self, skin_name: str, min_float: float = None, max_float: float = None, api_key: str = None, phase: str = None) -> dict:
+        cached = self.get_cached(skin_name, min_float, max_float, phase)
+        if cached is not None:
+            return cached
+        return self.fetch_uncached(skin_name, min_float=min_float, max_float=max_float, api_key=api_key, phase=phase)
+
+
+class AsyncCachedMarketStrategy(IAsyncMarketStrategy):
+    """Async counterpart of CachedMarketStrategy, sharing the same PriceCache."""
+
+    def __init__(self, inner: IAsyncMarketStrategy, cache: PriceCache) -> None:
+        self.inner = inner
+        self.cache = cache
+
+    def get_cached(self, skin_name: str, min_float: float = None, max_float: float = None, phase: str = None) -> dict | None:
+        return self.cache.get(make_cache_key(skin_name, min_float, max_float, phase))
+
+    async def fetch_uncached(self, skin_name: str, min_float: float = None, max_float: float = None, api_key: str = None, phase: str = None) -> dict:
+        result = await self.inner.fetch_price(skin_name, min_float=min_float, max_float=max_float, api_key=api_key, phase=phase)
+        if result:
+            self.cache.set(make_cache_key(skin_name, min_float, max_float, phase), result)
+        return result
+
+    async def fetch_price(self, skin_name: str, min_float: float = None, max_float: float = None, api_key: str = None, phase: str = None) -> dict:
+        cached = self.get_cached(skin_name, min_float, max_float, phase)
+        if cached is not None:
+            return cached
+        return await self.fetch_uncached(skin_name, min_float=min_float, max_float=max_float, api_key=api_key, phase=phase)
+
+
+_price_cache: PriceCache | None = None
+_price_cache_lock = threading.Lock()
+
+
+def _build_backend(cfg: Config) -> IPriceCacheBackend:
+    url = cfg.PRICE_CACHE_URL
+    if url.startswith("redis://") or url.startswith("rediss://"):
+        try:
+            return RedisPriceCacheBackend.from_url(url)
+        except Exception as e:
+            print(f"[PriceCache] Redis backend nedostupný ({e}), používám in-memory cache.")
+    return InMemoryPriceCacheBackend(cfg.PRICE_CACHE_MAX_ENTRIES)
+
+
+def get_price_cache() -> PriceCache:
+    global _price_cache
+    with _price_cache_lock:
+        if _price_cache is None:
+            cfg = Config()
+            _price_cache = PriceCache(_build_backend(cfg), cfg.PRICE_CACHE_TTL_SECONDS)
+        return _price_cache
+
+
+def get_market_strategy() -> IMarketStrategy:
+    """CSFloat strategy behind the process-wide price cache."""
+    return CachedMarketStrategy(CSFloatStrategy(), get_price_cache())
+
+
+_async_csfloat: AsyncCSFloatStrategy | None = None
+
+
+def get_async_market_strategy() -> IAsyncMarketStrategy:
+    """Async CSFloat strategy (one pooled client per process) behind the price cache."""
+    global _async_csfloat
+    with _price_cache_lock:
+        if _async_csfloat is None:
+            _async_csfloat = AsyncCSFloatStrategy()
+    return AsyncCachedMarketStrategy(_async_csfloat, get_price_cache())
+
+
+async def close_async_market_strategy() -> None:
+    if _async_csfloat is not None:
+        await _async_csfloat.aclose()
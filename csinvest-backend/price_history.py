@@ -0,0 +1,292 @@
+import datetime
+import re
+from sqlalchemy import case, func, or_
+from sqlalchemy.orm import Session
+from models import MarketPrice, MarketPriceRollup
+
+ROLLUP_RESOLUTIONS = {
+    "hour": datetime.timedelta(hours=1),
+    "day": datetime.timedelta(days=1),
+}
+# Raw MARKETPRICE rows are only served for short windows, longer ones read rollups.
+RAW_MAX_WINDOW = datetime.timedelta(days=2)
+
+_WINDOW_RE = re.compile(r"^(\d+)\s*([hdwmy])$")
+_WINDOW_UNITS = {
+    "h": datetime.timedelta(hours=1),
+    "d": datetime.timedelta(days=1),
+    "w": datetime.timedelta(weeks=1),
+    "m": datetime.timedelta(days=30),
+    "y": datetime.timedelta(days=365),
+}
+
+
+def parse_window(value: str | None) -> datetime.timedelta | None:
+    """'24h', '7d', '4w', '6m', '1y' -> timedelta; None/'all' -> None (everything)."""
+    if value is None:
+        return None
+    raw = value.strip().lower()
+    if raw in ("", "all"):
+        return None
+    match = _WINDOW_RE.match(raw)
+    if not match or int(match.group(1)) <= 0:
+        raise ValueError(f"Neplatné okno historie: {value}")
+    return int(match.group(1)) * _WINDOW_UNITS[match.group(2)]
+
+
+def bucket_start(ts: datetime.datetime, resolution: str) -> datetime.datetime:
+    if resolution == "hour":
+        return ts.replace(minute=0, second=0, microsecond=0)
+    if resolution == "day":
+        return ts.replace(hour=0, minute=0, second=0, microsecond=0)
+    raise ValueError(f"Neznámé rozlišení: {resolution}")
+
+
+def _aggregate(rows) -> dict:
+    buckets = {}
+    for row in rows:
+        if row.get("price") is None or row.get("timestamp") is None:
+            continue
+        price = float(row["price"])
+        ts = row["timestamp"]
+        for resolution in ROLLUP_RESOLUTIONS:
+            key = (row["market_id"], row["item_id"], resolution, bucket_start(ts, resolution))
+            agg = buckets.get(key)
+            if agg is None:
+                buckets[key] = {
+                    "open": price, "open_ts": ts,
+                    "close": price, "close_ts": ts,
+                    "high": price, "low": price,
+                    "count": 1,
+                }
+                continue
+            if ts < agg["open_ts"]:
+                agg["open"], agg["open_ts"] = price, ts
+            if ts >= agg["close_ts"]:
+                agg["close"], agg["close_ts"] = price, ts
+            agg["high"] = max(agg["high"], price)
+            agg["low"] = min(agg["low"], price)
+            agg["count"] += 1
+    return buckets
+
+
+def _rollup_rows(buckets: dict) -> list[dict]:
+    # Sorted by primary key so concurrent writers lock the buckets in the same order
+    return [
+        {
+            "market_id": market_id,
+            "item_id": item_id,
+            "resolution": resolution,
+            "bucket_start": start,
+            "open_price": agg["open"],
+            "high_price": agg["high"],
+            "low_price": agg["low"],
+            "close_price": agg["close"],
+            "first_timestamp": agg["open_ts"],
+            "last_timestamp": agg["close_ts"],
+            "sample_count": agg["count"],
+        }
+        for (market_id, item_id, resolution, start), agg in sorted(buckets.items(), key=lambda kv: kv[0])
+    ]
+
+
+def _upsert_statement(dialect: str):
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+        greatest, least = func.greatest, func.least
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+        # SQLite's multi-argument max()/min() are the scalar versions
+        greatest, least = func.max, func.min
+
+    table = MarketPriceRollup.__table__
+    stmt = insert(table)
+    new = stmt.excluded
+    # The merge happens in the database, so concurrent refreshes hitting the
+    # same bucket neither collide on the key nor overwrite each other's counts
+    return stmt.on_conflict_do_update(
+        index_elements=[table.c.market_id, table.c.item_id, table.c.resolution, table.c.bucket_start],
+        set_={
+            "open_price": case(
+                (or_(table.c.first_timestamp == None, new.first_timestamp < table.c.first_timestamp), new.open_price),
+                else_=table.c.open_price,
+            ),
+            "first_timestamp": case(
+                (or_(table.c.first_timestamp == None, new.first_timestamp < table.c.first_timestamp), new.first_timestamp),
+                else_=table.c.first_timestamp,
+            ),
+            "close_price": case(
+                (or_(table.c.last_timestamp == None, new.last_timestamp >= table.c.last_timestamp), new.close_price),
+                else_=table.c.close_price,
+            ),
+            "last_timestamp": case(
+                (or_(table.c.last_timestamp == None, new.last_timestamp >= table.c.last_timestamp), new.last_timestamp),
+                else_=table.c.last_timestamp,
+            ),
+            "high_price": func.coalesce(greatest(table.c.high_price, new.high_price), new.high_price),
+            "low_price": func.coalesce(least(table.c.low_price, new.low_price), new.low_price),
+            "sample_count": func.coalesce(table.c.sample_count, 0) + new.sample_count,
+        },
+    )
+
+
+def _merge_rollups_locked(db: Session, buckets: dict, chunk_size: int) -> None:
+    # Databases without INSERT ... ON CONFLICT: the existing buckets are read
+    # FOR UPDATE, so a concurrent writer waits instead of losing its changes
+    groups = {}
+    for market_id, item_id, resolution, start in buckets:
+        group = groups.setdefault((market_id, resolution), (set(), set()))
+        group[0].add(item_id)
+        group[1].add(start)
+
+    existing = {}
+    for (market_id, resolution), (item_ids, starts) in sorted(groups.items()):
+        item_ids = sorted(item_ids)
+        for i in range(0, len(item_ids), chunk_size):
+            recs = (
+                db.query(MarketPriceRollup)
+                .filter(
+                    MarketPriceRollup.market_id == market_id,
+                    MarketPriceRollup.resolution == resolution,
+                    MarketPriceRollup.item_id.in_(item_ids[i:i + chunk_size]),
+                    MarketPriceRollup.bucket_start.in_(sorted(starts)),
+                )
+                .with_for_update()
+                .all()
+            )
+            for rec in recs:
+                existing[(rec.market_id, rec.item_id, rec.resolution, rec.bucket_start)] = rec
+
+    for row in _rollup_rows(buckets):
+        rec = existing.get((row["market_id"], row["item_id"], row["resolution"], row["bucket_start"]))
+        if rec is None:
+            db.add(MarketPriceRollup(**row))
+            continue
+        if rec.first_timestamp is None or row["first_timestamp"] < rec.first_timestamp:
+            rec.open_price = row["open_price"]
+            rec.first_timestamp = row["first_timestamp"]
+        if rec.last_timestamp is None or row["last_timestamp"] >= rec.last_timestamp:
+            rec.close_price = row["close_price"]
+            rec.last_timestamp = row["last_timestamp"]
+        rec.high_price = row["high_price"] if rec.high_price is None else max(float(rec.high_price), row["high_price"])
+        rec.low_price = row["low_price"] if rec.low_price is None else min(float(rec.low_price), row["low_price"])
+        rec.sample_count = (rec.sample_count or 0) + row["sample_count"]
+
+    # The session runs with autoflush=False, make the new buckets visible to
+    # the next call within the same transaction.
+    db.flush()
+
+
+def apply_price_rollups(db: Session, rows, chunk_size: int = 500) -> int:
+    """
+    Folds new MARKETPRICE rows (dicts with market_id, item_id, price, timestamp)
+    into the hourly/daily rollups. Runs inside the caller's transaction, the
+    caller commits. Returns the number of touched buckets.
+    """
+    buckets = _aggregate(rows)
+    if not buckets:
+        return 0
+
+    dialect = db.get_bind().dialect.name
+    if dialect not in ("postgresql", "sqlite"):
+        _merge_rollups_locked(db, buckets, chunk_size)
+        return len(buckets)
+
+    stmt = _upsert_statement(dialect)
+    records = _rollup_rows(buckets)
+    for start in range(0, len(records), chunk_size):
+        db.execute(stmt, records[start:start + chunk_size])
+    return len(buckets)
+
+
+def rebuild_price_rollups(db: Session, item_id: int | None = None, chunk_size: int = 5000) -> int:
+    """Recomputes rollups from MARKETPRICE (backfill for rows written before rollups existed)."""
+    q = db.query(MarketPriceRollup)
+    if item_id is not None:
+        q = q.filter(MarketPriceRollup.item_id == item_id)
+    q.delete(synchronize_session=False)
+
+    prices = db.query(MarketPrice.market_id, MarketPrice.item_id, MarketPrice.price, MarketPrice.timestamp)
+    if item_id is not None:
+        prices = prices.filter(MarketPrice.item_id == item_id)
+    prices = prices.order_by(MarketPrice.item_id, MarketPrice.timestamp)
+
+    total = 0
+    pending = []
+    try:
+        for market_id, iid, price, ts in prices.yield_per(chunk_size):
+            pending.append({"market_id": market_id, "item_id": iid, "price": price, "timestamp": ts})
+            if len(pending) >= chunk_size:
+                apply_price_rollups(db, pending)
+                total += len(pending)
+                pending = []
+        if pending:
+            apply_price_rollups(db, pending)
+            total += len(pending)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    print(f"[PriceHistory] Rollupy přepočítány z {total} záznamů.")
+    return total
+
+
+def choose_resolution(window: datetime.timedelta | None, max_points: int) -> str:
+    """Finest resolution that covers the window in at most max_points buckets."""
+    if window is not None and window <= RAW_MAX_WINDOW:
+        return "raw"
+    if window is not None and window / ROLLUP_RESOLUTIONS["hour"] <= max_points:
+        return "hour"
+    return "day"
+
+
+def get_price_history(
+    db: Session,
+    item_id: int,
+    window: datetime.timedelta | None = None,
+    max_points: int = 200,
+    resolution: str | None = None,
+) -> tuple[str, list[dict]]:
+    """
+    Returns (resolution, points) ordered by time, at most max_points of them.
+    Without a window or resolution the last max_points raw prices are returned.
+    """
+    if resolution is None:
+        resolution = "raw" if window is None else choose_resolution(window, max_points)
+    since = datetime.datetime.now() - window if window is not None else None
+
+    if resolution == "raw":
+        q = db.query(MarketPrice.timestamp, MarketPrice.price).filter(MarketPrice.item_id == item_id)
+        if since is not None:
+            q = q.filter(MarketPrice.timestamp >= since)
+        rows = q.order_by(MarketPrice.timestamp.desc()).limit(max_points).all()
+        points = [
+            {"timestamp": ts.isoformat(), "price": float(price)}
+            for ts, price in reversed(rows)
+            if price is not None
+        ]
+        return resolution, points
+
+    if resolution not in ROLLUP_RESOLUTIONS:
+        raise ValueError(f"Neznámé rozlišení: {resolution}")
+
+    q = db.query(MarketPriceRollup).filter(
+        MarketPriceRollup.item_id == item_id,
+        MarketPriceRollup.resolution == resolution,
+    )
+    if since is not None:
+        q = q.filter(MarketPriceRollup.bucket_start >= bucket_start(since, resolution))
+    recs = q.order_by(MarketPriceRollup.bucket_start.desc()).limit(max_points).all()
+    points = [
+        {
+            "timestamp": r.bucket_start.isoformat(),
+            "price": float(r.close_price),
+            "open": float(r.open_price),
+            "high": float(r.high_price),
+            "low": float(r.low_price),
+            "close": float(r.close_price),
+            "count": r.sample_count,
+        }
+        for r in reversed(recs)
+    ]
+    return resolution, points
@@ -0,0 +1,83 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from fastapi.encoders import jsonable_encoder
+from config import Config
+
+
+class CachedBody:
+    __slots__ = ("version", "body", "etag", "built_at")
+
+    def __init__(self, version: int, body: bytes) -> None:
+        self.version = version
+        self.body = body
+        self.etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        self.built_at = time.monotonic()
+
+
+class CatalogReadModel:
+    """
+    Serialized JSON of catalog endpoints (/cases, /collections, /items/{slug}...)
+    keyed by a catalog version. Writes to ITEM call bump(), which invalidates
+    every cached body at once; the TTL covers writes made by other processes.
+    """
+
+    def __init__(self, ttl_seconds: int = 300, max_entries: int = 2000) -> None:
+        self.ttl_seconds = max(1, int(ttl_seconds))
+        self.max_entries = max(1, int(max_entries))
+        self.version = 0
+        self._entries: OrderedDict[str, CachedBody] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def bump(self) -> int:
+        with self._lock:
+            self.version += 1
+            self._entries.clear()
+            return self.version
+
+    def peek(self, key: str) -> CachedBody | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry.version != self.version or time.monotonic() - entry.built_at > self.ttl_seconds:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def get(self, key: str, builder) -> CachedBody:
+        """builder() returns the response data; it only runs on a cache miss."""
+        entry = self.peek(key)
+        if entry is not None:
+            return entry
+
+        version = self.version
+        data = jsonable_encoder(builder())
+        entry = CachedBody(version, json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+        with self._lock:
+            # A bump() while building means the data may already be stale.
+            if version == self.version:
+                self._entries[key] = entry
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return entry
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == "*" or candidate == etag:
+            return True
+    return False
+
+
+_cfg = Config()
+catalog_read_model = CatalogReadModel(_cfg.CATALOG_CACHE_TTL_SECONDS, _cfg.CATALOG_CACHE_MAX_ENTRIES)
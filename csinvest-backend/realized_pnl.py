@@ -0,0 +1,127 @@
+import threading
+import time
+from collections import OrderedDict
+from sqlalchemy import case, extract, func
+from sqlalchemy.orm import Session
+from config import Config
+from models import UserItemHistory, Item
+
+
+def _net_expr():
+    # Rows from before the fee columns existed have final_price 0; their net
+    # is derived from sell price and fees the same way _compute_final_price does.
+    h = UserItemHistory
+    derived = (
+        h.sell_price * func.coalesce(h.amount, 1)
+        * (1 - func.coalesce(h.sell_fee_pct, 0) / 100.0)
+        * (1 - func.coalesce(h.withdraw_fee_pct, 0) / 100.0)
+    )
+    return case((func.coalesce(h.final_price, 0) > 0, h.final_price), else_=derived)
+
+
+def _aggregates():
+    h = UserItemHistory
+    amount = func.coalesce(h.amount, 1)
+    return [
+        func.count(h.user_item_history_id),
+        func.sum(amount),
+        func.sum(h.buy_price * amount),
+        func.sum(h.sell_price * amount),
+        func.sum(_net_expr()),
+    ]
+
+
+def _summary(trades, units, cost, gross, net) -> dict:
+    cost = float(cost or 0)
+    gross = float(gross or 0)
+    net = float(net or 0)
+    return {
+        "trades": int(trades or 0),
+        "units": int(units or 0),
+        "cost": round(cost, 2),
+        "gross_proceeds": round(gross, 2),
+        "net_proceeds": round(net, 2),
+        "fee_drag": round(gross - net, 2),
+        "gross_profit": round(gross - cost, 2),
+        "realized_profit": round(net - cost, 2),
+        "realized_profit_pct": round((net - cost) / cost * 100, 2) if cost > 0 else None,
+    }
+
+
+def compute_realized_pnl(db: Session, user_id: int) -> dict:
+    """Realized P&L of USERITEMHISTORY: totals, per month and per item, three grouped queries."""
+    h = UserItemHistory
+    totals = db.query(*_aggregates()).filter(h.user_id == user_id).one()
+
+    year = extract("year", h.sold_date)
+    month = extract("month", h.sold_date)
+    months = (
+        db.query(year, month, *_aggregates())
+        .filter(h.user_id == user_id)
+        .group_by(year, month)
+        .order_by(year, month)
+        .all()
+    )
+
+    items = (
+        db.query(h.item_id, Item.name, Item.slug, *_aggregates())
+        .join(Item, Item.item_id == h.item_id)
+        .filter(h.user_id == user_id)
+        .group_by(h.item_id, Item.name, Item.slug)
+        .all()
+    )
+    per_item = [
+        {"item_id": item_id, "name": name, "slug": slug, **_summary(*aggs)}
+        for item_id, name, slug, *aggs in items
+    ]
+    per_item.sort(key=lambda r: r["realized_profit"], reverse=True)
+
+    return {
+        "totals": _summary(*totals),
+        "per_month": [
+            {"month": f"{int(y):04d}-{int(m):02d}", **_summary(*aggs)}
+            for y, m, *aggs in months
+            if y is not None
+        ],
+        "per_item": per_item,
+    }
+
+
+class RealizedPnlCache:
+    """
+    Per-user realized P&L results. The repository calls invalidate() after
+    every USERITEMHISTORY write; the TTL covers writes from other processes.
+    """
+
+    def __init__(self, ttl_seconds: int = 300, max_entries: int = 5000) -> None:
+        self.ttl_seconds = max(1, int(ttl_seconds))
+        self.max_entries = max(1, int(max_entries))
+        self._entries: OrderedDict[int, tuple[int, float, dict]] = OrderedDict()
+        self._generations: dict[int, int] = {}
+        self._lock = threading.Lock()
+
+    def invalidate(self, user_id: int) -> None:
+        with self._lock:
+            self._generations[user_id] = self._generations.get(user_id, 0) + 1
+            self._entries.pop(user_id, None)
+
+    def get(self, db: Session, user_id: int) -> dict:
+        with self._lock:
+            entry = self._entries.get(user_id)
+            generation = self._generations.get(user_id, 0)
+            if entry is not None and entry[0] == generation and time.monotonic() - entry[1] <= self.ttl_seconds:
+                self._entries.move_to_end(user_id)
+                return entry[2]
+
+        result = compute_realized_pnl(db, user_id)
+        with self._lock:
+            # A write during the computation may not be in the result
+            if self._generations.get(user_id, 0) == generation:
+                self._entries[user_id] = (generation, time.monotonic(), result)
+                self._entries.move_to_end(user_id)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return result
+
+
+realized_pnl_cache = RealizedPnlCache(Config().REALIZED_PNL_CACHE_TTL_SECONDS)
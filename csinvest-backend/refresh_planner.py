@@ -0,0 +1,69 @@
+from sqlalchemy.orm import Session
+from service import PriceService
+from strategy import IAsyncMarketStrategy
+
+
+def query_key(query: dict) -> tuple:
+    return (
+        query["market_name"],
+        query.get("min_float"),
+        query.get("max_float"),
+        query.get("phase"),
+    )
+
+
+class PortfolioRefreshPlanner:
+    """
+    Refreshes many portfolios in one go (one scheduler tick). plan() collects
+    every unique (market_name, min_float, max_float, phase) so the caller
+    fetches it once; apply() fans the result back out to every UserItem that
+    asked for it.
+    """
+
+    def __init__(self, db: Session, strategy: IAsyncMarketStrategy):
+        self.service = PriceService(db, strategy)
+        self.strategy = strategy
+
+    def plan(self, user_ids: list[int]) -> tuple[list[dict], list[dict], dict]:
+        plans = []
+        unique_queries = []
+        slots = {}
+
+        for user_id in user_ids:
+            try:
+                plan = self.service.plan_portfolio_refresh(user_id)
+            except Exception as e:
+                print(f"[Planner] Nelze naplánovat uživatele {user_id}: {e}")
+                continue
+            plans.append(plan)
+
+            for owned, query in plan["planned"]:
+                key = query_key(query)
+                slot = slots.get(key)
+                if slot is None:
+                    slot = len(unique_queries)
+                    slots[key] = slot
+                    unique_queries.append({**query, "api_key": plan["api_key"]})
+                elif not plan["api_key"]:
+                    # At least one requester relies on the server keys, so the
+                    # shared pool pays for this one instead of someone's own key.
+                    unique_queries[slot]["api_key"] = None
+
+        total_requested = sum(len(p["planned"]) for p in plans)
+        print(f"[Planner] {len(plans)} uživatelů, {total_requested} položek -> {len(unique_queries)} unikátních dotazů")
+        return plans, unique_queries, slots
+
+    def apply(self, plans: list[dict], slots: dict, fetched: list) -> dict:
+        results = {}
+        for plan in plans:
+            user_id = plan["user_id"]
+            per_user = (
+                (index, fetched[slots[query_key(query)]])
+                for index, (_, query) in enumerate(plan["planned"])
+            )
+            try:
+                results[user_id] = self.service.apply_portfolio_refresh(plan, per_user)
+            except Exception as e:
+                print(f"[Planner] Aktualizace uživatele {user_id} selhala: {e}")
+                self.service.repo.db.rollback()
+        return results
@@ -1,29 +1,203 @@
-from sqlalchemy.orm import Session, joinedload
-from models import UserItem, UserItemHistory, Item, PortfolioHistory, MarketPrice
+from sqlalchemy.orm import Session, joinedload, aliased
+from models import UserItem, UserItemHistory, Item, PortfolioHistory, PortfolioTotals, MarketPrice, CaseMembership
 import datetime
-from sqlalchemy import func
+import re
+from decimal import Decimal
+from sqlalchemy import func, insert, update, bindparam, column, text
+from sqlalchemy.exc import IntegrityError
+from config import Config
+from price_history import apply_price_rollups
+from search_index import catalog_index
+from read_model import catalog_read_model
+from realized_pnl import realized_pnl_cache
+from market_name import calculate_wear, apply_market_fields
+
+
+_SEARCH_NORMALIZE_RE = re.compile(r"[^a-z0-9]+")
+
+
+def normalize_search_text(value: str | None) -> str:
+    # Same normalization as the ITEM.name_normalized generated column
+    return _SEARCH_NORMALIZE_RE.sub("", (value or "").lower())
+
+
+def ensure_pg_search_schema(engine) -> bool:
+    """
+    Postgres only: ITEM.name_normalized (lower(name) without punctuation and
+    spaces, generated column) with a pg_trgm GIN index for LIKE '%...%'.
+    Returns False when the trigram index could not be created (the column
+    still works, just without the index).
+    """
+    if engine.dialect.name != "postgresql":
+        return False
+    with engine.begin() as conn:
+        conn.execute(text(
+            """
+            ALTER TABLE "ITEM" ADD COLUMN IF NOT EXISTS name_normalized TEXT
+            GENERATED ALWAYS AS (regexp_replace(lower(name), '[^a-z0-9]+', '', 'g')) STORED
+            """
+        ))
+    try:
+        with engine.begin() as conn:
+            conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+            conn.execute(text(
+                'CREATE INDEX IF NOT EXISTS ix_item_name_normalized_trgm '
+                'ON "ITEM" USING gin (name_normalized gin_trgm_ops)'
+            ))
+    except Exception as e:
+        print(f"[Search] Trigram index nelze vytvořit: {e}")
+        return False
+    return True
+
+
+CASE_BUCKETS = ("skin", "knife", "glove")
+
+
+def classify_case_items(items) -> dict[str, list]:
+    """
+    Splits the items of one case into skin/knife/glove buckets: explicit
+    knives/gloves plus skins whose rarity marks them as knife/glove drops.
+    """
+    skins = [i for i in items if i.item_type == "skin"]
+    knives = [i for i in items if i.item_type == "knife"]
+    gloves = [i for i in items if i.item_type == "glove"]
+    knives += [s for s in skins if (s.rarity or "").lower() in ("knife", "knife/glove")]
+    gloves += [s for s in skins if (s.rarity or "").lower() in ("glove", "knife/glove")]
+
+    def dedupe(arr):
+        seen = set()
+        out = []
+        for x in arr:
+            if x.item_id in seen:
+                continue
+            seen.add(x.item_id)
+            out.append(x)
+        return out
+
+    return {"skin": skins, "knife": dedupe(knives), "glove": dedupe(gloves)}
+
+
+def _item_prices_changed(prices: dict[int, float]) -> None:
+    # Keep the in-process catalog views in line with committed ITEM prices
+    if not prices:
+        return
+    catalog_index.patch_prices(prices)
+    catalog_read_model.bump()
+
+
+def _portfolio_line(rec: UserItem) -> tuple[float, float]:
+    """(invested, value) of one USERITEM row, as summed into PORTFOLIOTOTALS."""
+    # Same rule as coalesce(amount, 1) in the SQL aggregates
+    amount = 1 if rec.amount is None else rec.amount
+    return float(rec.buy_price or 0) * amount, float(rec.current_price or 0) * amount
+
+
+def _money(value: float) -> Decimal:
+    return Decimal(str(round(value, 2)))
+
+
+def _apply_portfolio_deltas(db: Session, deltas: dict[int, tuple[float, float]], chunk_size: int = 500) -> None:
+    """
+    Adds (invested, value) deltas to PORTFOLIOTOTALS inside the caller's
+    transaction. Users without a totals row are skipped, their row is
+    computed in full on first read.
+    """
+    now = datetime.datetime.now()
+    rows = [
+        {"b_user_id": user_id, "d_invested": _money(d_inv), "d_value": _money(d_val), "updated_at": now}
+        for user_id, (d_inv, d_val) in deltas.items()
+        if user_id is not None and (round(d_inv, 2) or round(d_val, 2))
+    ]
+    if not rows:
+        return
+    table = PortfolioTotals.__table__
+    stmt = (
+        update(table)
+        .where(table.c.user_id == bindparam("b_user_id"))
+        .values(
+            total_invested=table.c.total_invested + bindparam("d_invested"),
+            total_value=table.c.total_value + bindparam("d_value"),
+            updated_at=bindparam("updated_at"),
+        )
+    )
+    for start in range(0, len(rows), chunk_size):
+        db.execute(stmt, rows[start:start + chunk_size])
+
+
+def _useritem_price_deltas(db: Session, updates, chunk_size: int = 500) -> dict[int, tuple[float, float]]:
+    """
+    Per-user value deltas of pending USERITEM price updates (dicts with
+    b_item_id, b_user_id, current_price; b_user_id None = all holders).
+    Has to run before the updates are executed.
+    """
+    prices: dict[int, tuple] = {}
+    for row in updates:
+        all_users, per_user = prices.get(row["b_item_id"], (None, {}))
+        if row["b_user_id"] is None:
+            all_users = row["current_price"]
+        else:
+            per_user[row["b_user_id"]] = row["current_price"]
+        prices[row["b_item_id"]] = (all_users, per_user)
+
+    deltas: dict[int, tuple[float, float]] = {}
+    item_ids = sorted(prices)
+    for start in range(0, len(item_ids), chunk_size):
+        held = (
+            db.query(
+                UserItem.user_id,
+                UserItem.item_id,
+                func.sum(func.coalesce(UserItem.current_price, 0) * func.coalesce(UserItem.amount, 1)),
+                func.sum(func.coalesce(UserItem.amount, 1)),
+            )
+            .filter(UserItem.item_id.in_(item_ids[start:start + chunk_size]))
+            .group_by(UserItem.user_id, UserItem.item_id)
+            .all()
+        )
+        for user_id, item_id, old_value, amount in held:
+            all_users, per_user = prices[item_id]
+            # Per-user updates run after the all-holders ones, so they win
+            price = per_user.get(user_id, all_users)
+            if price is None:
+                continue
+            d_val = float(price) * int(amount or 0) - float(old_value or 0)
+            d_inv, prev = deltas.get(user_id, (0.0, 0.0))
+            deltas[user_id] = (d_inv, prev + d_val)
+    return deltas
+
+
+def _user_item_price_deltas(db: Session, updates, chunk_size: int = 500) -> dict[int, tuple[float, float]]:
+    """
+    Per-user value deltas of pending single-row USERITEM price updates
+    (dicts with b_user_item_id, current_price). Has to run before the
+    updates are executed.
+    """
+    prices = {row["b_user_item_id"]: row["current_price"] for row in updates}
+    deltas: dict[int, tuple[float, float]] = {}
+    ids = sorted(prices)
+    for start in range(0, len(ids), chunk_size):
+        held = (
+            db.query(UserItem)
+            .filter(UserItem.user_item_id.in_(ids[start:start + chunk_size]))
+            .all()
+        )
+        for rec in held:
+            _, value_before = _portfolio_line(rec)
+            amount = 1 if rec.amount is None else rec.amount
+            d_val = float(prices[rec.user_item_id]) * amount - value_before
+            d_inv, prev = deltas.get(rec.user_id, (0.0, 0.0))
+            deltas[rec.user_id] = (d_inv, prev + d_val)
+    return deltas
 
 
-def calculate_wear(float_value: float) -> str | None:
-    if float_value is None:
-        return None
-    
-    # Ensure float is treated as a number
-    try:
-        val = float(float_value)
-    except (ValueError, TypeError):
-        return None
-
-    if val < 0.07:
-        return "Factory New"
-    elif val < 0.15:
-        return "Minimal Wear"
-    elif val < 0.38:
-        return "Field-Tested"
-    elif val < 0.45:
-        return "Well-Worn"
-    else:
-        return "Battle-Scarred"
+def _totals_dict(total_invested, total_value) -> dict:
+    total_invested = float(total_invested or 0)
+    total_value = float(total_value or 0)
+    return {
+        "total_invested": total_invested,
+        "total_value": total_value,
+        "total_profit": round(total_value - total_invested, 2),
+    }
+
 
 class ItemRepository:
     def __init__(self, db: Session):
@@ -42,6 +216,9 @@ class ItemRepository:
             .all()
         )
 
+    def get_realized_pnl(self, user_id: int) -> dict:
+        return realized_pnl_cache.get(self.db, user_id)
+
     def get_user_item_by_id(self, user_item_id: int, user_id: int):
         return self.db.query(UserItem).filter(
             UserItem.user_item_id == user_item_id, 
@@ -78,7 +255,10 @@ class ItemRepository:
             variant=variant,
             phase=phase
         )
+        if catalog_item:
+            apply_market_fields(new_item, catalog_item)
         self.db.add(new_item)
+        self._apply_totals_delta(user_id, *_portfolio_line(new_item))
         self.db.commit()
         self.db.refresh(new_item)
         return new_item
@@ -126,6 +306,7 @@ class ItemRepository:
         )
         self.db.add(rec)
         self.db.commit()
+        realized_pnl_cache.invalidate(user_id)
         self.db.refresh(rec)
         return rec
 
@@ -182,13 +363,18 @@ class ItemRepository:
         )
         self.db.add(history_rec)
 
+        invested_before, value_before = _portfolio_line(rec)
         if sell_amount >= current_amount:
             self.db.delete(rec)
+            invested_after, value_after = 0.0, 0.0
         else:
             rec.amount = current_amount - sell_amount
             rec.last_update = datetime.datetime.now()
+            invested_after, value_after = _portfolio_line(rec)
+        self._apply_totals_delta(user_id, invested_after - invested_before, value_after - value_before)
 
         self.db.commit()
+        realized_pnl_cache.invalidate(user_id)
         self.db.refresh(history_rec)
         return history_rec
 
@@ -207,6 +393,7 @@ class ItemRepository:
                 setattr(rec, k, v)
 
         self.db.commit()
+        realized_pnl_cache.invalidate(user_id)
         self.db.refresh(rec)
         return rec
 
@@ -220,6 +407,7 @@ class ItemRepository:
             return False
         self.db.delete(rec)
         self.db.commit()
+        realized_pnl_cache.invalidate(user_id)
         return True
 
     def get_items(self, item_type: str = None, limit: int = 100, offset: int = 0):
@@ -250,14 +438,153 @@ class ItemRepository:
     def get_case_items_by_types(self, case_id: int, types: list[str]):
         return self.db.query(Item).filter(Item.case_id == case_id, Item.item_type.in_(types)).all()
 
+    def _case_membership_rows(self, case_id: int | None = None) -> list[dict]:
+        q = self.db.query(Item).filter(Item.case_id.isnot(None), Item.item_type.in_(CASE_BUCKETS))
+        if case_id is not None:
+            q = q.filter(Item.case_id == case_id)
+
+        by_case = {}
+        for itm in q.order_by(Item.case_id, Item.item_id).all():
+            by_case.setdefault(itm.case_id, []).append(itm)
+
+        rows = []
+        for cid, items in by_case.items():
+            for bucket, members in classify_case_items(items).items():
+                rows.extend(
+                    {"case_id": cid, "bucket": bucket, "item_id": m.item_id, "sort_order": pos}
+                    for pos, m in enumerate(members)
+                )
+        return rows
+
+    def _replace_case_membership(self, rows: list[dict], case_ids: list[int] | None = None) -> None:
+        delete_q = self.db.query(CaseMembership)
+        if case_ids is not None:
+            delete_q = delete_q.filter(CaseMembership.case_id.in_(case_ids))
+        try:
+            delete_q.delete(synchronize_session=False)
+            for start in range(0, len(rows), 1000):
+                self.db.execute(insert(CaseMembership.__table__), rows[start:start + 1000])
+            self.db.commit()
+        except Exception:
+            self.db.rollback()
+            raise
+
+    def rebuild_case_membership(self, case_id: int | None = None) -> int:
+        """(Re)computes CASEMEMBERSHIP for one case or the whole catalog."""
+        rows = self._case_membership_rows(case_id)
+        self._replace_case_membership(rows, [case_id] if case_id is not None else None)
+        return len(rows)
+
+    def sync_case_membership(self) -> int:
+        """
+        Compares CASEMEMBERSHIP with what ITEM says now (skins added to a
+        case, changed rarity or case_id, deleted rows) and rewrites only the
+        cases that differ. Returns the number of rewritten cases.
+        """
+        def key(row):
+            return row["bucket"], row["item_id"], row["sort_order"]
+
+        expected = {}
+        for row in self._case_membership_rows():
+            expected.setdefault(row["case_id"], set()).add(key(row))
+        stored = {}
+        for rec in self.db.query(CaseMembership.case_id, CaseMembership.bucket, CaseMembership.item_id, CaseMembership.sort_order):
+            stored.setdefault(rec.case_id, set()).add((rec.bucket, rec.item_id, rec.sort_order))
+
+        changed = sorted(cid for cid in expected.keys() | stored.keys() if expected.get(cid) != stored.get(cid))
+        if not changed:
+            return 0
+        rows = [
+            {"case_id": cid, "bucket": bucket, "item_id": item_id, "sort_order": pos}
+            for cid in changed
+            for bucket, item_id, pos in sorted(expected.get(cid, ()))
+        ]
+        self._replace_case_membership(rows, changed)
+        catalog_read_model.bump()
+        return len(changed)
+
+    def get_case_contents(self, case_id: int) -> dict[str, list]:
+        """
+        Bucketed case contents in one indexed query (CASEMEMBERSHIP primary
+        key). Read only: the table is kept up to date by sync_case_membership
+        at startup and on the scheduler.
+        """
+        rows = (
+            self.db.query(CaseMembership.bucket, Item)
+            .join(Item, Item.item_id == CaseMembership.item_id)
+            .filter(CaseMembership.case_id == case_id)
+            .order_by(CaseMembership.bucket, CaseMembership.sort_order)
+            .all()
+        )
+        contents = {bucket: [] for bucket in CASE_BUCKETS}
+        for bucket, itm in rows:
+            contents.setdefault(bucket, []).append(itm)
+        return contents
+
     def get_collection_items(self, collection_id: int):
         return self.db.query(Item).filter(Item.collection_id == collection_id).all()
 
-    def search_items(self, query: str, limit: int = 10, exclude_types: list[str] = None):
+    def _use_sql_search(self) -> bool:
+        # SEARCH_BACKEND=db on Postgres: trigram indexed column, dedupe in SQL
+        return self.db.get_bind().dialect.name == "postgresql" and Config().SEARCH_BACKEND == "db"
+
+    def _unique_by_name(self, q, limit: int | None, offset: int = 0):
+        # DISTINCT ON keeps one row per name (first by item_type, item_id),
+        # the outer query restores the usual item_type/name ordering.
+        sub = (
+            q.distinct(Item.name)
+            .order_by(Item.name, Item.item_type, Item.item_id)
+            .subquery()
+        )
+        unique = aliased(Item, sub)
+        out = self.db.query(unique).order_by(unique.item_type.asc(), unique.name.asc()).offset(offset)
+        if limit is not None:
+            out = out.limit(limit)
+        return out.all()
+
+    def _search_items_sql(self, q_str: str, limit: int, exclude_types: list[str] = None, item_type: str = None, offset: int = 0):
+        q = self.db.query(Item)
+        name_normalized = column("name_normalized")
+        for word in q_str.split():
+            token = normalize_search_text(word)
+            if token:
+                q = q.filter(name_normalized.like(f"%{token}%"))
+        if item_type:
+            q = q.filter(Item.item_type == item_type)
+        if exclude_types:
+            q = q.filter(Item.item_type.notin_(exclude_types))
+        return self._unique_by_name(q, limit, offset)
+
+    def list_unique_items_by_type(self, item_type: str, limit: int | None = None, offset: int = 0, after_name: str | None = None):
+        """
+        One item per name (lowest item_id), ordered by name. after_name is the
+        keyset cursor: the page starts right after that name, so with the
+        (item_type, name) index a page costs O(limit) however deep it is.
+        """
+        reps = self.db.query(func.min(Item.item_id).label("item_id")).filter(Item.item_type == item_type)
+        if after_name is not None:
+            reps = reps.filter(Item.name > after_name)
+        reps = reps.group_by(Item.name).order_by(Item.name.asc())
+        if offset:
+            reps = reps.offset(offset)
+        if limit is not None:
+            reps = reps.limit(limit)
+        sub = reps.subquery()
+        return (
+            self.db.query(Item)
+            .join(sub, Item.item_id == sub.c.item_id)
+            .order_by(Item.name.asc())
+            .all()
+        )
+
+    def search_items(self, query: str, limit: int = 10, exclude_types: list[str] = None, item_type: str = None, offset: int = 0):
         q_str = (query or '').strip()
         if not q_str:
             return []
 
+        if self._use_sql_search():
+            return self._search_items_sql(q_str, limit, exclude_types=exclude_types, item_type=item_type, offset=offset)
+
         q = self.db.query(Item)
         
         # Split query into words and require all words to match (AND condition)
@@ -265,6 +592,8 @@ class ItemRepository:
         for word in q_str.split():
             q = q.filter(func.lower(Item.name).like(f"%{word.lower()}%"))
 
+        if item_type:
+            q = q.filter(Item.item_type == item_type)
         if exclude_types:
             q = q.filter(Item.item_type.notin_(exclude_types))
 
@@ -273,7 +602,7 @@ class ItemRepository:
         # So we fetch a larger batch and filter duplicates by name in code.
         raw_results = (
             q.order_by(Item.item_type.asc(), Item.name.asc())
-            .limit(limit * 5) 
+            .limit((offset + limit) * 5) 
             .all()
         )
         
@@ -285,42 +614,13 @@ class ItemRepository:
                 seen_names.add(item.name)
                 unique_results.append(item)
                 
-            if len(unique_results) >= limit:
+            if len(unique_results) >= offset + limit:
                 break
                 
-        return unique_results
+        return unique_results[offset:]
 
-    def update_price(self, user_item_id: int, new_price: float):
-        itm = self.db.query(UserItem).filter(UserItem.user_item_id == user_item_id).first()
-        if itm:
-            itm.current_price = new_price
-            itm.last_update = datetime.datetime.now()
-            self.db.commit()
-
-    def update_useritems_current_price_for_item(self, item_id: int, new_price: float, user_id: int | None = None):
-        now = datetime.datetime.now()
-        q = self.db.query(UserItem).filter(UserItem.item_id == item_id)
-        if user_id is not None:
-            q = q.filter(UserItem.user_id == user_id)
-        q.update({UserItem.current_price: new_price, UserItem.last_update: now}, synchronize_session=False)
-        self.db.commit()
-
-    def save_market_price(self, market_id: int, item_id: int, price: float):
-        rec = MarketPrice(
-            market_id=market_id,
-            item_id=item_id,
-            price=price,
-            timestamp=datetime.datetime.now()
-        )
-        self.db.add(rec)
-        self.db.commit()
-
-    def update_item_current_price(self, item_id: int, new_price: float):
-        itm = self.db.query(Item).filter(Item.item_id == item_id).first()
-        if itm:
-            itm.current_price = new_price
-            itm.last_update = datetime.datetime.now()
-            self.db.commit()
+    def price_write_batch(self, chunk_size: int = 500) -> "PriceWriteBatch":
+        return PriceWriteBatch(self.db, chunk_size=chunk_size)
 
     def delete_user_item(self, user_item_id: int, user_id: int) -> bool:
         rec = (
@@ -330,7 +630,9 @@ class ItemRepository:
         )
         if not rec:
             return False
+        invested, value = _portfolio_line(rec)
         self.db.delete(rec)
+        self._apply_totals_delta(user_id, -invested, -value)
         self.db.commit()
         return True
 
@@ -342,6 +644,7 @@ class ItemRepository:
         )
         if not rec:
             return None
+        invested_before, value_before = _portfolio_line(rec)
         
         allowed = {
             'amount', 'float_value', 'pattern', 'buy_price', 'description', 'wear', 'discord_webhook_url',
@@ -366,28 +669,120 @@ class ItemRepository:
             if rec.buy_price is not None:
                 rec.current_price = rec.buy_price
 
+        if rec.item:
+            apply_market_fields(rec, rec.item)
+
         rec.last_update = datetime.datetime.now()
+        invested_after, value_after = _portfolio_line(rec)
+        self._apply_totals_delta(user_id, invested_after - invested_before, value_after - value_before)
         self.db.commit()
         self.db.refresh(rec)
         return rec
 
+    def _apply_totals_delta(self, user_id: int, d_invested: float, d_value: float) -> None:
+        _apply_portfolio_deltas(self.db, {user_id: (d_invested, d_value)})
+
+    def _portfolio_sums_query(self):
+        return self.db.query(
+            UserItem.user_id,
+            func.sum(UserItem.buy_price * func.coalesce(UserItem.amount, 1)),
+            func.sum(UserItem.current_price * func.coalesce(UserItem.amount, 1)),
+        ).group_by(UserItem.user_id)
+
     def calculate_portfolio_totals(self, user_id: int):
-        total_invested = (
-            self.db.query(func.sum(UserItem.buy_price * func.coalesce(UserItem.amount, 1)))
-            .filter(UserItem.user_id == user_id)
-            .scalar() or 0
-        )
-        total_value = (
-            self.db.query(func.sum(UserItem.current_price * func.coalesce(UserItem.amount, 1)))
-            .filter(UserItem.user_id == user_id)
-            .scalar() or 0
-        )
-        total_profit = total_value - total_invested
-        return {
-            "total_invested": total_invested,
-            "total_value": total_value,
-            "total_profit": total_profit
-        }
+        """Full aggregate over the user's USERITEM rows (see get_portfolio_totals for the O(1) read)."""
+        row = self._portfolio_sums_query().filter(UserItem.user_id == user_id).first()
+        if row is None:
+            return _totals_dict(0, 0)
+        return _totals_dict(row[1], row[2])
+
+    def get_portfolio_totals(self, user_id: int) -> dict:
+        rec = self.db.get(PortfolioTotals, user_id)
+        if rec is not None:
+            return _totals_dict(rec.total_invested, rec.total_value)
+
+        totals = self.calculate_portfolio_totals(user_id)
+        try:
+            self.db.add(PortfolioTotals(
+                user_id=user_id,
+                total_invested=_money(totals["total_invested"]),
+                total_value=_money(totals["total_value"]),
+                updated_at=datetime.datetime.now(),
+            ))
+            self.db.commit()
+        except IntegrityError:
+            # Created concurrently by another request
+            self.db.rollback()
+            rec = self.db.get(PortfolioTotals, user_id)
+            if rec is not None:
+                return _totals_dict(rec.total_invested, rec.total_value)
+        return totals
+
+    def reconcile_portfolio_totals(self, tolerance: float = 0.005, chunk_size: int = 500) -> int:
+        """
+        Compares PORTFOLIOTOTALS with a full USERITEM aggregate, corrects drifted
+        rows and creates missing ones, chunk_size users per transaction so
+        only that many totals rows are locked at a time. Returns the number
+        of rows written.
+        """
+        user_ids = {user_id for (user_id,) in self.db.query(PortfolioTotals.user_id)}
+        user_ids |= {user_id for (user_id,) in self.db.query(UserItem.user_id).distinct()}
+        user_ids = sorted(user_ids)
+
+        chunk_size = max(1, int(chunk_size))
+        fixed = 0
+        for start in range(0, len(user_ids), chunk_size):
+            fixed += self._reconcile_totals_chunk(user_ids[start:start + chunk_size], tolerance)
+        return fixed
+
+    def _reconcile_totals_chunk(self, user_ids: list[int], tolerance: float) -> int:
+        try:
+            # Lock the totals rows first: a writer that already changed USERITEM
+            # but not yet its totals row applies its delta after this commits.
+            stored = {
+                rec.user_id: rec
+                for rec in self.db.query(PortfolioTotals)
+                .filter(PortfolioTotals.user_id.in_(user_ids))
+                .with_for_update()
+                .all()
+            }
+            actual = {
+                user_id: (invested, value)
+                for user_id, invested, value in self._portfolio_sums_query().filter(UserItem.user_id.in_(user_ids)).all()
+            }
+
+            now = datetime.datetime.now()
+            fixed = 0
+            for user_id in set(stored) | set(actual):
+                expected = _totals_dict(*actual.get(user_id, (0, 0)))
+                rec = stored.get(user_id)
+                if rec is None:
+                    self.db.add(PortfolioTotals(
+                        user_id=user_id,
+                        total_invested=_money(expected["total_invested"]),
+                        total_value=_money(expected["total_value"]),
+                        updated_at=now,
+                    ))
+                    fixed += 1
+                    continue
+                if (
+                    abs(float(rec.total_invested or 0) - expected["total_invested"]) > tolerance
+                    or abs(float(rec.total_value or 0) - expected["total_value"]) > tolerance
+                ):
+                    print(
+                        f"[PortfolioTotals] Oprava uživatele {user_id}: "
+                        f"{float(rec.total_invested or 0):.2f}/{float(rec.total_value or 0):.2f} -> "
+                        f"{expected['total_invested']:.2f}/{expected['total_value']:.2f}"
+                    )
+                    rec.total_invested = _money(expected["total_invested"])
+                    rec.total_value = _money(expected["total_value"])
+                    rec.updated_at = now
+                    fixed += 1
+            self.db.commit()
+        except Exception:
+            self.db.rollback()
+            raise
+        return fixed
 
     def save_portfolio_history(self, user_id: int, totals: dict):
         rec = PortfolioHistory(
@@ -408,3 +803,130 @@ class ItemRepository:
                 cases.append(it.case)
                 seen_case_ids.add(it.case.item_id)
         return cases
+
+
+class PriceWriteBatch:
+    """
+    Buffers the writes of a price refresh run (MarketPrice rows, ITEM and
+    USERITEM current_price, per item or per row) and writes them in one
+    transaction with executemany, chunk_size rows per statement. The
+    hourly/daily price rollups are updated in the same transaction. Nothing
+    is written before flush(); if the flush fails the whole batch is rolled
+    back.
+    """
+
+    def __init__(self, db: Session, chunk_size: int = 500):
+        self.db = db
+        self.chunk_size = max(1, int(chunk_size))
+        self._market_prices: dict[tuple, dict] = {}
+        self._item_prices: dict[int, dict] = {}
+        self._useritem_prices: dict[tuple, dict] = {}
+        self._user_item_prices: dict[int, dict] = {}
+
+    def __len__(self) -> int:
+        return (
+            len(self._market_prices) + len(self._item_prices)
+            + len(self._useritem_prices) + len(self._user_item_prices)
+        )
+
+    def add_market_price(self, market_id: int, item_id: int, price: float, timestamp: datetime.datetime | None = None):
+        ts = timestamp or datetime.datetime.now()
+        self._market_prices[(market_id, item_id, ts)] = {
+            "market_id": market_id,
+            "item_id": item_id,
+            "price": price,
+            "timestamp": ts,
+        }
+
+    def set_item_price(self, item_id: int, new_price: float):
+        self._item_prices[item_id] = {
+            "b_item_id": item_id,
+            "current_price": new_price,
+            "last_update": datetime.datetime.now(),
+        }
+
+    def set_useritems_price_for_item(self, item_id: int, new_price: float, user_id: int | None = None):
+        # item_id's USERITEM rows, only user_id's when given
+        self._useritem_prices[(item_id, user_id)] = {
+            "b_item_id": item_id,
+            "b_user_id": user_id,
+            "current_price": new_price,
+            "last_update": datetime.datetime.now(),
+        }
+
+    def set_user_item_price(self, user_item_id: int, new_price: float):
+        # One USERITEM row (float-specific price); applied after the per-item updates
+        self._user_item_prices[user_item_id] = {
+            "b_user_item_id": user_item_id,
+            "current_price": new_price,
+            "last_update": datetime.datetime.now(),
+        }
+
+    def _chunks(self, rows: list[dict]):
+        for start in range(0, len(rows), self.chunk_size):
+            yield rows[start:start + self.chunk_size]
+
+    def flush(self) -> dict:
+        counts = {
+            "market_prices": len(self._market_prices),
+            "items": len(self._item_prices),
+            "useritems": len(self._useritem_prices) + len(self._user_item_prices),
+        }
+        if not len(self):
+            return counts
+
+        item_table = Item.__table__
+        useritem_table = UserItem.__table__
+        update_item = (
+            update(item_table)
+            .where(item_table.c.item_id == bindparam("b_item_id"))
+            .values(current_price=bindparam("current_price"), last_update=bindparam("last_update"))
+        )
+        update_useritems = (
+            update(useritem_table)
+            .where(useritem_table.c.item_id == bindparam("b_item_id"))
+            .values(current_price=bindparam("current_price"), last_update=bindparam("last_update"))
+        )
+        update_useritems_for_user = update_useritems.where(useritem_table.c.user_id == bindparam("b_user_id"))
+        update_user_item = (
+            update(useritem_table)
+            .where(useritem_table.c.user_item_id == bindparam("b_user_item_id"))
+            .values(current_price=bindparam("current_price"), last_update=bindparam("last_update"))
+        )
+
+        all_users = [r for r in self._useritem_prices.values() if r["b_user_id"] is None]
+        per_user = [r for r in self._useritem_prices.values() if r["b_user_id"] is not None]
+
+        market_rows = list(self._market_prices.values())
+        item_prices = {r["b_item_id"]: r["current_price"] for r in self._item_prices.values()}
+        try:
+            for rows in self._chunks(market_rows):
+                self.db.execute(insert(MarketPrice.__table__), rows)
+            apply_price_rollups(self.db, market_rows, chunk_size=self.chunk_size)
+            for rows in self._chunks(list(self._item_prices.values())):
+                self.db.execute(update_item, rows)
+            portfolio_deltas = _useritem_price_deltas(self.db, all_users + per_user, chunk_size=self.chunk_size)
+            for rows in self._chunks(all_users):
+                self.db.execute(update_useritems, rows)
+            for rows in self._chunks(per_user):
+                self.db.execute(update_useritems_for_user, rows)
+            # Single rows are diffed against the prices written just above
+            single_rows = list(self._user_item_prices.values())
+            for user_id, (d_inv, d_val) in _user_item_price_deltas(self.db, single_rows, chunk_size=self.chunk_size).items():
+                prev_inv, prev_val = portfolio_deltas.get(user_id, (0.0, 0.0))
+                portfolio_deltas[user_id] = (prev_inv + d_inv, prev_val + d_val)
+            for rows in self._chunks(single_rows):
+                self.db.execute(update_user_item, rows)
+            _apply_portfolio_deltas(self.db, portfolio_deltas, chunk_size=self.chunk_size)
+            self.db.commit()
+        except Exception:
+            self.db.rollback()
+            raise
+        finally:
+            self._market_prices.clear()
+            self._item_prices.clear()
+            self._useritem_prices.clear()
+            self._user_item_prices.clear()
+
+        _item_prices_changed(item_prices)
+        return counts
@@ -0,0 +1,439 @@
+import asyncio
+import datetime
+import logging
+import math
+import os
+import socket
+import time
+import uuid
+from collections import OrderedDict
+from sqlalchemy import func, or_
+from sqlalchemy.exc import IntegrityError
+from database import SessionLocal
+from models import PortfolioHistory, SchedulerLease, SchedulerMember
+from refresh_planner import PortfolioRefreshPlanner, query_key
+from fetch_engine import AsyncPriceFetchEngine
+from price_cache import get_async_market_strategy, get_price_cache
+from config import Config
+
+logger = logging.getLogger("scheduler")
+
+
+class ShardLeases:
+    """
+    Splits scheduled refreshes between processes/nodes: a user belongs to
+    shard user_id % shards and only the holder of that shard's SCHEDULERLEASE
+    row refreshes them. A lease is taken over only once it expired, so the
+    shards of a dead process move elsewhere within lease_seconds.
+
+    Without max_shards every live process (SCHEDULERMEMBER heartbeat) gets
+    an even share: a process holding more than its share releases the
+    surplus on its next renewal, so a newly started process picks it up.
+    """
+
+    def __init__(self, shards: int, lease_seconds: int, max_shards: int = 0, owner: str | None = None) -> None:
+        self.shards = max(1, int(shards))
+        self.lease_seconds = max(1, int(lease_seconds))
+        # 0 = even share between the live processes
+        self.max_shards = min(self.shards, max_shards) if max_shards and max_shards > 0 else 0
+        self.owner = owner or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.owned: frozenset[int] = frozenset()
+        self.renewed_at: float | None = None
+
+    def owns(self, user_id: int) -> bool:
+        return user_id % self.shards in self.owned
+
+    def needs_renewal(self) -> bool:
+        # A third of the lease left as margin for a slow renewal
+        return self.renewed_at is None or time.monotonic() - self.renewed_at >= self.lease_seconds / 3
+
+    def _ensure_rows(self, db) -> None:
+        existing = {shard for (shard,) in db.query(SchedulerLease.shard).filter(SchedulerLease.shard < self.shards)}
+        missing = [{"shard": shard} for shard in range(self.shards) if shard not in existing]
+        if not missing:
+            return
+        try:
+            db.bulk_insert_mappings(SchedulerLease, missing)
+            db.commit()
+        except IntegrityError:
+            # Another process inserted them first
+            db.rollback()
+
+    def _share(self, db, now: datetime.datetime, expires_at: datetime.datetime) -> int:
+        if self.max_shards:
+            return self.max_shards
+        # Only this process writes its own member row, merge cannot race
+        db.merge(SchedulerMember(owner=self.owner, expires_at=expires_at))
+        db.query(SchedulerMember).filter(SchedulerMember.expires_at < now).delete(synchronize_session=False)
+        members = db.query(func.count(SchedulerMember.owner)).filter(SchedulerMember.expires_at >= now).scalar()
+        return math.ceil(self.shards / max(1, members or 1))
+
+    def renew(self) -> frozenset[int]:
+        """Extends held leases up to this process's share, then takes free or expired shards."""
+        db = SessionLocal()
+        try:
+            self._ensure_rows(db)
+            now = datetime.datetime.utcnow()
+            expires_at = now + datetime.timedelta(seconds=self.lease_seconds)
+            share = self._share(db, now, expires_at)
+            held = sorted(self.owned)
+            for shard in held[share:]:
+                db.query(SchedulerLease).filter(
+                    SchedulerLease.shard == shard,
+                    SchedulerLease.owner == self.owner,
+                ).update({SchedulerLease.owner: None, SchedulerLease.expires_at: None}, synchronize_session=False)
+            # Held shards first so a process keeps what it has
+            order = held[:share] + [s for s in range(self.shards) if s not in self.owned]
+            owned = set()
+            for shard in order:
+                if len(owned) >= share:
+                    break
+                # Conditional UPDATE: of two processes racing for a shard, one matches
+                claimed = db.query(SchedulerLease).filter(
+                    SchedulerLease.shard == shard,
+                    or_(
+                        SchedulerLease.owner == self.owner,
+                        SchedulerLease.owner == None,
+                        SchedulerLease.expires_at == None,
+                        SchedulerLease.expires_at < now,
+                    ),
+                ).update(
+                    {SchedulerLease.owner: self.owner, SchedulerLease.expires_at: expires_at},
+                    synchronize_session=False,
+                )
+                if claimed:
+                    owned.add(shard)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+        if len(held) > share:
+            logger.info(f"Released shards {held[share:]} (share {share} of {self.shards})")
+        self.owned = frozenset(owned)
+        self.renewed_at = time.monotonic()
+        return self.owned
+
+    def release(self) -> None:
+        db = SessionLocal()
+        try:
+            db.query(SchedulerLease).filter(SchedulerLease.owner == self.owner).update(
+                {SchedulerLease.owner: None, SchedulerLease.expires_at: None},
+                synchronize_session=False,
+            )
+            db.query(SchedulerMember).filter(SchedulerMember.owner == self.owner).delete(synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+        self.owned = frozenset()
+        self.renewed_at = None
+
+
+class _TickFetches:
+    """Price fetches of one tick: each unique query at most once, started by the first batch that needs it."""
+
+    def __init__(self, engine: AsyncPriceFetchEngine, queries: dict[tuple, dict]) -> None:
+        self.engine = engine
+        self.queries = queries
+        self._tasks: dict[tuple, asyncio.Task] = {}
+
+    async def wait(self, keys: set[tuple], deadline: float) -> dict | None:
+        """Results by query key, or None when they did not all arrive before the deadline."""
+        tasks = {}
+        for key in keys:
+            task = self._tasks.get(key)
+            if task is None:
+                task = self._tasks[key] = asyncio.ensure_future(self.engine.fetch_one(self.queries[key]))
+            tasks[key] = task
+        if tasks:
+            # asyncio.wait leaves the unfinished fetches running for the other batches
+            _, pending = await asyncio.wait(tasks.values(), timeout=max(0.0, deadline - time.monotonic()))
+            if pending:
+                return None
+        return {key: task.result() for key, task in tasks.items()}
+
+    def cancel(self) -> None:
+        for task in self._tasks.values():
+            task.cancel()
+
+
+class ScheduledRefreshExecutor:
+    """
+    Scheduled portfolio refresh of due users, run in ticks on the event loop.
+
+    A tick renews the shard leases and plans all due owned users at once,
+    split over `workers` sessions (one PortfolioRefreshPlanner each). The
+    price queries are deduplicated across the whole tick, so every unique
+    query is fetched once however many batches need it. Each worker then
+    applies its users in batches of `batch_size` as their fetches complete.
+    Fetches get only the time left in the tick budget; a batch whose fetches
+    ran out of time is written nothing and, like the batches after it, stays
+    queued for the next tick. Writes that started are never cancelled. Only
+    one tick runs at a time, users submitted meanwhile wait for the next one,
+    which starts right after.
+
+    Users of shards held by another process are kept aside for two lease
+    periods: if their shard comes to this process in that time (the holder
+    died or released it) and the holder did not refresh them yet, they are
+    refreshed here; otherwise they are left to the holder, which got the
+    same users from its own scheduler.
+    """
+
+    def __init__(
+        self,
+        leases: ShardLeases,
+        strategy_factory,
+        workers: int = 4,
+        batch_size: int = 10,
+        tick_seconds: int = 60,
+        tick_budget_seconds: int = 50,
+    ) -> None:
+        self.leases = leases
+        self.strategy_factory = strategy_factory
+        self.workers = max(1, int(workers))
+        self.batch_size = max(1, int(batch_size))
+        self.tick_seconds = max(1, int(tick_seconds))
+        self.tick_budget_seconds = max(1, min(int(tick_budget_seconds), self.tick_seconds))
+        self._pending: OrderedDict[int, None] = OrderedDict()
+        # user_id -> (time.monotonic() until which the user waits for its shard, deferred at)
+        self._deferred: dict[int, tuple[float, datetime.datetime]] = {}
+        self._task: asyncio.Task | None = None
+        self._wake: asyncio.Event | None = None
+        self._renew_lock: asyncio.Lock | None = None
+        self._stopping = False
+
+    @property
+    def pending_count(self) -> int:
+        return len(self._pending)
+
+    @property
+    def deferred_count(self) -> int:
+        return len(self._deferred)
+
+    def submit(self, user_ids: list[int]) -> None:
+        """Queues due users and starts the tick loop if idle. Call on the event loop."""
+        for user_id in user_ids:
+            self._deferred.pop(user_id, None)
+            self._pending[user_id] = None
+        if self._stopping or not self._pending:
+            return
+        if self._task is None or self._task.done():
+            self._wake = asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        else:
+            self._wake.set()
+
+    async def renew_leases(self) -> frozenset[int]:
+        """Also run by the scheduler between ticks, so held leases do not lapse while idle."""
+        if self._renew_lock is None:
+            self._renew_lock = asyncio.Lock()
+        async with self._renew_lock:
+            return await asyncio.to_thread(self.leases.renew)
+
+    async def _run(self) -> None:
+        while (self._pending or self._deferred) and not self._stopping:
+            started = time.monotonic()
+            self._wake.clear()
+            try:
+                await self.run_tick()
+            except Exception as e:
+                logger.error(f"Scheduled refresh tick failed: {e}")
+            if not (self._pending or self._deferred) or self._stopping:
+                break
+            # Leftovers wait for the next tick slot, new submissions start it early
+            try:
+                await asyncio.wait_for(self._wake.wait(), max(0.0, self.tick_seconds - (time.monotonic() - started)))
+            except asyncio.TimeoutError:
+                pass
+
+    def _defer(self, user_id: int) -> None:
+        self._deferred.setdefault(
+            user_id,
+            (time.monotonic() + 2 * self.leases.lease_seconds, datetime.datetime.now()),
+        )
+
+    @staticmethod
+    def _refreshed_since(deferred: dict[int, datetime.datetime]) -> set[int]:
+        # Users the previous holder already refreshed (PORTFOLIOHISTORY snapshot)
+        db = SessionLocal()
+        try:
+            rows = (
+                db.query(PortfolioHistory.user_id, func.max(PortfolioHistory.timestamp))
+                .filter(PortfolioHistory.user_id.in_(list(deferred)))
+                .group_by(PortfolioHistory.user_id)
+            )
+            return {user_id for user_id, ts in rows if ts is not None and ts >= deferred[user_id]}
+        finally:
+            db.close()
+
+    async def _sort_pending(self) -> None:
+        # Deferred users whose shard is now ours are due again, unless the
+        # previous holder got to them; the rest keeps waiting until it expires
+        now = time.monotonic()
+        taken_over = {}
+        for user_id, (until, deferred_at) in list(self._deferred.items()):
+            if self.leases.owns(user_id):
+                del self._deferred[user_id]
+                taken_over[user_id] = deferred_at
+            elif until <= now:
+                del self._deferred[user_id]
+        if taken_over:
+            done = await asyncio.to_thread(self._refreshed_since, taken_over)
+            for user_id in taken_over:
+                if user_id not in done:
+                    self._pending[user_id] = None
+        for user_id in [u for u in self._pending if not self.leases.owns(u)]:
+            del self._pending[user_id]
+            self._defer(user_id)
+
+    def _take_due(self) -> list[int]:
+        due = []
+        while self._pending:
+            user_id, _ = self._pending.popitem(last=False)
+            # Users of other shards wait for their holder (see _sort_pending)
+            if self.leases.owns(user_id):
+                due.append(user_id)
+            else:
+                self._defer(user_id)
+        return due
+
+    def _requeue(self, batch: list[int]) -> None:
+        for user_id in reversed(batch):
+            self._pending[user_id] = None
+            self._pending.move_to_end(user_id, last=False)
+
+    async def _apply_batches(self, planner, plans: list[dict], slots: dict, fetches: "_TickFetches", deadline: float, stats: dict) -> None:
+        for start in range(0, len(plans), self.batch_size):
+            if self._stopping or time.monotonic() >= deadline:
+                self._requeue([plan["user_id"] for plan in plans[start:]])
+                return
+            if self.leases.needs_renewal():
+                await self.renew_leases()
+            batch = []
+            for plan in plans[start:start + self.batch_size]:
+                if self.leases.owns(plan["user_id"]):
+                    batch.append(plan)
+                else:
+                    self._defer(plan["user_id"])
+            if not batch:
+                continue
+            keys = {query_key(query) for plan in batch for _, query in plan["planned"]}
+            fetched = await fetches.wait(keys, deadline)
+            if fetched is None:
+                # Out of tick budget before any write: this and the later batches go again next tick
+                stats["timed_out"] += len(batch)
+                self._requeue([plan["user_id"] for plan in batch + plans[start + self.batch_size:]])
+                return
+            try:
+                results = await asyncio.to_thread(
+                    planner.apply, batch, slots, {slots[key]: raw for key, raw in fetched.items()}
+                )
+            except Exception as e:
+                logger.error(f"Scheduled refresh batch {[plan['user_id'] for plan in batch]} failed: {e}")
+                results = {}
+            for plan in batch:
+                if plan["user_id"] in results:
+                    stats["refreshed"] += 1
+                else:
+                    stats["failed"] += 1
+                    logger.error(f"Failed to update portfolio for user {plan['user_id']}")
+
+    async def _refresh(self, due: list[int], deadline: float, stats: dict) -> None:
+        # Every session is used by one thread at a time and closed only after
+        # its planning and writes have finished
+        strategy = self.strategy_factory()
+        groups = [due[i::self.workers] for i in range(min(self.workers, len(due)))]
+        sessions = [SessionLocal() for _ in groups]
+        try:
+            planners = [PortfolioRefreshPlanner(db, strategy) for db in sessions]
+            planned = await asyncio.gather(
+                *(asyncio.to_thread(planner.plan, group) for planner, group in zip(planners, groups)),
+                return_exceptions=True,
+            )
+            queries: dict[tuple, dict] = {}
+            work = []
+            for planner, group, result in zip(planners, groups, planned):
+                if isinstance(result, Exception):
+                    logger.error(f"Scheduled refresh planning of {group} failed: {result}")
+                    result = ([], [], {})
+                plans, unique_queries, slots = result
+                for user_id in set(group) - {plan["user_id"] for plan in plans}:
+                    stats["failed"] += 1
+                    logger.error(f"Failed to update portfolio for user {user_id}")
+                for query in unique_queries:
+                    key = query_key(query)
+                    if key not in queries:
+                        queries[key] = dict(query)
+                    elif not query["api_key"]:
+                        # Same rule as the planner: the server pool pays when anyone relies on it
+                        queries[key]["api_key"] = None
+                work.append((planner, plans, slots))
+            stats["unique_queries"] = len(queries)
+
+            fetches = _TickFetches(AsyncPriceFetchEngine(strategy), queries)
+            try:
+                await asyncio.gather(
+                    *(self._apply_batches(planner, plans, slots, fetches, deadline, stats) for planner, plans, slots in work)
+                )
+            finally:
+                fetches.cancel()
+        finally:
+            for db in sessions:
+                db.close()
+
+    async def run_tick(self) -> dict:
+        owned = await self.renew_leases()
+        await self._sort_pending()
+        deadline = time.monotonic() + self.tick_budget_seconds
+        stats = {"due": 0, "unique_queries": 0, "refreshed": 0, "failed": 0, "timed_out": 0}
+        cache_before = get_price_cache().stats()
+
+        due = self._take_due()
+        stats["due"] = len(due)
+        if due:
+            await self._refresh(due, deadline, stats)
+        stats["carried_over"] = len(self._pending)
+        stats["deferred"] = len(self._deferred)
+        # Price cache counters are process-wide, so this includes requests served meanwhile
+        cache_after = get_price_cache().stats()
+        stats["cache_hits"] = cache_after["hits"] - cache_before["hits"]
+        stats["cache_misses"] = cache_after["misses"] - cache_before["misses"]
+        lookups = stats["cache_hits"] + stats["cache_misses"]
+        logger.info(
+            f"Scheduled refresh tick: {stats['due']} due users -> {stats['unique_queries']} unique queries, "
+            f"{stats['refreshed']} refreshed, {stats['failed']} failed, "
+            f"{stats['timed_out']} timed out, {stats['carried_over']} carried over, "
+            f"{stats['deferred']} waiting for other shard holders (shards {sorted(owned)} of {self.leases.shards}); "
+            f"price cache {stats['cache_hits']} hits / {stats['cache_misses']} misses"
+            f" ({(stats['cache_hits'] / lookups if lookups else 0.0):.0%}, {cache_after['backend']})"
+        )
+        return stats
+
+    async def close(self) -> None:
+        """Lets running batches finish, then releases the leases."""
+        self._stopping = True
+        if self._task is not None and not self._task.done():
+            self._wake.set()
+            await self._task
+        await asyncio.to_thread(self.leases.release)
+
+
+def _build_executor() -> ScheduledRefreshExecutor:
+    cfg = Config()
+    leases = ShardLeases(
+        cfg.SCHEDULED_REFRESH_SHARDS,
+        cfg.SCHEDULED_REFRESH_LEASE_SECONDS,
+        max_shards=cfg.SCHEDULED_REFRESH_SHARDS_PER_PROCESS,
+    )
+    return ScheduledRefreshExecutor(
+        leases,
+        get_async_market_strategy,
+        workers=cfg.SCHEDULED_REFRESH_WORKERS,
+        batch_size=cfg.SCHEDULED_REFRESH_BATCH_SIZE,
+        tick_seconds=cfg.SCHEDULED_REFRESH_TICK_SECONDS,
+        tick_budget_seconds=cfg.SCHEDULED_REFRESH_TICK_BUDGET_SECONDS,
+    )
+
+
+scheduled_refresh = _build_executor()
@@ -1,9 +1,16 @@
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.date import DateTrigger
 from database import SessionLocal
-from models import User
-from service import PriceService
-from strategy import CSFloatStrategy
+from repository import ItemRepository
+from portfolio_history import compact_portfolio_history
+from analytics import warm_daily_closes
+from notification_index import notification_index, MINUTES_PER_DAY
+from scheduled_refresh import scheduled_refresh
+from search_index import catalog_index
+from fx import fx_rates
+from catalog_refresh import catalog_refresher
+from config import Config
 import datetime
 import logging
 
@@ -11,56 +18,215 @@ import logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("scheduler")
 
-def check_portfolio_notifications():
+NOTIFICATION_JOB_ID = "portfolio-notifications"
+
+
+def _utc_now() -> datetime.datetime:
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+def _minute_of(ts: datetime.datetime) -> int:
+    return ts.hour * 60 + ts.minute
+
+
+def schedule_next_notification(after_minute: int | None = None):
+    """
+    Arms a one-shot job for the next minute (UTC) that has users in the
+    notification index, strictly after `after_minute` (default: now).
+    Without any scheduled users there is no job at all.
+
+    Re-arming (no after_minute: index reload, settings change) keeps a
+    pending job that has not fired yet, unless the new slot comes first;
+    that job arms the following slot itself when it runs.
     """
-    Checks for users who have scheduled a portfolio update for the current time.
-    Time is in UTC (HH:MM).
+    now = _utc_now().replace(second=0, microsecond=0)
+    rearm = after_minute is None
+    if rearm:
+        after_minute = _minute_of(now)
+    next_minute = notification_index.next_minute_after(after_minute)
+    if next_minute is None:
+        if scheduler.get_job(NOTIFICATION_JOB_ID):
+            scheduler.remove_job(NOTIFICATION_JOB_ID)
+        return None
+
+    # Occurrence of after_minute closest to now (a job may start slightly early or late)
+    offset = (_minute_of(now) - after_minute) % MINUTES_PER_DAY
+    if offset > MINUTES_PER_DAY // 2:
+        offset -= MINUTES_PER_DAY
+    base = now - datetime.timedelta(minutes=offset)
+    delta = (next_minute - after_minute) % MINUTES_PER_DAY or MINUTES_PER_DAY
+    run_date = base + datetime.timedelta(minutes=delta)
+    if rearm:
+        # Future run_date or still within misfire grace: the slot has not fired
+        pending = scheduler.get_job(NOTIFICATION_JOB_ID)
+        if pending is not None and pending.next_run_time is not None and pending.next_run_time <= run_date:
+            return pending.next_run_time
+    scheduler.add_job(
+        check_portfolio_notifications,
+        DateTrigger(run_date=run_date),
+        args=[next_minute],
+        id=NOTIFICATION_JOB_ID,
+        replace_existing=True,
+        misfire_grace_time=60,
+    )
+    return run_date
+
+
+async def check_portfolio_notifications(minute: int | None = None):
+    """
+    Runs the portfolio update for users scheduled at `minute` (UTC minute of
+    day, from the notification index) and arms the job for the next slot.
     """
-    # Use UTC now
-    now = datetime.datetime.utcnow()
-    current_time_str = now.strftime("%H:%M")
-    
-    # logger.info(f"Scheduler tick: {current_time_str}")
-    
+    if minute is None:
+        minute = _minute_of(_utc_now())
+    # Arm the next wake-up first, a long refresh must not delay it
+    schedule_next_notification(minute)
+
+    user_ids = notification_index.users_at(minute)
+    if not user_ids:
+        return
+
+    slot = f"{minute // 60:02d}:{minute % 60:02d}"
+    logger.info(f"Found {len(user_ids)} users scheduled for update at {slot}")
+    # The executor refreshes them in parallel batches within a per-tick time
+    # budget; the job itself returns right away, so the next slot's run is
+    # never skipped while a big batch is still going.
+    scheduled_refresh.submit(user_ids)
+
+
+async def renew_refresh_leases():
+    try:
+        await scheduled_refresh.renew_leases()
+    except Exception as e:
+        logger.error(f"Scheduler lease renewal failed: {e}")
+
+
+def reload_notification_index():
+    # Rebuilt from USER: picks up changes made by other workers (PATCH only
+    # updates the index of the process that served it) or directly in the DB
+    db = SessionLocal()
+    try:
+        count = notification_index.load(db)
+    except Exception as e:
+        logger.error(f"Notification index reload failed: {e}")
+        return
+    finally:
+        db.close()
+    run_date = schedule_next_notification()
+    logger.info(f"Notification index: {count} users, next run {run_date}")
+
+
+def on_notification_settings_changed(user_id: int, webhook_url: str | None, notification_time: str | None):
+    """Called after PATCH /users/me commits."""
+    if notification_index.update_user(user_id, webhook_url, notification_time):
+        schedule_next_notification()
+
+def rebuild_search_index():
+    # Picks up catalog rows added/renamed outside the API (imports, scripts).
+    db = SessionLocal()
+    try:
+        catalog_index.rebuild(db)
+    except Exception as e:
+        logger.error(f"Search index rebuild failed: {e}")
+    finally:
+        db.close()
+
+def sync_case_membership():
+    # Case contents changed outside the API (imports, scripts): new skins, rarity
+    db = SessionLocal()
+    try:
+        changed = ItemRepository(db).sync_case_membership()
+        if changed:
+            logger.info(f"Case membership rebuilt for {changed} cases")
+    except Exception as e:
+        logger.error(f"Case membership sync failed: {e}")
+    finally:
+        db.close()
+
+def check_portfolio_totals():
+    # Safety net for the incrementally maintained PORTFOLIOTOTALS rows.
+    db = SessionLocal()
+    try:
+        fixed = ItemRepository(db).reconcile_portfolio_totals()
+        if fixed:
+            logger.warning(f"Portfolio totals reconciled for {fixed} users")
+    except Exception as e:
+        logger.error(f"Portfolio totals check failed: {e}")
+    finally:
+        db.close()
+
+def compact_portfolio_snapshots():
+    cfg = Config()
+    db = SessionLocal()
+    try:
+        compact_portfolio_history(
+            db,
+            raw_retention_days=cfg.PORTFOLIO_HISTORY_RAW_RETENTION_DAYS,
+            daily_retention_days=cfg.PORTFOLIO_HISTORY_DAILY_RETENTION_DAYS,
+        )
+    except Exception as e:
+        logger.error(f"Portfolio history compaction failed: {e}")
+    finally:
+        db.close()
+
+def refresh_fx_rates():
+    # Blocking HTTP, runs in the scheduler's thread pool, never in a request
+    db = SessionLocal()
+    try:
+        if not fx_rates.refresh(db):
+            logger.warning("FX rate refresh failed, keeping previous rates")
+    except Exception as e:
+        logger.error(f"FX rate refresh failed: {e}")
+    finally:
+        db.close()
+
+def refresh_catalog_prices():
+    # Blocking HTTP, runs in the scheduler's thread pool
+    try:
+        catalog_refresher.run_once()
+    except Exception as e:
+        logger.error(f"Catalog refresh failed: {e}")
+
+def warm_analytics_cache():
+    # Daily close series roll over at midnight; reload them before users ask
     db = SessionLocal()
     try:
-        # Get users with notification enabled AND matching time
-        # We check filters: webhook_url IS NOT NULL and time == current_time
-        users = db.query(User).filter(
-            User.discord_portfolio_webhook_url != None,
-            User.discord_portfolio_webhook_url != "",
-            User.discord_portfolio_notification_time == current_time_str
-        ).all()
-        
-        if not users:
-            return # Silent if no work
-
-        logger.info(f"Found {len(users)} users scheduled for update at {current_time_str}")
-        
-        strategy = CSFloatStrategy()
-        # Note: PriceService uses requests (sync) and db operations.
-        # Since this runs in a thread pool executor (default for sync functions in AsyncIOScheduler),
-        # blocking is okay and won't freeze the main event loop.
-        service = PriceService(db, strategy)
-        
-        for user in users:
-            try:
-                logger.info(f"Running scheduled update for user: {user.username} (ID: {user.user_id})")
-                service.update_portfolio_prices(user.user_id)
-                logger.info(f"Update completed for user: {user.username}")
-            except Exception as e:
-                logger.error(f"Failed to update portfolio for user {user.user_id}: {e}")
-                
+        count = warm_daily_closes(db)
+        logger.info(f"Analytics cache warmed for {count} items")
     except Exception as e:
-        logger.error(f"Scheduler loop error: {e}")
+        logger.error(f"Analytics cache warm-up failed: {e}")
     finally:
         db.close()
 
 scheduler = AsyncIOScheduler()
 
 def start_scheduler():
-    # Cron trigger: execute every minute
-    # This checks if the current minute matches the user's setting
-    scheduler.add_job(check_portfolio_notifications, "cron", minute='*')
+    # Portfolio notifications wake up only for minutes that have users
+    # (see schedule_next_notification); the reload is a safety net.
+    reload_notification_index()
+    cfg = Config()
+    scheduler.add_job(reload_notification_index, "interval", minutes=max(1, cfg.NOTIFICATION_INDEX_RELOAD_MINUTES))
+    if cfg.SEARCH_BACKEND == "memory":
+        scheduler.add_job(rebuild_search_index, "interval", seconds=max(60, cfg.SEARCH_INDEX_REFRESH_SECONDS))
+    scheduler.add_job(sync_case_membership, "interval", minutes=max(1, cfg.CASE_MEMBERSHIP_SYNC_MINUTES))
+    scheduler.add_job(check_portfolio_totals, "interval", minutes=max(1, cfg.PORTFOLIO_TOTALS_CHECK_MINUTES))
+    # Nightly, outside the usual notification times
+    scheduler.add_job(compact_portfolio_snapshots, "cron", hour=3, minute=17)
+    scheduler.add_job(warm_analytics_cache, "cron", hour=0, minute=2)
+    # First run right away; until it finishes the persisted (or default) rates are used
+    scheduler.add_job(
+        refresh_fx_rates,
+        "interval",
+        minutes=max(1, cfg.FX_REFRESH_MINUTES),
+        next_run_time=datetime.datetime.now(),
+    )
+    # Keeps the shard leases of the scheduled refresh held between ticks
+    scheduler.add_job(
+        renew_refresh_leases,
+        "interval",
+        seconds=max(10, cfg.SCHEDULED_REFRESH_LEASE_SECONDS // 3),
+    )
+    if cfg.CATALOG_REFRESH_BUDGET_PER_HOUR > 0:
+        scheduler.add_job(refresh_catalog_prices, "interval", minutes=max(1, cfg.CATALOG_REFRESH_INTERVAL_MINUTES))
     scheduler.start()
     logger.info("Portfolio Notification Scheduler started (UTC).")
@@ -0,0 +1,209 @@
+import bisect
+import heapq
+import re
+import threading
+import time
+from collections import OrderedDict
+from sqlalchemy.orm import Session
+from models import Item
+
+_SPLIT_RE = re.compile(r"[\W_]+", re.UNICODE)
+
+# Item attributes the /search response needs (see SearchResponseItem in main.py)
+_INDEXED_FIELDS = (
+    "item_id", "name", "item_type", "slug", "inspect", "def_index", "paint_index",
+    "rarity_index", "quality", "rarity", "current_price", "case_id", "min_float", "max_float",
+)
+
+
+def tokenize(text: str | None) -> list[str]:
+    """'★ Tec-9 | Whiteout' -> ['tec', '9', 'whiteout']"""
+    return [t for t in _SPLIT_RE.split((text or "").lower()) if t]
+
+
+def index_tokens(name: str | None) -> set[str]:
+    # Adjacent tokens are also indexed joined, so "tec9" finds "Tec-9" and
+    # "m4a1s" finds "M4A1-S" while "tec 9" / "tec-9" match the plain tokens.
+    tokens = tokenize(name)
+    joined = {a + b for a, b in zip(tokens, tokens[1:])}
+    return set(tokens) | joined
+
+
+class IndexedItem:
+    """Detached copy of an ITEM row with the fields used by search responses."""
+
+    __slots__ = _INDEXED_FIELDS
+
+    def __init__(self, itm) -> None:
+        for field in _INDEXED_FIELDS:
+            setattr(self, field, getattr(itm, field, None))
+
+
+class _Entry:
+    __slots__ = ("name", "compact", "items", "rank")
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.compact = "".join(tokenize(name))
+        self.items: list[IndexedItem] = []
+        # Position in (len(name), name) order, set in build(); tie-break after score
+        self.rank = 0
+
+    def pick(self, item_type: str | None = None, exclude_types: set | None = None) -> IndexedItem | None:
+        # One result per name; items are pre-sorted by (item_type, item_id).
+        for it in self.items:
+            if item_type is not None and it.item_type != item_type:
+                continue
+            if exclude_types and it.item_type in exclude_types:
+                continue
+            return it
+        return None
+
+
+class CatalogSearchIndex:
+    """
+    In-process inverted index over the ITEM catalog for /search autocomplete.
+    Every query token has to prefix-match some token of the name; results are
+    ranked (exact token > prefix, name starting with the query, shorter name)
+    and deduplicated by name. Rebuilt from the DB on startup and periodically,
+    current prices are patched in place when a refresh writes them.
+    """
+
+    RESULT_CACHE_SIZE = 2048
+
+    def __init__(self) -> None:
+        self._results: OrderedDict[tuple, list[IndexedItem]] = OrderedDict()
+        self._entries: list[_Entry] = []
+        self._vocab: list[str] = []
+        self._postings: dict[str, list[int]] = {}
+        self._by_item_id: dict[int, IndexedItem] = {}
+        self._lock = threading.Lock()
+        self.built_at: float | None = None
+
+    @property
+    def is_ready(self) -> bool:
+        return self.built_at is not None
+
+    def build(self, items) -> None:
+        entries_by_name: dict[str, _Entry] = {}
+        by_item_id = {}
+        for itm in items:
+            if not itm.name:
+                continue
+            doc = IndexedItem(itm)
+            by_item_id[doc.item_id] = doc
+            entry = entries_by_name.get(doc.name)
+            if entry is None:
+                entry = entries_by_name[doc.name] = _Entry(doc.name)
+            entry.items.append(doc)
+
+        entries = list(entries_by_name.values())
+        for rank, entry in enumerate(sorted(entries, key=lambda e: (len(e.name), e.name))):
+            entry.rank = rank
+        postings: dict[str, list[int]] = {}
+        for entry_id, entry in enumerate(entries):
+            entry.items.sort(key=lambda d: (d.item_type or "", d.item_id))
+            for token in index_tokens(entry.name):
+                postings.setdefault(token, []).append(entry_id)
+
+        # Swap in the new structures at once; searches running meanwhile keep
+        # using the old ones.
+        with self._lock:
+            self._entries = entries
+            self._postings = postings
+            self._vocab = sorted(postings)
+            self._by_item_id = by_item_id
+            self._results = OrderedDict()
+            self.built_at = time.time()
+
+    def rebuild(self, db: Session) -> int:
+        started = time.perf_counter()
+        items = db.query(Item).all()
+        self.build(items)
+        print(f"[SearchIndex] Index postaven: {len(items)} itemů, {len(self._entries)} názvů, {time.perf_counter() - started:.2f}s")
+        return len(items)
+
+    def patch_prices(self, prices: dict[int, float]) -> None:
+        by_item_id = self._by_item_id
+        for item_id, price in prices.items():
+            doc = by_item_id.get(item_id)
+            if doc is not None:
+                doc.current_price = price
+
+    def _match_token(self, vocab: list[str], postings: dict, token: str) -> dict[int, int]:
+        # Exact token scores 2, prefix of a longer token 1. bisect_left lands on
+        # the exact word first (if present), so setdefault keeps the best score.
+        scores: dict[int, int] = {}
+        i = bisect.bisect_left(vocab, token)
+        while i < len(vocab) and vocab[i].startswith(token):
+            word = vocab[i]
+            weight = 2 if word == token else 1
+            for entry_id in postings[word]:
+                scores.setdefault(entry_id, weight)
+            i += 1
+        return scores
+
+    def search(
+        self,
+        query: str,
+        limit: int = 10,
+        offset: int = 0,
+        item_type: str | None = None,
+        exclude_types: list[str] | None = None,
+    ) -> list[IndexedItem]:
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        # Autocomplete repeats the same prefixes a lot; cached lists hold the
+        # IndexedItem objects themselves, so patched prices show up in them too.
+        cache_key = (" ".join(tokens), limit, offset, item_type, tuple(sorted(exclude_types or ())))
+        cache = self._results
+        with self._lock:
+            cached = cache.get(cache_key)
+            if cached is not None:
+                cache.move_to_end(cache_key)
+                return list(cached)
+
+        results = self._search(tokens, limit, offset, item_type, exclude_types)
+        with self._lock:
+            if cache is self._results:
+                cache[cache_key] = results
+                if len(cache) > self.RESULT_CACHE_SIZE:
+                    cache.popitem(last=False)
+        return list(results)
+
+    def _search(self, tokens: list[str], limit: int, offset: int, item_type: str | None, exclude_types: list[str] | None) -> list[IndexedItem]:
+        entries, vocab, postings = self._entries, self._vocab, self._postings
+
+        candidates = None
+        for token in sorted(set(tokens), key=len, reverse=True):
+            matched = self._match_token(vocab, postings, token)
+            if candidates is None:
+                candidates = matched
+            else:
+                candidates = {eid: s + matched[eid] for eid, s in candidates.items() if eid in matched}
+            if not candidates:
+                return []
+
+        compact_query = "".join(tokens)
+        excluded = set(exclude_types) if exclude_types else None
+        filtered = item_type is not None or excluded is not None
+        ranked = []
+        for entry_id, score in candidates.items():
+            entry = entries[entry_id]
+            doc = entry.pick(item_type, excluded) if filtered else entry.items[0]
+            if doc is None:
+                continue
+            if entry.compact.startswith(compact_query):
+                score += 3
+            ranked.append((-score, entry.rank, doc.item_type or "", entry_id))
+
+        top = heapq.nsmallest(offset + limit, ranked)
+        out = []
+        for _, _, _, entry_id in top[offset:]:
+            entry = entries[entry_id]
+            out.append(entry.pick(item_type, excluded) if filtered else entry.items[0])
+        return out
+
+
+catalog_index = CatalogSearchIndex()
@@ -2,14 +2,17 @@ from sqlalchemy.orm import Session
 from repository import ItemRepository
 from strategy import IMarketStrategy
 from price_factory import PriceFactory
-import time
-import requests
+from fetch_engine import PriceFetchEngine
+import asyncio
 import datetime
 from security import is_valid_discord_webhook_url
+from notifications import discord_outbox
+from fx import fx_rates
+from market_name import apply_market_fields, user_item_query, item_query, display_name
+from market_registry import CSFLOAT_MARKET_ID
 
 class PriceService:
     USER_ITEM_REFRESH_MIN_AGE_SECONDS = 1800
-    FX_CACHE_TTL_SECONDS = 12 * 60 * 60
     CURRENCY_SYMBOLS = {
         "USD": "$",
         "EUR": "€",
@@ -22,71 +25,24 @@ class PriceService:
         self.repo = ItemRepository(db)
         self.strategy = strategy
         self.factory = PriceFactory()
-        self._fx_cache_timestamp = 0.0
-        self._fx_rates = {
-            "USD": 1.0,
-            "EUR": 0.86,
-            "GBP": 0.75,
-            "CZK": 20.77,
-            "RUB": 77.73,
-        }
 
     def _normalize_currency(self, currency: str | None) -> str:
         c = str(currency or "USD").upper()
         return c if c in self.CURRENCY_SYMBOLS else "USD"
 
-    def _load_fx_rates(self) -> dict:
-        now = time.time()
-        if (now - self._fx_cache_timestamp) < self.FX_CACHE_TTL_SECONDS:
-            return self._fx_rates
-
-        symbols = ["EUR", "GBP", "CZK", "RUB"]
-        try:
-            r = requests.get(
-                f"https://api.exchangerate.host/latest?base=USD&symbols={','.join(symbols)}",
-                timeout=5,
-            )
-            r.raise_for_status()
-            data = r.json()
-            rates_obj = data.get("rates") or data.get("data", {}).get("rates") or {}
-            picked = {k: float(rates_obj[k]) for k in symbols if isinstance(rates_obj.get(k), (int, float))}
-            if picked:
-                self._fx_rates = {"USD": 1.0, **picked}
-                self._fx_cache_timestamp = now
-                return self._fx_rates
-        except Exception:
-            pass
-
-        try:
-            r = requests.get("https://open.er-api.com/v6/latest/USD", timeout=5)
-            r.raise_for_status()
-            data = r.json()
-            rates_obj = data.get("rates") or data.get("conversion_rates") or {}
-            picked = {k: float(rates_obj[k]) for k in symbols if isinstance(rates_obj.get(k), (int, float))}
-            if picked:
-                self._fx_rates = {"USD": 1.0, **picked}
-                self._fx_cache_timestamp = now
-                return self._fx_rates
-        except Exception:
-            pass
-
-        # Keep previous/fallback rates if remote fetch fails.
-        self._fx_cache_timestamp = now
-        return self._fx_rates
-
     def _convert_price(self, usd_value: float, currency: str | None) -> float:
-        cur = self._normalize_currency(currency)
-        rates = self._load_fx_rates()
-        rate = float(rates.get(cur, 1.0))
-        return float(usd_value or 0.0) * rate
+        # Process-wide rates refreshed by the scheduler, never fetched here
+        return fx_rates.convert(usd_value, self._normalize_currency(currency))
+
+    def _format_converted(self, value: float, currency: str, use_grouping: bool = False) -> str:
+        symbol = self.CURRENCY_SYMBOLS.get(currency, "$")
+        if use_grouping:
+            return f"{symbol}{value:,.2f}"
+        return f"{symbol}{value:.2f}"
 
     def _format_price(self, usd_value: float, currency: str | None, use_grouping: bool = False) -> str:
         cur = self._normalize_currency(currency)
-        symbol = self.CURRENCY_SYMBOLS.get(cur, "$")
-        converted = self._convert_price(usd_value, cur)
-        if use_grouping:
-            return f"{symbol}{converted:,.2f}"
-        return f"{symbol}{converted:.2f}"
+        return self._format_converted(self._convert_price(usd_value, cur), cur, use_grouping)
 
     def _is_user_item_refresh_too_recent(self, last_update: datetime.datetime | None) -> bool:
         if not last_update:
@@ -128,9 +84,10 @@ class PriceService:
                 "footer": {"text": "CSInvest Portfolio Tracker"}
             }
             
-            requests.post(webhook_url, json={"embeds": [embed]}, timeout=5)
+            # Sent by the outbox dispatcher, merged with other alerts for the same webhook
+            discord_outbox.enqueue(webhook_url, embed)
         except Exception as e:
-            print(f"Failed to send Discord notification: {e}")
+            print(f"Failed to queue Discord notification: {e}")
 
     def _send_portfolio_summary_notification(
         self,
@@ -202,11 +159,17 @@ class PriceService:
             lines.append(header)
             lines.append("-" * len(header))
 
-            def add_rows(rows):
-                for item in rows:
+            # All displayed prices converted to the user's currency in one go
+            cur = self._normalize_currency(currency)
+            old_converted = fx_rates.convert_many([i['old_price'] for i in items], cur)
+            new_converted = fx_rates.convert_many([i['new_price'] for i in items], cur)
+
+            def add_rows(start, end):
+                for idx in range(start, end):
+                    item = items[idx]
                     name = item['name'][:21] # Truncate slightly more
-                    old_p = self._format_price(item['old_price'], currency)
-                    new_p = self._format_price(item['new_price'], currency)
+                    old_p = self._format_converted(old_converted[idx], cur)
+                    new_p = self._format_converted(new_converted[idx], cur)
                     
                     # profit is diff between new and old
                     # item['profit_pct'] is correctly calculated as change %
@@ -217,16 +180,16 @@ class PriceService:
                     lines.append(line)
 
             if not has_gap:
-                add_rows(display_items)
+                add_rows(0, len(display_items))
             else:
-                add_rows(top_15)
+                add_rows(0, len(top_15))
                 lines.append("")
                 lines.append(f"... {len(items)-30} items hidden ...")
                 lines.append("")
                 # Before adding bottom 15, we should ensure they are not already in top 15 (handled by len check above)
                 # But bottom 15 are legally the last 15 of the sorted array
                 # If array is [0..99], top is [0..14], bottom is [85..99]
-                add_rows(bottom_15)
+                add_rows(len(items) - len(bottom_15), len(items))
 
             lines.append("```")
 
@@ -237,18 +200,38 @@ class PriceService:
                 "footer": {"text": f"Updated {len(items)} items"}
             }
 
-            requests.post(webhook_url, json={"embeds": [embed]}, timeout=10)
+            discord_outbox.enqueue(webhook_url, embed)
         except Exception as e:
-            print(f"Failed to send Portfolio notification: {e}")
+            print(f"Failed to queue Portfolio notification: {e}")
+
+    def _plan_user_item_query(self, owned) -> dict | None:
+        # Builds the CSFloat query for one UserItem, or None if it should be skipped.
+        itm = owned.item
+
+        if not itm:
+            print(f"Varování: UserItem {owned.user_item_id} nemá přiřazený Item (item_id={owned.item_id}). Přeskakuji.")
+            return None
+
+        # Skip 'cash' item updates
+        if itm.slug == 'cash' or itm.name == 'cash':
+            return None
 
-    def update_portfolio_prices(self, user_id: int):
-        # Fetch user to get webhook
+        if self._is_user_item_refresh_too_recent(getattr(owned, 'last_update', None)):
+            print(f"Přeskakuji UserItem {owned.user_item_id} - cena byla aktualizována před méně než 30 minutami.")
+            return None
+
+        if owned.market_hash_name is None:
+            # Row written before the market_* columns existed / by an older process
+            apply_market_fields(owned, itm)
+        return user_item_query(owned)
+
+    def plan_portfolio_refresh(self, user_id: int) -> dict:
+        # Loads everything needed to refresh one user's portfolio and builds the
+        # CSFloat queries, without fetching anything yet.
         from models import User
         from encryption import decrypt_api_key
         user = self.repo.db.query(User).filter(User.user_id == user_id).first()
-        portfolio_webhook = user.discord_portfolio_webhook_url if user else None
-        user_currency = self._normalize_currency(user.currency if user else "USD")
-        
+
         # Try to decrypt user API key
         user_api_key = None
         if user and user.csfloat_api_key_ciphertext:
@@ -263,7 +246,40 @@ class PriceService:
                 print(f"Failed to decrypt user API key: {e}")
 
         user_items = self.repo.get_user_items(user_id)
-        results = []
+        print(f"Začínám aktualizaci pro uživatele {user_id}. Počet položek: {len(user_items)}")
+
+        planned = []
+        for owned in user_items:
+            query = self._plan_user_item_query(owned)
+            if query:
+                planned.append((owned, query))
+
+        return {
+            "user_id": user_id,
+            "user": user,
+            "api_key": user_api_key,
+            "user_items": user_items,
+            "planned": planned,
+        }
+
+    def update_portfolio_prices(self, user_id: int, progress=None):
+        plan = self.plan_portfolio_refresh(user_id)
+
+        # Fetch concurrently (rate limited per API key); DB writes and
+        # notifications are applied as results come back, one item at a time.
+        engine = PriceFetchEngine(self.strategy)
+        fetched = engine.fetch_iter([q for _, q in plan["planned"]], api_key=plan["api_key"])
+        return self.apply_portfolio_refresh(plan, fetched, progress=progress)
+
+    def apply_portfolio_refresh(self, plan: dict, fetched, progress=None):
+        # fetched yields (index into plan["planned"], raw strategy result).
+        # progress (optional) gets set_total(n) and item_done(result | None) calls.
+        user_id = plan["user_id"]
+        user = plan["user"]
+        user_items = plan["user_items"]
+        planned = plan["planned"]
+        portfolio_webhook = user.discord_portfolio_webhook_url if user else None
+        user_currency = self._normalize_currency(user.currency if user else "USD")
         notification_items = []
 
         # Track portfolio totals across all current holdings (including cash) so
@@ -277,101 +293,31 @@ class PriceService:
             portfolio_old_total += line_total
             portfolio_new_total += line_total
 
-        print(f"Začínám aktualizaci pro uživatele {user_id}. Počet položek: {len(user_items)}")
+        if progress:
+            progress.set_total(len(planned))
 
-        for owned in user_items:
-            time.sleep(1)
+        # All price writes of this run go out in one transaction after the loop;
+        # per-item Discord alerts wait for it so they never announce unsaved prices.
+        batch = self.repo.price_write_batch()
+        item_alerts = []
+        results_by_index = {}
+        for index, raw_data in fetched:
+            owned, query = planned[index]
             itm = owned.item
-
-            if not itm:
-                print(f"Varování: UserItem {owned.user_item_id} nemá přiřazený Item (item_id={owned.item_id}). Přeskakuji.")
-                continue
-
-            # Skip 'cash' item updates
-            if itm.slug == 'cash' or itm.name == 'cash':
-                continue
-
-            if self._is_user_item_refresh_too_recent(getattr(owned, 'last_update', None)):
-                print(f"Přeskakuji UserItem {owned.user_item_id} - cena byla aktualizována před méně než 30 minutami.")
-                continue
-
-            min_float = None
-            max_float = None
-
-            if getattr(itm, 'item_type', None) in ('skin', 'knife', 'glove'):
-                wear_val = getattr(owned, 'wear', None)
-                if not wear_val:
-                    # Fallback: if user didn't enter specific float/wear, try get default from Item catalog or guess?
-                    # But usually we rely on owned.wear (UserItem table).
-                    wear_val = getattr(itm, 'wear', None)
-                
-                wear_status = f"({wear_val})" if wear_val else ""
-                
-                # Base name construction
-                market_name = f"{itm.name} {wear_status}".strip()
-
-                # Prepend 'StatTrak™' or 'Souvenir' if present in owned.variant
-                variant = getattr(owned, 'variant', None)
-                if variant:
-                    # e.g. "StatTrak™ AK-47 | Case Hardened (Field-Tested)"
-                    # e.g. "Souvenir SSG 08 | Detour (Factory New)"
-                    market_name = f"{variant} {market_name}"
-
-                # Handle star prefix for Knives and Gloves
-                # In DB, knives are usually stored as "Skeleton Knife | Doppler"
-                # But market name requires star prefix: "★ Skeleton Knife | Doppler" or "★ StatTrak™ ..."
-                # Standard guns do NOT have star.
-                is_knife_or_glove = (getattr(itm, 'item_type', '') in ('knife', 'glove'))
-                # Also check rarities just in case type is not perfectly set but likely correct
-                # However, relying on item_type 'knife' or 'glove' should be safer if your DB is consistent.
-                
-                if is_knife_or_glove and not market_name.startswith("★"):
-                    market_name = f"★ {market_name}"
-
-                # Append Doppler Phase if present in owned.phase
-                # e.g. "★ Paracord Knife | Doppler (Factory New) Phase 1"
-                phase = getattr(owned, 'phase', None)
-                if phase:
-                    market_name = f"{market_name} {phase}"
-                
-                market_name = market_name.strip()
-
-                # If user provided a specific float_value, use it to range
-                # Logic: min_float = 0.0 (or "tier-min"? User says 0.0)
-                #        max_float = round up to 2 decimals
-                user_float = getattr(owned, 'float_value', None)
-                if user_float is not None:
-                    try:
-                        f = float(user_float)
-                        # "0.0 je minimum float" based on user instruction
-                        min_float = 0.0
-
-                        # Round up logic: 0.0915 -> 0.10
-                        import math
-                        # user said: "pri itemu 0.091512 se max float da na 0.10"
-                        #            "pri 0.141535 treba na 0.15" (so ceil to 2 dec places)
-                        # Standard math.ceil( x * 100 ) / 100
-                        max_float = math.ceil(f * 100) / 100.0
-                    except ValueError:
-                        pass
-            elif getattr(itm, 'item_type', None) == 'charm':
-                 market_name = itm.name
-            else:
-                market_name = itm.name
-
-            print(f"Skládám název pro API: {market_name}, Float: {min_float}-{max_float}")
-
-            raw_data = self.strategy.fetch_price(market_name, min_float=min_float, max_float=max_float, api_key=user_api_key)
             if not raw_data:
                 print(f"Přeskakuji {itm.name} - chyba stahování/nenalezeno.")
+                if progress:
+                    progress.item_done(None)
                 continue
 
-            clean_data = self.factory.create_price(raw_data, itm.item_id, market_id=2)
+            clean_data = self.factory.create_price(raw_data, itm.item_id, market_id=CSFLOAT_MARKET_ID)
             if not clean_data:
                 print(f"Přeskakuji {itm.name} - chyba zpracování.")
+                if progress:
+                    progress.item_done(None)
                 continue
 
-            self.repo.save_market_price(
+            batch.add_market_price(
                 market_id=clean_data["market_id"],
                 item_id=clean_data["skin_id"], 
                 price=clean_data["price"]
@@ -380,15 +326,15 @@ class PriceService:
             old_price = float(owned.current_price) if owned.current_price else 0.0
             new_price = clean_data["price"]
 
-            self.repo.update_item_current_price(itm.item_id, new_price)
-            self.repo.update_useritems_current_price_for_item(itm.item_id, new_price, user_id=user_id)
+            batch.set_item_price(itm.item_id, new_price)
+            batch.set_useritems_price_for_item(itm.item_id, new_price, user_id=user_id)
 
             amount = owned.amount if owned.amount else 1
             portfolio_new_total += (new_price - old_price) * amount
 
             # Check for webhook notification
             if owned.discord_webhook_url:
-                self._send_discord_notification(owned.discord_webhook_url, itm.name, old_price, new_price, user_currency)
+                item_alerts.append((owned.discord_webhook_url, itm.name, old_price, new_price))
 
             # Add to portfolio notification list
             # We want change since last update, so we use old_price which is captured before update
@@ -423,13 +369,21 @@ class PriceService:
                 "profit_abs": diff_val
             })
 
-            results.append({
+            results_by_index[index] = {
                 "item": itm.name,
                 "old_price": old_price,
                 "new_price": new_price,
                 "currency": "USD",
                 "item_type": getattr(itm, 'item_type', None)
-            })
+            }
+            if progress:
+                progress.item_done(results_by_index[index])
+
+        results = [results_by_index[i] for i in sorted(results_by_index)]
+
+        batch.flush()
+        for webhook_url, item_name, old_price, new_price in item_alerts:
+            self._send_discord_notification(webhook_url, item_name, old_price, new_price, user_currency)
         
         # Send portfolio summary if webhook is set
         if portfolio_webhook and notification_items:
@@ -444,82 +398,11 @@ class PriceService:
                 total_new_value=portfolio_new_total,
             )
 
-        totals = self.repo.calculate_portfolio_totals(user_id)
+        totals = self.repo.get_portfolio_totals(user_id)
         self.repo.save_portfolio_history(user_id, totals)
         return results
 
-    def update_items_prices(self, item_type: str | None = None, limit: int = 1000):
-        from models import Item
-        import datetime
-
-        if item_type:
-            items = self.repo.get_items(item_type=item_type, limit=limit)
-        else:
-            items = self.repo.get_items(item_type='skin', limit=limit) + self.repo.get_items(item_type='case', limit=limit)
-
-        results = []
-        print(f"Aktualizuji ceny pro item_type={item_type or 'skin,case'}; počet: {len(items)}")
-        
-        now = datetime.datetime.now()
-
-        for itm in items:
-            # 24-hour check
-            if itm.last_update and itm.current_price is not None:
-                # Ensure we are comparing compatible datetimes (naive vs aware)
-                # If we don't know, we can try robust check or just try-except
-                try:
-                    # Assuming itm.last_update is a datetime object
-                    diff = now - itm.last_update
-                    if diff.total_seconds() < 24 * 3600:
-                        # Less than 24 hours old, skip
-                        # print(f"Skipping {itm.name}, updated recently ({itm.last_update})")
-                        continue
-                except Exception:
-                    # Fallback if comparison fails (e.g. tz mismatch), just update to be safe or ignore
-                    pass
-
-            try:
-                time.sleep(1)
-                if itm.item_type == 'skin':
-                    wear_status = f"({itm.wear})" if getattr(itm, 'wear', None) else ""
-                    market_name = f"{itm.name} {wear_status}".strip()
-                elif itm.item_type == 'charm':
-                    market_name = itm.name
-                else:
-                    market_name = itm.name
-
-                raw = self.strategy.fetch_price(market_name)
-                if not raw:
-                    print(f"Přeskakuji {itm.name} - cena nenalezena.")
-                    continue
-
-                clean = self.factory.create_price(raw, itm.item_id, market_id=2)
-                if not clean:
-                    print(f"Přeskakuji {itm.name} - chyba zpracování ceny.")
-                    continue
-
-                self.repo.save_market_price(
-                    market_id=clean["market_id"],
-                    item_id=clean["skin_id"], 
-                    price=clean["price"],
-                )
-                
-                self.repo.update_item_current_price(itm.item_id, clean["price"])
-
-                results.append({
-                    "item_id": itm.item_id,
-                    "name": itm.name,
-                    "item_type": itm.item_type,
-                    "new_price": clean["price"],
-                    "currency": "USD",
-                })
-            except Exception as e:
-                print(f"Chyba při aktualizaci {itm.name}: {e}")
-                continue
-
-        return results
-
-    def update_single_item_price(self, item_id: int):
+    def _plan_single_item_query(self, item_id: int):
         # NOTE: This method updates the "catalog" price of an ITEM, not specific USERITEM.
         # But if we want to support float-specific fetching here, we'd need context of a user item.
         # For now, we will keep it simple (generic price) OR we can accept optional float args.
@@ -527,136 +410,104 @@ class PriceService:
         
         itm = self.repo.get_item_by_id(item_id)
         if not itm:
-            return None
+            return None, None
 
         print(f"Aktualizuji jeden item ID={item_id}: {itm.name}")
-
-        market_name = itm.name
-        if getattr(itm, 'item_type', None) in ('skin', 'knife', 'glove'):
-             # Try to append generic wear if it exists on the Item catalog definition
-             w = getattr(itm, 'wear', None)
-             if w:
-                 market_name = f"{itm.name} ({w})"
-
-        raw = self.strategy.fetch_price(market_name)
-        if not raw:
-            print(f"Cena pro {itm.name} nenalezena.")
-            return None
-
-        clean = self.factory.create_price(raw, itm.item_id, market_id=2)
-        if not clean:
+        return itm, item_query(itm)
+
+    def _apply_market_quotes(self, itm, quotes: dict):
+        # quotes: market_id -> raw strategy result. Every market's price goes to
+        # MARKETPRICE in one batch, the lowest one becomes the item's price.
+        batch = self.repo.price_write_batch()
+        prices = {}
+        for market_id, raw in quotes.items():
+            clean = self.factory.create_price(raw, itm.item_id, market_id=market_id)
+            if not clean:
+                continue
+            batch.add_market_price(market_id=market_id, item_id=itm.item_id, price=clean["price"])
+            prices[market_id] = clean["price"]
+        if not prices:
+            print(f"Cena pro {itm.name} nenalezena na žádném marketu.")
             return None
 
-        self.repo.save_market_price(
-            market_id=clean["market_id"],
-            item_id=clean["skin_id"], 
-            price=clean["price"]
-        )
-        
-        self.repo.update_item_current_price(itm.item_id, clean["price"])
-        self.repo.update_useritems_current_price_for_item(itm.item_id, clean["price"])
+        best_market_id, best_price = min(prices.items(), key=lambda kv: kv[1])
+        batch.set_item_price(itm.item_id, best_price)
+        batch.set_useritems_price_for_item(itm.item_id, best_price)
+        batch.flush()
 
         return {
             "item_id": itm.item_id,
             "name": itm.name,
-            "new_price": clean["price"]
+            "new_price": best_price,
+            "market_id": best_market_id,
+            "prices": {str(mid): price for mid, price in prices.items()},
         }
 
-    def update_specific_user_item_price(self, user_item_id: int, user_id: int):
-        # Fetch the specific user item
-        # We need a method in repo to get single user item by ID
-        # For now, let's just use existing query or add one.
-        # But wait, repo.get_user_items returns list. 
-        # I will use db session directly or add method to repo.
-        # Let's add method to repo.
+    async def aupdate_single_item_price_all_markets(self, item_id: int, registry):
+        # Fan-out over the MarketRegistry instead of the single strategy
+        itm, query = await asyncio.to_thread(self._plan_single_item_query, item_id)
+        if not itm:
+            return None
+        quotes = await registry.fetch(query)
+        return await asyncio.to_thread(self._apply_market_quotes, itm, quotes)
+
+    def _plan_specific_user_item_query(self, user_item_id: int, user_id: int):
         user_item = self.repo.get_user_item_by_id(user_item_id, user_id)
         if not user_item:
-            return None
+            return None, None
         
         itm = user_item.item
         if not itm:
-            return None
-
-        # Logic similar to update_portfolio_prices but for single item
-        min_float = None
-        max_float = None
-
-        if getattr(itm, 'item_type', None) in ('skin', 'knife', 'glove'):
-            # Explicitly load wear if needed, but it should be there.
-            wear_val = user_item.wear
-            
-            # Use calculate_wear fallback if wear is missing but float exists?
-            if not wear_val and user_item.float_value is not None:
-                from repository import calculate_wear
-                wear_val = calculate_wear(user_item.float_value)
-                # print(f"DEBUG: Wear was missing, calculated: {wear_val}")
-
-            wear_status = f"({wear_val})" if wear_val else ""
-            market_name = f"{itm.name} {wear_status}".strip()
-
-            # Prepend 'StatTrak™' or 'Souvenir' if present in owned.variant
-            variant = getattr(user_item, 'variant', None)
-            if variant:
-                 market_name = f"{variant} {market_name}"
-
-            # Handle star prefix for Knives and Gloves
-            is_knife_or_glove = (getattr(itm, 'item_type', '') in ('knife', 'glove'))
-            if is_knife_or_glove and not market_name.startswith("★"):
-                 market_name = f"★ {market_name}"
-            
-            # Append Doppler Phase
-            phase = getattr(user_item, 'phase', None)
-            if phase:
-                 market_name = f"{market_name} {phase}"
-            
-            market_name = market_name.strip()
-
-            user_float = getattr(user_item, 'float_value', None)
-            if user_float is not None:
-                try:
-                    f = float(user_float)
-                    min_float = 0.0
-                    import math
-                    max_float = math.ceil(f * 100) / 100.0
-                except ValueError:
-                    pass
-        else:
-            market_name = itm.name
-
-        print(f"Aktualizuji UserItem ID={user_item_id}: '{market_name}' (Float: {min_float}-{max_float})")
-
-        raw = self.strategy.fetch_price(market_name, min_float=min_float, max_float=max_float)
+            return None, None
+
+        if user_item.market_hash_name is None:
+            apply_market_fields(user_item, itm)
+        query = user_item_query(user_item)
+        print(f"Aktualizuji UserItem ID={user_item_id}: '{display_name(query)}' (Float: {query['min_float']}-{query['max_float']})")
+        return user_item, query
+
+    def _apply_specific_user_item_price(self, user_item, query: dict, raw):
+        user_item_id = user_item.user_item_id
+        user_id = user_item.user_id
+        market_name = display_name(query)
+        itm = user_item.item
         if not raw:
             print(f"Cena pro {market_name} nenalezena.")
             return None
 
-        clean = self.factory.create_price(raw, itm.item_id, market_id=2)
+        clean = self.factory.create_price(raw, itm.item_id, market_id=CSFLOAT_MARKET_ID)
         if not clean:
             return None
 
         old_price = float(user_item.current_price) if user_item.current_price else 0.0
         new_price = clean["price"]
 
-        # Update ONLY this user item price
-        self.repo.update_price(user_item_id, new_price)
-        
+        # Update ONLY this user item price; the market price record goes in the
+        # same transaction (it is float-specific, but we keep it for analytics)
+        batch = self.repo.price_write_batch()
+        batch.add_market_price(
+            market_id=clean["market_id"],
+            item_id=clean["skin_id"],
+            price=clean["price"]
+        )
+        batch.set_user_item_price(user_item_id, new_price)
+        batch.flush()
+
         if user_item.discord_webhook_url:
                from models import User
                user = self.repo.db.query(User).filter(User.user_id == user_id).first()
                user_currency = self._normalize_currency(user.currency if user else "USD")
                self._send_discord_notification(user_item.discord_webhook_url, market_name, old_price, new_price, user_currency)
 
-        # Also save historical market price record for this item type?
-        # Maybe, but be careful as it is specific float price.
-        # Generally we save market price for analytics.
-        self.repo.save_market_price(
-             market_id=clean["market_id"],
-             item_id=clean["skin_id"], 
-             price=clean["price"]
-        )
-
         return {
             "user_item_id": user_item_id,
             "name": market_name,
             "new_price": clean["price"]
-        }
\ No newline at end of file
+        }
+
+    async def aupdate_specific_user_item_price(self, user_item_id: int, user_id: int):
+        user_item, query = await asyncio.to_thread(self._plan_specific_user_item_query, user_item_id, user_id)
+        if not user_item:
+            return None
+        raw = await self.strategy.fetch_price(query["market_name"], min_float=query["min_float"], max_float=query["max_float"], phase=query["phase"])
+        return await asyncio.to_thread(self._apply_specific_user_item_price, user_item, query, raw)
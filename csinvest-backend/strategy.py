@@ -1,4 +1,5 @@
 from abc import ABC, abstractmethod
+import asyncio
 import requests
 import os
 from dotenv import load_dotenv
@@ -6,15 +7,38 @@ import json
 import urllib.parse
 import time
 from config import Config
+from market_name import split_phase
 
 load_dotenv() 
 
 class IMarketStrategy(ABC):
     @abstractmethod
-    def fetch_price(self, skin_name: str, min_float: float = None, max_float: float = None, api_key: str = None) -> dict:
+    def fetch_price(self, skin_name: str, min_float: float = None, max_float: float = None, api_key: str = None, phase: str = None) -> dict:
         pass
 
-class CSFloatStrategy(IMarketStrategy):
+class IAsyncMarketStrategy(ABC):
+    @abstractmethod
+    async def fetch_price(self, skin_name: str, min_float: float = None, max_float: float = None, api_key: str = None, phase: str = None) -> dict:
+        pass
+
+def retry_after_seconds(response, default: float = 60.0) -> float:
+    """Wait time of a 429 response: Retry-After, else CSFloat's X-RateLimit-Reset (unix time)."""
+    raw = response.headers.get("Retry-After")
+    if raw:
+        try:
+            return max(0.0, float(raw))
+        except ValueError:
+            pass
+    reset = response.headers.get("X-RateLimit-Reset")
+    if reset:
+        try:
+            return max(0.0, float(reset) - time.time())
+        except ValueError:
+            pass
+    return default
+
+
+class _CSFloatBase:
     BASE_URL = "https://csfloat.com/api/v1/listings"
     
     # Doppler Phases -> Paint Index Mapping
@@ -64,34 +88,20 @@ class CSFloatStrategy(IMarketStrategy):
         Returns (base_name, phase_string)
         e.g. ("★ Karambit | Doppler (Factory New)", "Phase 2")
         """
-        import re
-        # Regex to catch "Phase X", "Sapphire", "Ruby", "Black Pearl", "Emerald"
-        # Case insensitive
-        pattern = r"(Phase\s\d+|Sapphire|Ruby|Black Pearl|Emerald)"
-        match = re.search(pattern, skin_name, re.IGNORECASE)
-        
-        if match:
-            phase_filter = match.group(0) # e.g. "Sapphire" or "Phase 1"
-            # Remove phase from name to get base name for search
-            # e.g. "★ Karambit | Doppler (Factory New) Sapphire" -> "★ Karambit | Doppler (Factory New)"
-            base_name = skin_name.replace(phase_filter, "").strip()
-            # Clean up double spaces or trailing/leading spaces
-            base_name = " ".join(base_name.split())
-            return base_name, phase_filter
-            
-        return skin_name, None
+        return split_phase(skin_name)
 
-    def fetch_price(self, skin_name: str, min_float: float = None, max_float: float = None, api_key: str = None) -> dict:
-        print(f"[CSFloatStrategy] Hledám cenu pro: {skin_name} (Float: {min_float}-{max_float})")
-        
-        base_name, phase_filter = self._extract_phase(skin_name)
+    def _build_params(self, skin_name: str, min_float: float = None, max_float: float = None, phase: str = None):
+        # A caller passing phase already split it off (USERITEM.market_* columns)
+        if phase:
+            base_name, phase_filter = skin_name, phase
+        else:
+            base_name, phase_filter = self._extract_phase(skin_name)
         
         if phase_filter:
              print(f"[CSFloatStrategy] Detekována fáze: '{phase_filter}', hledám base_name: '{base_name}'")
              # Pokud hledáme specifickou fázi, zkusíme ji přidat do parametrů
              # CSFloat API někdy podporuje 'phase' jako parametr, pro gemy je to kritické
              # protože jinak jsou "utopeny" pod levnými fázemi 1-4.
-             pass
 
         params = {
             "market_hash_name": base_name,
@@ -109,21 +119,96 @@ class CSFloatStrategy(IMarketStrategy):
             params["min_float"] = min_float
         if max_float is not None:
             params["max_float"] = max_float
+
+        return params, base_name, phase_filter
+
+    def _headers(self, api_key: str) -> dict:
+        return {
+            "Authorization": api_key,
+            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+        }
+
+    def _max_retries(self, using_user_key: bool) -> int:
+        return 3 if not using_user_key and len(self.config.CSFLOAT_API_KEYS) > 1 else 1
+
+    def _is_pool_key(self, api_key: str | None) -> bool:
+        # A server key picked by the fetch engine's key pool (not a user's own key);
+        # the pool spreads requests over the keys, so no rotation here
+        return api_key is not None and api_key in self.config.CSFLOAT_API_KEYS
+
+    def _park_rate_limited_key(self, api_key: str, response, user_key: bool) -> None:
+        from fetch_engine import pool_for_api_key  # fetch_engine imports this module
+        retry_after = retry_after_seconds(response)
+        pool_for_api_key(api_key if user_key else None, self.config).penalize(api_key, retry_after)
+        if user_key:
+            print(f"⚠️ User API Key Rate Limited (429). Cannot rotate.")
+        else:
+            print(f"⚠️ Server API key rate limited (429), pozastaven na {retry_after:.0f}s; další požadavky dostanou jiný klíč z poolu.")
+
+    def _parse_listings(self, data, base_name: str, phase_filter: str | None) -> dict | None:
+        listings = data if isinstance(data, list) else data.get("data", [])
+        
+        # print(f"DEBUG: Nalezeno inzerátů (před filtrem): {len(listings)}") 
+        
+        if not listings:
+            print(f"⚠️ CSFloat vrátilo OK, ale NENALEZENO ŽÁDNÝ LISTING pro {base_name}.")
+            return None
+
+        # Filter by phase if specified
+        if phase_filter:
+            # CSFloat API structure for item:
+            # "item": { "market_hash_name": "...", "phase": "Phase 2", ... }
+            filtered_listings = []
+            target_phase = phase_filter.lower()
+            
+            for listing in listings:
+                # Filter out auctions explicitly just in case API returns them
+                if listing.get("type") == "auction":
+                    continue
+
+                item_data = listing.get("item", {})
+                item_phase = item_data.get("phase")
+                
+                # Some items might not have 'phase' field populated or it might be null
+                if item_phase and str(item_phase).lower() == target_phase:
+                    filtered_listings.append(listing)
+            
+            listings = filtered_listings
+        
+        if not listings:
+            print(f"⚠️ Žádný inzerát neodpovídá fázi {phase_filter}.")
+            return None
+            
+        # Success - return cheapest
+        cheapest = min(listings, key=lambda x: x.get("price"))
+        return {
+            "success": True,
+            "price_cents_usd": cheapest.get("price"),
+            "item_name": cheapest.get("item", {}).get("market_hash_name"),
+            "market_name": "CSFloat"
+        }
+
+
+class CSFloatStrategy(_CSFloatBase, IMarketStrategy):
+
+    def fetch_price(self, skin_name: str, min_float: float = None, max_float: float = None, api_key: str = None, phase: str = None) -> dict:
+        print(f"[CSFloatStrategy] Hledám cenu pro: {skin_name} (Float: {min_float}-{max_float})")
+        
+        params, base_name, phase_filter = self._build_params(skin_name, min_float, max_float, phase)
         
         # Decide which key to use
         # If user passed api_key, use it (don't rotate user key on failure, that's up to them)
-        # If user did NOT pass api_key, use our pool and rotate on 429
+        # A server key chosen by the key pool is not rotated either, the pool parks it on 429
+        # If no api_key was passed, use our keys and rotate on 429
         
-        using_user_key = api_key is not None
+        pool_key = self._is_pool_key(api_key)
+        using_user_key = api_key is not None and not pool_key
         current_api_key = api_key or self._get_current_api_key()
         
-        headers = {
-            "Authorization": current_api_key,
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
-        }
+        headers = self._headers(current_api_key)
 
         # Retry loop for 429
-        MAX_RETRIES = 3 if not using_user_key and len(self.config.CSFLOAT_API_KEYS) > 1 else 1
+        MAX_RETRIES = self._max_retries(api_key is not None)
         
         for attempt in range(MAX_RETRIES):
             try:
@@ -135,8 +220,8 @@ class CSFloatStrategy(IMarketStrategy):
                 # print(f"DEBUG: Status kód z CSFloat: {response.status_code}")
                 
                 if response.status_code == 429:
-                    if using_user_key:
-                        print(f"⚠️ User API Key Rate Limited (429). Cannot rotate.")
+                    if api_key is not None:
+                        self._park_rate_limited_key(current_api_key, response, using_user_key)
                         return None
                     
                     print(f"⚠️ API Rate Limited (429). Attempt {attempt+1}/{MAX_RETRIES}.")
@@ -152,56 +237,90 @@ class CSFloatStrategy(IMarketStrategy):
                     print(f"⚠️ Chyba API: {response.status_code}. Raw Response: {response.text}")
                     return None
                 
-                data = response.json()
-                listings = data if isinstance(data, list) else data.get("data", [])
-                
-                # print(f"DEBUG: Nalezeno inzerátů (před filtrem): {len(listings)}") 
-                
-                if not listings:
-                    print(f"⚠️ CSFloat vrátilo OK, ale NENALEZENO ŽÁDNÝ LISTING pro {base_name}.")
+                return self._parse_listings(response.json(), base_name, phase_filter)
+
+            except json.JSONDecodeError:
+                print(f"⚠️ API vrátilo neplatný JSON. Response Text: {response.text}")
+                return None
+            except Exception as e:
+                print(f"⚠️ Kritická chyba spojení: {e}")
+                return None
+        
+        return None
+
+
+class AsyncCSFloatStrategy(_CSFloatBase, IAsyncMarketStrategy):
+    """
+    Same contract as CSFloatStrategy, but awaitable and running on one pooled
+    keep-alive httpx client (HTTP/2 when h2 is installed). The client is bound
+    to the event loop it was first used on; call aclose() on shutdown.
+    """
+
+    def __init__(self, config: Config | None = None, max_concurrency: int | None = None) -> None:
+        super().__init__(config)
+        self.max_concurrency = max(1, int(max_concurrency or self.config.CSFLOAT_HTTP_MAX_CONNECTIONS))
+        self._client = None
+        self._semaphore = None
+
+    def _get_client(self):
+        if self._client is None or self._client.is_closed:
+            import httpx
+            try:
+                import h2  # noqa: F401  # HTTP/2 needs the optional h2 package (httpx[http2])
+                http2 = True
+            except ImportError:
+                http2 = False
+            self._client = httpx.AsyncClient(
+                http2=http2,
+                timeout=httpx.Timeout(self.config.CSFLOAT_HTTP_TIMEOUT_SECONDS, connect=5.0),
+                limits=httpx.Limits(
+                    max_connections=self.max_concurrency,
+                    max_keepalive_connections=self.max_concurrency,
+                    keepalive_expiry=30.0,
+                ),
+            )
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._client
+
+    async def aclose(self) -> None:
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+        self._client = None
+
+    async def fetch_price(self, skin_name: str, min_float: float = None, max_float: float = None, api_key: str = None, phase: str = None) -> dict:
+        print(f"[AsyncCSFloatStrategy] Hledám cenu pro: {skin_name} (Float: {min_float}-{max_float})")
+
+        params, base_name, phase_filter = self._build_params(skin_name, min_float, max_float, phase)
+
+        pool_key = self._is_pool_key(api_key)
+        using_user_key = api_key is not None and not pool_key
+        current_api_key = api_key or self._get_current_api_key()
+        MAX_RETRIES = self._max_retries(api_key is not None)
+        client = self._get_client()
+
+        for attempt in range(MAX_RETRIES):
+            try:
+                async with self._semaphore:
+                    response = await client.get(self.BASE_URL, params=params, headers=self._headers(current_api_key))
+
+                if response.status_code == 429:
+                    if api_key is not None:
+                        self._park_rate_limited_key(current_api_key, response, using_user_key)
+                        return None
+
+                    print(f"⚠️ API Rate Limited (429). Attempt {attempt+1}/{MAX_RETRIES}.")
+                    if attempt < MAX_RETRIES - 1:
+                        current_api_key = self._get_next_api_key()
+                        await asyncio.sleep(1)
+                        continue
+                    print("❌ All available API keys rate limited.")
                     return None
 
-                # Filter by phase if specified
-                if phase_filter:
-                    original_count = len(listings)
-                    # CSFloat item object has a 'phase' field? Or we check market_hash_name or other fields?
-                    # User script says: item.item.phase
-                    # Let's inspect CSFloat API response structure typically:
-                    # { "item": { "phase": "Phase 2", ... }, ... }
-                    # Note: CSFloat API structure for item:
-                    # "item": { "market_hash_name": "...", "phase": "Phase 2", ... }
-                    
-                    filtered_listings = []
-                    target_phase = phase_filter.lower()
-                    
-                    for listing in listings:
-                        # Filter out auctions explicitly just in case API returns them
-                        if listing.get("type") == "auction":
-                            continue
-
-                        item_data = listing.get("item", {})
-                        item_phase = item_data.get("phase")
-                        
-                        # Some items might not have 'phase' field populated or it might be null
-                        if item_phase and str(item_phase).lower() == target_phase:
-                            filtered_listings.append(listing)
-                    
-                    listings = filtered_listings
-                    # print(f"DEBUG: Po filtrování fáze '{phase_filter}': {original_count} -> {len(listings)}")
-                
-                if not listings:
-                    print(f"⚠️ Žádný inzerát neodpovídá fázi {phase_filter}.")
+                if response.status_code != 200:
+                    print(f"⚠️ Chyba API: {response.status_code}. Raw Response: {response.text}")
                     return None
-                    
-                    
-                # Success - return cheapest
-                cheapest = min(listings, key=lambda x: x.get("price"))
-                return {
-                    "success": True,
-                    "price_cents_usd": cheapest.get("price"),
-                    "item_name": cheapest.get("item", {}).get("market_hash_name"),
-                    "market_name": "CSFloat"
-                }
+
+                return self._parse_listings(response.json(), base_name, phase_filter)
 
             except json.JSONDecodeError:
                 print(f"⚠️ API vrátilo neplatný JSON. Response Text: {response.text}")
@@ -209,5 +328,5 @@ class CSFloatStrategy(IMarketStrategy):
             except Exception as e:
                 print(f"⚠️ Kritická chyba spojení: {e}")
                 return None
-        
-        return None
\ No newline at end of file
+
+        return None
@@ -276,14 +276,12 @@ function OverviewPage() {
         try {
             const token = localStorage.getItem('csinvest:token');
             const authConfig = token ? { headers: { Authorization: `Bearer ${token}` } } : undefined;
-            const [portfolioResponse, historyResponse, meResponse] = await Promise.all([
+            const [portfolioResponse, meResponse] = await Promise.all([
                 axios.get(`${BASE_URL}/portfolio/${userId}`, authConfig),
-                axios.get(`${BASE_URL}/portfolio-history/${userId}`, authConfig),
                 axios.get(`${BASE_URL}/auth/me`, authConfig)
             ]);
 
             const portfolioArray = Array.isArray(portfolioResponse.data) ? portfolioResponse.data : [];
-            const historyArray = Array.isArray(historyResponse.data) ? historyResponse.data : [];
             const sellFeePct = clampFeePct(meResponse?.data?.sell_fee_pct ?? 2);
             const withdrawFeePct = clampFeePct(meResponse?.data?.withdraw_fee_pct ?? 2);
             const nextFeeMultiplier = toNetMultiplier(sellFeePct, withdrawFeePct);
@@ -298,7 +296,6 @@ function OverviewPage() {
             });
 
             setPortfolio(portfolioData);
-            setHistory(historyArray);
 
             // Keep overview totals aligned with Inventory summary logic:
             // apply fees only on non-cash items, then add cash back 1:1.
@@ -346,6 +343,20 @@ function OverviewPage() {
         
     }, [userId]);  
 
+    // History is resampled server-side, so each timeframe asks for its own window
+    useEffect(() => {
+        if (!userId) return;
+        const token = localStorage.getItem('csinvest:token');
+        const authConfig = token ? { headers: { Authorization: `Bearer ${token}` } } : undefined;
+        const windows = { week: '7d', month: '1m', year: '1y', all: 'all' };
+        axios.get(`${BASE_URL}/portfolio-history/${userId}`, {
+            ...authConfig,
+            params: { window: windows[timeframe] || 'all' },
+        })
+            .then((res) => setHistory(Array.isArray(res.data) ? res.data : []))
+            .catch((err) => console.error("Chyba při načítání historie portfolia:", err));
+    }, [userId, timeframe]);
+
     const now = new Date();
     const filteredHistory = history.filter((record) => {
         const t = new Date(record.timestamp);
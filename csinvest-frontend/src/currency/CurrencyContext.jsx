@@ -104,7 +104,16 @@ export const CurrencyProvider = ({ children }) => {
         return r.json();
       };
 
-      
+      try {
+        // Rates shared by the backend (refreshed there on a schedule); no
+        // updated_at means it only has its built-in defaults so far.
+        const own = await fetchJson(`${API_BASE}/fx-rates`);
+        const pickedOwn = Object.fromEntries(symbols.map(s => [s, own?.rates?.[s]]).filter(([,v]) => typeof v === 'number'));
+        if (own?.updated_at && Object.keys(pickedOwn).length) { store(pickedOwn); return; }
+      } catch {
+        // Fall through to the public rate APIs.
+      }
+
       try {
         const data = await fetchJson(`https://api.exchangerate.host/latest?base=USD&symbols=${symbols.join(',')}`);
         const ratesObj = data?.rates || data?.data?.rates || null;
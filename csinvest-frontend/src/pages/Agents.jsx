@@ -5,6 +5,7 @@ import { useAuth } from '../auth/AuthContext.jsx';
 import { useAppModal } from '../components/AppModalProvider.jsx';
 import { buildSteamInspectHref, shouldShowInspect } from '../utils/inspect.js';
 import { getCachedJson, invalidateCachedUrl } from '../utils/apiCache.js';
+import { startRefreshJob } from '../utils/refreshJobs.js';
 import { saveReturnTarget, restoreReturnTarget } from '../utils/returnTarget.js';
 
 const API_BASE = '/api';
@@ -86,11 +87,7 @@ export default function AgentsPage() {
 
     try {
       setRefreshing(true);
-      const token = localStorage.getItem('csinvest:token');
-      await fetch(`${API_BASE}/refresh-items?item_type=agent`, {
-        method: 'POST',
-        headers: token ? { Authorization: `Bearer ${token}` } : undefined,
-      });
+      await startRefreshJob(`${API_BASE}/refresh-items?item_type=agent`, { apiBase: API_BASE });
       const url = query ? `${API_BASE}/search/items?q=${encodeURIComponent(query)}&item_type=agent` : `${API_BASE}/items?item_type=agent`;
       invalidateCachedUrl(url);
       const data = await getCachedJson(url, { ttlMs: 180000, force: true });
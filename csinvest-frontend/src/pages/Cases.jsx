@@ -5,6 +5,7 @@ import { useCurrency } from '../currency/CurrencyContext.jsx';
 import { useAuth } from '../auth/AuthContext';
 import { useAppModal } from '../components/AppModalProvider.jsx';
 import { getCachedJson, invalidateCachedUrl } from '../utils/apiCache.js';
+import { waitForJob } from '../utils/refreshJobs.js';
 import { saveReturnTarget, restoreReturnTarget } from '../utils/returnTarget.js';
 
 const BASE_URL = '/api';
@@ -73,10 +74,11 @@ function CasesPage() {
     try {
       setRefreshing(true);
       const token = localStorage.getItem('csinvest:token');
-      await axios.post(`${BASE_URL}/refresh-items`, null, {
+      const res = await axios.post(`${BASE_URL}/refresh-items`, null, {
         params: { item_type: 'case' },
         headers: { Authorization: `Bearer ${token}` },
       });
+      if (res.data?.job_id) await waitForJob(BASE_URL, res.data.job_id);
       invalidateCachedUrl(`${BASE_URL}/cases`);
       const data = await getCachedJson(`${BASE_URL}/cases`, { ttlMs: 180000, force: true });
       const arr = Array.isArray(data) ? data : [];
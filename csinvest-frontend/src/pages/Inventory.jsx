@@ -5,6 +5,7 @@ import { useCurrency } from '../currency/CurrencyContext.jsx';
 import { useAuth } from '../auth/AuthContext.jsx';
 import { useNavigate } from 'react-router-dom';
 import { useAppModal } from '../components/AppModalProvider.jsx';
+import { waitForJob } from '../utils/refreshJobs.js';
 
 const BASE_URL = '/api';
 const CURRENCY_SYMBOLS = {
@@ -24,6 +25,7 @@ function InventoryPage() {
   const navigate = useNavigate();
   const [items, setItems] = useState([]);
   const [soldItems, setSoldItems] = useState([]);
+  const [soldSummary, setSoldSummary] = useState(null);
   const [loading, setLoading] = useState(true);
   const [search, setSearch] = useState('');
   const [sortKey, setSortKey] = useState('total'); 
@@ -378,12 +380,16 @@ function InventoryPage() {
     try {
       if (!userId) {
         setSoldItems([]);
+        setSoldSummary(null);
         return;
       }
       const token = localStorage.getItem('csinvest:token');
-      const res = await axios.get(`${BASE_URL}/useritemhistory`, {
-        headers: { Authorization: `Bearer ${token}` },
-      });
+      const authHeaders = { headers: { Authorization: `Bearer ${token}` } };
+      const [res, summaryRes] = await Promise.all([
+        axios.get(`${BASE_URL}/useritemhistory`, authHeaders),
+        axios.get(`${BASE_URL}/useritemhistory/summary`, { ...authHeaders, params: { top: 1 } }).catch(() => null),
+      ]);
+      setSoldSummary(summaryRes?.data?.totals || null);
       const arr = Array.isArray(res.data) ? res.data : [];
       const data = arr.map((item) => {
         const amt = typeof item.amount === 'number' ? item.amount : 1;
@@ -413,9 +419,10 @@ function InventoryPage() {
     try {
       if (!userId) throw new Error('Unauthenticated');
       const token = localStorage.getItem('csinvest:token');
-      await axios.post(`${BASE_URL}/refresh-portfolio/${userId}`, null, {
+      const res = await axios.post(`${BASE_URL}/refresh-portfolio/${userId}`, null, {
         headers: { Authorization: `Bearer ${token}` },
       });
+      if (res.data?.job_id) await waitForJob(BASE_URL, res.data.job_id);
       await fetchItems();
     } catch (err) {
       console.error(err);
@@ -1725,12 +1732,15 @@ function InventoryPage() {
       {viewMode === 'sold' && soldItems.length > 0 && (
         <div ref={summaryRef} style={{ marginTop: 24 }}>
           {(() => {
-            const totals = displaySoldItems.reduce((acc, it) => {
-              const amt = getAmount(it);
-              acc.buy += (it.buy_price || 0) * amt;
-              acc.sell += (it.sell_price || 0) * amt;
-              return acc;
-            }, { buy: 0, sell: 0 });
+            // Unfiltered view: realized totals aggregated by the server
+            const totals = (!search.trim() && soldSummary)
+              ? { buy: soldSummary.cost, sell: soldSummary.gross_proceeds }
+              : displaySoldItems.reduce((acc, it) => {
+                const amt = getAmount(it);
+                acc.buy += (it.buy_price || 0) * amt;
+                acc.sell += (it.sell_price || 0) * amt;
+                return acc;
+              }, { buy: 0, sell: 0 });
 
             const profit = totals.sell - totals.buy;
             const profitPct = totals.buy > 0 ? (profit / totals.buy) * 100 : 0;
@@ -0,0 +1,38 @@
+const sleep = (ms) => new Promise((resolve) => setTimeout(resolve, ms));
+
+const authHeaders = () => {
+  const token = localStorage.getItem('csinvest:token');
+  return token ? { Authorization: `Bearer ${token}` } : undefined;
+};
+
+export async function waitForJob(apiBase, jobId, options = {}) {
+  const intervalMs = Number.isFinite(options.intervalMs) ? options.intervalMs : 1500;
+  const timeoutMs = Number.isFinite(options.timeoutMs) ? options.timeoutMs : 15 * 60 * 1000;
+  const onProgress = typeof options.onProgress === 'function' ? options.onProgress : null;
+  const deadline = Date.now() + timeoutMs;
+
+  while (Date.now() < deadline) {
+    const res = await fetch(`${apiBase}/jobs/${jobId}?include_results=false`, { headers: authHeaders() });
+    if (!res.ok) {
+      throw new Error(`Job status failed: ${res.status}`);
+    }
+    const job = await res.json();
+    if (onProgress) onProgress(job);
+    if (job.status === 'done') return job;
+    if (job.status === 'failed') {
+      throw new Error(job.error || 'Refresh job failed');
+    }
+    await sleep(intervalMs);
+  }
+  throw new Error('Refresh job timed out');
+}
+
+export async function startRefreshJob(url, options = {}) {
+  const res = await fetch(url, { method: 'POST', headers: authHeaders() });
+  if (!res.ok) {
+    throw new Error(`Refresh failed: ${res.status}`);
+  }
+  const data = await res.json();
+  if (!data || !data.job_id) return data;
+  return waitForJob(options.apiBase || '/api', data.job_id, options);
+}